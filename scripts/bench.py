@@ -3,16 +3,79 @@ import os
 import argparse
 from dotenv import load_dotenv
 
-from src.client import make_client
+from src import defaults
 from src.store import connect, init_db
-from src.openai_safe import ModelCaps
-from src.generate import generate_questions
-from src.run import run_benchmark
-from src.report import report as make_report
-from src.export_regression import export_regression
-from src.evolve import category_means, format_weights
-from src.analyze import analyze as make_analyze
-from src.plots import visualize_all
+
+# Heavier modules (openai, numpy, matplotlib, pyarrow/duckdb) are imported inside
+# the subcommands that use them, so `report`/`analyze`/`init` start fast.
+# scripts/importtime.py guards this.
+
+NETWORK_COMMANDS = {"generate", "run", "all", "iterate", "loadtest", "replay"}
+
+
+def _add_allocator_arg(p) -> None:
+    p.add_argument("--allocator", choices=defaults.ALLOCATORS, default="weakness",
+                   help="How weak spots get generation/evaluation effort: weakness (1 - category mean) or a "
+                        "thompson/ucb bandit over recency-weighted per-category and per-difficulty posteriors.")
+
+
+def _add_subtree_arg(p) -> None:
+    p.add_argument("--subtree", default=None,
+                   help="Category path (e.g. math or math/algebra) to focus on: generation mix and coverage "
+                        "quotas spread over its subcategories.")
+
+
+def _add_loop_args(p) -> None:
+    """Adaptive-loop options shared by run, all and iterate."""
+    p.add_argument("--alpha", type=float, default=defaults.EMA_ALPHA, help="EMA smoothing factor.")
+    p.add_argument("--difficulty-step", type=float, default=defaults.DIFFICULTY_STEP,
+                   help="EMA change needed to move the target difficulty (tune with `simulate`).")
+    p.add_argument("--rejudge-policy", choices=defaults.REJUDGE_POLICIES, default="confidence",
+                   help="confidence: rejudge below judge confidence 0.6. cost: learn where rejudging pays off "
+                        "from past disagreement (per category, difficulty and judge model).")
+    p.add_argument("--rejudge-budget", type=float, default=defaults.REJUDGE_BUDGET,
+                   help="Target share of LLM-judged items rejudged under --rejudge-policy cost.")
+
+
+def _bootstrap_resamples(args) -> int:
+    from src.bootstrap import DEFAULT_RESAMPLES
+    return DEFAULT_RESAMPLES if args.bootstrap is None else args.bootstrap
+
+
+def _start_metrics(args) -> None:
+    if args.metrics_file is None and args.metrics_port is None:
+        return
+    import atexit
+    from src import metrics
+    if args.metrics_file:
+        atexit.register(metrics.TextfileWriter(args.metrics_file, interval=args.metrics_interval).close)
+    if args.metrics_port:
+        server = metrics.start_http_server(args.metrics_port)
+        print(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+        atexit.register(server.shutdown)
+
+
+def _trace_begin(args) -> None:
+    if args.trace_dir:
+        from src import tracing
+        tracing.start()
+
+
+def _trace_end(args, name: str) -> None:
+    if not args.trace_dir:
+        return
+    from src import tracing
+    tracer = tracing.stop()
+    path = tracer.write(os.path.join(args.trace_dir, f"trace-{name}.json"))
+    print(tracer.summary_text())
+    print(f"Trace written to {path}")
+
+
+def _engine(args, con):
+    if args.engine == "duckdb":
+        from src.columnar import DuckConnection
+        return DuckConnection(args.columnar_dir)
+    return con
 
 
 
@@ -22,11 +85,22 @@ def main():
     parser = argparse.ArgumentParser(description="Self-evolving benchmark generator (MVP+)")
     parser.add_argument("--db", default="data/bench.sqlite", help="Path to SQLite DB")
     parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"))
+    for role in ("gen", "solve", "judge"):
+        parser.add_argument(f"--{role}-base-url", default=None,
+                            help=f"Comma-separated replica URLs for {role} calls (default OPENAI_{role.upper()}_BASE_URL, "
+                                 "then --base-url). Several URLs are balanced by least outstanding requests.")
     parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-5-nano"),
                         help="Default model for generate/solve/judge unless overridden.")
     parser.add_argument("--gen-model", default=None)
     parser.add_argument("--solve-model", default=None)
     parser.add_argument("--judge-model", default=None)
+    parser.add_argument("--metrics-file", default=None,
+                        help="Write Prometheus metrics to this textfile while generate/run/all/iterate execute.")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics during network commands.")
+    parser.add_argument("--metrics-interval", type=float, default=15.0, help="Textfile refresh period (seconds).")
+    parser.add_argument("--trace-dir", default=None,
+                        help="Record per-stage spans and write a Chrome trace JSON per run into this directory.")
 
     sub = parser.add_subparsers(dest="cmd", required=True)
 
@@ -34,92 +108,279 @@ def main():
 
     p_gen = sub.add_parser("generate", help="Generate novel questions (self-evolving by weakness profile)")
     p_gen.add_argument("--n", type=int, default=10)
-    p_gen.add_argument("--domain", default="general")
+    p_gen.add_argument("--domain", default=None,
+                       help="Domain to file questions under (default general) and whose difficulty to target "
+                            "(default: state scope *, as run).")
+    p_gen.add_argument("--with-checks", action="store_true",
+                       help="Ask the generator for machine-checkable references (local grading fast-path).")
+    _add_allocator_arg(p_gen)
+    _add_subtree_arg(p_gen)
 
     p_run = sub.add_parser("run", help="Run benchmark (answer + judge + EMA)")
     p_run.add_argument("--n", type=int, default=10)
-    p_run.add_argument("--alpha", type=float, default=0.2)
-
-    sub.add_parser("report", help="Print summary report")
+    _add_loop_args(p_run)
+    p_run.add_argument("--domain", default=None,
+                       help="Only sample questions from this domain and track EMA/difficulty for it "
+                            "(default: every domain, state scope *).")
+    p_run.add_argument("--no-local-grading", action="store_true", help="Always use the LLM judge.")
+    _add_allocator_arg(p_run)
+    _add_subtree_arg(p_run)
+    p_run.add_argument("--structured-judge", action="store_true",
+                       help="Request JSON-schema/JSON-mode judge output when the endpoint supports it.")
+
+    p_rep = sub.add_parser("report", help="Print summary report")
+    p_rep.add_argument("--bootstrap", type=int, default=None,
+                       help="Bootstrap resamples for confidence intervals (default 1000; 0 disables).")
 
     p_all = sub.add_parser("all", help="Generate -> Run -> Report in one command")
     p_all.add_argument("--n-gen", type=int, default=10)
     p_all.add_argument("--n-run", type=int, default=10)
-    p_all.add_argument("--domain", default="general")
-    p_all.add_argument("--alpha", type=float, default=0.2)
+    p_all.add_argument("--domain", default=None,
+                       help="Domain to generate into (default general). When given, the run only samples it and "
+                            "tracks EMA/difficulty for it; otherwise it samples every domain (state scope *).")
+    _add_loop_args(p_all)
+    p_all.add_argument("--with-checks", action="store_true")
+    p_all.add_argument("--no-local-grading", action="store_true")
+    _add_allocator_arg(p_all)
+    _add_subtree_arg(p_all)
+    p_all.add_argument("--structured-judge", action="store_true",
+                       help="Request JSON-schema/JSON-mode judge output when the endpoint supports it.")
 
     p_exp = sub.add_parser("export-regression", help="Export worst-K questions to JSONL")
     p_exp.add_argument("--k", type=int, default=20)
     p_exp.add_argument("--out", default="data/regression.jsonl")
 
-    sub.add_parser("analyze", help="Analyze run history, failures, and uncertainty proxy")
+    p_shd = sub.add_parser("export", help="Stream results or questions to size-capped JSONL/CSV shards with a manifest")
+    p_shd.add_argument("--kind", choices=["results", "questions"], default="results")
+    p_shd.add_argument("--out-dir", default="data/export")
+    p_shd.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    p_shd.add_argument("--no-gzip", action="store_true", help="Write uncompressed shards.")
+    p_shd.add_argument("--shard-mb", type=float, default=256, help="Start a new shard once one reaches this size.")
+    p_shd.add_argument("--since", default=None, help="Only runs with run_at >= this (ISO date or timestamp).")
+    p_shd.add_argument("--until", default=None, help="Only runs with run_at < this.")
+    p_shd.add_argument("--model", default=None, help="Only this solve model.")
+    p_shd.add_argument("--category", default=None,
+                       help="Category path; matches its subcategories too (e.g. math or math/algebra).")
+    p_shd.add_argument("--domain", default=None)
+    p_shd.add_argument("--answers", action="store_true", help="Include answer text (results only; slower).")
+    p_shd.add_argument("--verify", action="store_true", help="Only re-check the shard checksums in --out-dir.")
+
+    p_frz = sub.add_parser("freeze-suite", help="Freeze a named, versioned regression suite in the DB")
+    p_frz.add_argument("--name", required=True, help="Suite name; freezing an existing name adds a new version.")
+    p_frz.add_argument("--k", type=int, default=200, help="Worst-K questions by historical minimum score.")
+    p_frz.add_argument("--domain", default=None)
+    p_frz.add_argument("--category", default=None,
+                       help="Category path; matches its subcategories too (e.g. math or math/algebra).")
+    p_frz.add_argument("--from-jsonl", default=None,
+                       help="Freeze the question_ids of an `export-regression` file instead of querying worst-K.")
+
+    sub.add_parser("suites", help="List regression suites and their last replay")
+
+    p_rpl = sub.add_parser("replay", help="Evaluate a frozen suite in parallel and diff against earlier replays "
+                                          "(no EMA/difficulty updates)")
+    p_rpl.add_argument("--suite", required=True, help="NAME (latest version) or NAME@vN.")
+    p_rpl.add_argument("--solve-model", dest="replay_model", default=None,
+                       help="Model under test (default: the global --solve-model / --model).")
+    p_rpl.add_argument("--workers", type=int, default=32, help="Items in flight.")
+    p_rpl.add_argument("--against", default=None, help="Replay id to diff against (default: the previous replay).")
+    p_rpl.add_argument("--max-new-failures", type=int, default=None,
+                       help="Exit non-zero if more items regress (always passed before, fail now).")
+    p_rpl.add_argument("--max-mean-drop", type=float, default=None,
+                       help="Exit non-zero if the mean score drops by more than this.")
+    p_rpl.add_argument("--out", default="", help="Optional JSONL of per-item diffs.")
+    p_rpl.add_argument("--no-local-grading", action="store_true", help="Always use the LLM judge.")
+    p_rpl.add_argument("--structured-judge", action="store_true",
+                       help="Request JSON-schema/JSON-mode judge output when the endpoint supports it.")
+
+    p_an = sub.add_parser("analyze", help="Analyze run history, failures, and uncertainty proxy")
+    p_an.add_argument("--engine", choices=["sqlite", "duckdb"], default="sqlite",
+                      help="duckdb reads the Parquet export written by `export-columnar`.")
+    p_an.add_argument("--columnar-dir", default="data/columnar")
+    p_an.add_argument("--bootstrap", type=int, default=None,
+                      help="Bootstrap resamples for confidence intervals (default 1000, capped on large "
+                           "histories; 0 disables).")
+
+    p_an.add_argument("--latency-window", type=int, default=10,
+                      help="Trailing runs (same endpoint and model) that form the latency baseline.")
+    p_an.add_argument("--latency-threshold", type=float, default=1.5,
+                      help="Flag runs whose p90/p99 latency exceeds this multiple of the baseline median.")
+
+    sub.add_parser("compact", help="Move answers/judge JSON to compressed blobs and VACUUM (run with no other writers)")
+
+    p_col = sub.add_parser("export-columnar", help="Incrementally export results to partitioned Parquet")
+    p_col.add_argument("--out-dir", default="data/columnar")
 
     p_iter = sub.add_parser("iterate", help="Run multiple generate+run iterations and summarize.")
     p_iter.add_argument("--iterations", type=int, default=5, help="Number of evolve iterations.")
     p_iter.add_argument("--n-gen", type=int, default=5, help="Questions to generate per iteration.")
     p_iter.add_argument("--n-run", type=int, default=5, help="Questions to evaluate per iteration.")
-    p_iter.add_argument("--alpha", type=float, default=0.2, help="EMA smoothing factor.")
-    p_iter.add_argument("--domain", type=str, default="general", help="Domain hint for generation.")
+    _add_loop_args(p_iter)
+    p_iter.add_argument("--domain", type=str, default=None,
+                        help="Domain to generate into (default general). When given, runs only sample it and "
+                             "track EMA/difficulty for it; otherwise they sample every domain (state scope *).")
     p_iter.add_argument("--out", type=str, default="", help="Optional CSV path to write run history (e.g., runs.csv).")
+    p_iter.add_argument("--with-checks", action="store_true", help="Generate machine-checkable references.")
+    p_iter.add_argument("--no-local-grading", action="store_true", help="Always use the LLM judge.")
+    _add_allocator_arg(p_iter)
+    _add_subtree_arg(p_iter)
+    p_iter.add_argument("--structured-judge", action="store_true",
+                        help="Request JSON-schema/JSON-mode judge output when the endpoint supports it.")
+
+    p_load = sub.add_parser("loadtest", help="Ramp concurrency against the solve endpoint and plot saturation")
+    p_load.add_argument("--concurrency", default="1,2,4,8,16,32", help="Comma-separated concurrency steps.")
+    p_load.add_argument("--requests-per-step", type=int, default=None,
+                        help="Requests per step (default max(20, 4 x concurrency)).")
+    p_load.add_argument("--domain", default=None, help="Only replay questions from this domain.")
+    p_load.add_argument("--judge-sample", type=float, default=0.0,
+                        help="Fraction of successful answers to score per step (local check or LLM judge).")
+    p_load.add_argument("--no-stream", action="store_true", help="Disable streaming (no TTFT measurement).")
+    p_load.add_argument("--max-error-rate", type=float, default=0.5,
+                        help="Stop the ramp after a step whose error rate exceeds this.")
+    p_load.add_argument("--out", default="data/loadtest.json", help="Step summaries as JSON.")
+    p_load.add_argument("--plot-dir", default="docs", help="Where to write saturation.<format> ('' to skip).")
+    p_load.add_argument("--format", choices=["png", "svg", "pdf", "jpg"], default="png")
+
+    p_sim = sub.add_parser("simulate", help="Offline simulation of the adaptive loop for tuning alpha/step/floor")
+    p_sim.add_argument("--alpha", default="0.1,0.2,0.3", help="Comma-separated EMA alphas to compare.")
+    p_sim.add_argument("--step", default=str(defaults.DIFFICULTY_STEP), help="Comma-separated adapt_difficulty steps.")
+    p_sim.add_argument("--floor", default="0.05", help="Comma-separated category_weights floors.")
+    p_sim.add_argument("--trajectories", type=int, default=2000, help="Seeded trajectories per configuration.")
+    p_sim.add_argument("--iterations", type=int, default=60)
+    p_sim.add_argument("--n-gen", type=int, default=10)
+    p_sim.add_argument("--n-run", type=int, default=10)
+    p_sim.add_argument("--regression", type=float, default=0.5,
+                       help="Ability drop (logits) injected in half the trajectories.")
+    p_sim.add_argument("--detect-drop", type=float, default=0.05,
+                       help="Alarm when the EMA falls this far below its pre-regression mean.")
+    p_sim.add_argument("--judge-sd", type=float, default=0.15, help="Judge noise on each score.")
+    p_sim.add_argument("--seed", type=int, default=0)
 
     p_viz = sub.add_parser("visualize", help="Generate figures from the SQLite benchmark DB")
-    p_viz.add_argument("--out-dir", default="docs", help="Output directory for PNG figures")
+    p_viz.add_argument("--out-dir", default="docs", help="Output directory for figures")
+    p_viz.add_argument("--engine", choices=["sqlite", "duckdb"], default="sqlite")
+    p_viz.add_argument("--columnar-dir", default="data/columnar")
+    p_viz.add_argument("--format", choices=["png", "svg", "pdf", "jpg"], default="png")
+    p_viz.add_argument("--dpi", type=int, default=200, help="Lower (e.g. 72) for quick dashboards.")
+    p_viz.add_argument("--force", action="store_true", help="Re-render even if the data has not changed.")
+    p_viz.add_argument("--subtree", default=None,
+                       help="Draw the category figures over the subcategories of this category path.")
+
+    p_tax = sub.add_parser("taxonomy", help="Show the category tree with question counts and mean scores")
+    p_tax.add_argument("--root", default=None, help="Only show this category path and its descendants.")
+    p_tax.add_argument("--rebuild", action="store_true", help="Recompute the tree from the question bank first.")
 
     args = parser.parse_args()
 
     con = connect(args.db)
     init_db(con)
 
-    client = make_client(base_url=args.base_url)
-    caps = ModelCaps()
+    if args.cmd in NETWORK_COMMANDS:
+        from src.client import make_clients, role_urls
+        from src.openai_safe import ModelCaps
+        from src.evolve import category_means, format_weights
+        from src.generate import generate_questions
+        from src.run import run_benchmark
+        from src.report import report as make_report
+
+        pools = {}
+        if args.cmd == "loadtest":
+            from src.client import POOL_SIZES
+            pools["solve"] = max([POOL_SIZES["solve"]] + [int(c) for c in args.concurrency.split(",") if c.strip()])
+        if args.cmd == "replay":
+            from src.client import POOL_SIZES
+            pools = {role: max(POOL_SIZES[role], args.workers) for role in ("solve", "judge")}
+        clients = make_clients(base_url=args.base_url, pool_sizes=pools,
+                               urls={"gen": args.gen_base_url, "solve": args.solve_base_url,
+                                     "judge": args.judge_base_url})
+        # runs.base_url identifies the solve endpoint (latency baselines group by it)
+        solve_url = ",".join(role_urls("solve", args.solve_base_url, args.base_url))
+        caps = ModelCaps()
+        _start_metrics(args)
 
     gen_model = args.gen_model or args.model
     solve_model = args.solve_model or args.model
     judge_model = args.judge_model or args.model
+    subtree = None
+    if getattr(args, "subtree", None):
+        from src.taxonomy import normalize
+        subtree = normalize(args.subtree)
 
     if args.cmd == "init":
         print(f"Initialized DB at {args.db}")
         return
 
     if args.cmd == "generate":
+        from src.utils import now_iso
         means = category_means(con)
         print("Evolve weights:", format_weights(means))
-        items = generate_questions(client, caps, con, model=gen_model, n=args.n, domain=args.domain)
+        _trace_begin(args)
+        items = generate_questions(clients["gen"], caps, con, model=gen_model, n=args.n, domain=args.domain,
+                                   with_checks=args.with_checks, solve_model=solve_model, allocator=args.allocator,
+                                   subtree=subtree)
         print(f"Inserted {len(items)} novel questions.")
         if items:
             print("Example:", items[0]["prompt"])
+        _trace_end(args, "generate-" + now_iso().replace(":", "").replace("+0000", "Z"))
         return
 
     if args.cmd == "run":
+        _trace_begin(args)
         out = run_benchmark(
-            client, caps, con,
-            base_url=args.base_url,
+            clients["solve"], caps, con,
+            judge_client=clients["judge"],
+            base_url=solve_url,
             solve_model=solve_model,
             judge_model=judge_model,
             n=args.n,
-            alpha=args.alpha
+            alpha=args.alpha,
+            difficulty_step=args.difficulty_step,
+            rejudge_policy=args.rejudge_policy,
+            rejudge_budget=args.rejudge_budget,
+            allocator=args.allocator,
+            subtree=subtree,
+            domain=args.domain,
+            local_grading=not args.no_local_grading,
+            structured_judge=args.structured_judge
         )
-        print(f"Run {out['run_id']}: mean={out['batch_mean']:.3f} | EMA={out['ema']:.3f} | n={out['n']}")
+        print(f"Run {out['run_id']}: mean={out['batch_mean']:.3f} | EMA={out['ema']:.3f} | n={out['n']} | "
+              f"local={out['n_local']}/{out['n']}")
+        _trace_end(args, out["run_id"])
         return
 
     if args.cmd == "report":
-        print(make_report(con))
+        from src.analytics import load_snapshot
+        from src.report import report as make_report
+        print(make_report(con, snapshot=load_snapshot(con, n_boot=_bootstrap_resamples(args))))
         return
 
     if args.cmd == "all":
         means = category_means(con)
         print("Evolve weights:", format_weights(means))
-        items = generate_questions(client, caps, con, model=gen_model, n=args.n_gen, domain=args.domain)
+        _trace_begin(args)
+        items = generate_questions(clients["gen"], caps, con, model=gen_model, n=args.n_gen, domain=args.domain,
+                                   with_checks=args.with_checks, solve_model=solve_model, allocator=args.allocator,
+                                   subtree=subtree)
         print(f"Inserted {len(items)} novel questions.")
         out = run_benchmark(
-            client, caps, con,
-            base_url=args.base_url,
+            clients["solve"], caps, con,
+            judge_client=clients["judge"],
+            base_url=solve_url,
             solve_model=solve_model,
             judge_model=judge_model,
             n=args.n_run,
-            alpha=args.alpha
+            alpha=args.alpha,
+            difficulty_step=args.difficulty_step,
+            rejudge_policy=args.rejudge_policy,
+            rejudge_budget=args.rejudge_budget,
+            allocator=args.allocator,
+            subtree=subtree,
+            domain=args.domain,
+            local_grading=not args.no_local_grading,
+            structured_judge=args.structured_judge
         )
-        print(f"Run {out['run_id']}: mean={out['batch_mean']:.3f} | EMA={out['ema']:.3f} | n={out['n']}")
+        print(f"Run {out['run_id']}: mean={out['batch_mean']:.3f} | EMA={out['ema']:.3f} | n={out['n']} | "
+              f"local={out['n_local']}/{out['n']}")
+        _trace_end(args, out["run_id"])
         print("")
         print(make_report(con))
         return
@@ -129,28 +390,48 @@ def main():
         if iters <= 0:
             raise SystemExit("--iterations must be >= 1")
 
+        from src.analytics import load_snapshot
+        from src.analyze import analyze as make_analyze
+        from src.store import StoreWriter
+
         ema_series = []
         run_ids = []
+        writer = StoreWriter(args.db)
 
         for i in range(1, iters + 1):
             means = category_means(con)
             print(f"[{i}/{iters}] Evolve weights:", format_weights(means))
+            _trace_begin(args)
 
             items = generate_questions(
-                client, caps, con,
+                clients["gen"], caps, con,
                 model=gen_model,
                 n=args.n_gen,
-                domain=args.domain
+                domain=args.domain,
+                with_checks=args.with_checks,
+                solve_model=solve_model,
+                allocator=args.allocator,
+                subtree=subtree
             )
             print(f"[{i}/{iters}] Inserted {len(items)} novel questions.")
 
             out = run_benchmark(
-                client, caps, con,
-                base_url=args.base_url,
+                clients["solve"], caps, con,
+                judge_client=clients["judge"],
+                base_url=solve_url,
                 solve_model=solve_model,
                 judge_model=judge_model,
                 n=args.n_run,
-                alpha=args.alpha
+                alpha=args.alpha,
+                difficulty_step=args.difficulty_step,
+                rejudge_policy=args.rejudge_policy,
+                rejudge_budget=args.rejudge_budget,
+                allocator=args.allocator,
+                subtree=subtree,
+                domain=args.domain,
+                writer=writer,
+                local_grading=not args.no_local_grading,
+                structured_judge=args.structured_judge
             )
 
             ema_series.append(float(out["ema"]))
@@ -158,16 +439,21 @@ def main():
 
             print(
                 f"[{i}/{iters}] Run {out['run_id']}: "
-                f"mean={out['batch_mean']:.3f} | EMA={out['ema']:.3f} | n={out['n']}"
+                f"mean={out['batch_mean']:.3f} | EMA={out['ema']:.3f} | n={out['n']} | "
+                f"local={out['n_local']}/{out['n']}"
             )
+            _trace_end(args, out["run_id"])
             print("")
 
-        # Final summaries
+        writer.close()
+
+        # Final summaries (rendered from one shared analytics snapshot)
+        snap = load_snapshot(con)
         print("Final report:")
-        print(make_report(con))
+        print(make_report(con, snapshot=snap))
         print("")
         print("Final analysis:")
-        print(make_analyze(con))
+        print(make_analyze(con, snapshot=snap))
         print("")
         print("EMA series:", ema_series)
 
@@ -198,16 +484,170 @@ def main():
         return
 
     if args.cmd == "export-regression":
+        from src.export_regression import export_regression
         n = export_regression(con, out_path=args.out, k=args.k)
         print(f"Exported {n} questions to {args.out}")
         return
         
+    if args.cmd == "export":
+        from src.export import export_sharded, verify_manifest
+        if args.verify:
+            bad = verify_manifest(args.out_dir, kind=args.kind)
+            if bad:
+                raise SystemExit(f"Checksum mismatch or missing shard: {', '.join(bad)}")
+            print(f"All shards in {args.out_dir} match the manifest.")
+            return
+        m = export_sharded(
+            con, args.out_dir, kind=args.kind, fmt=args.format, compress=not args.no_gzip,
+            shard_bytes=int(args.shard_mb * (1 << 20)), since=args.since, until=args.until, model=args.model,
+            category=args.category, domain=args.domain, answers=args.answers,
+            on_shard=lambda sh: print(f"  {sh['file']}: {sh['rows']} rows, {sh['bytes']:,} bytes"),
+        )
+        print(f"Exported {m['rows']} {args.kind} in {len(m['shards'])} shards ({m['bytes']:,} bytes) to "
+              f"{args.out_dir} (manifest-{args.kind}.json)")
+        return
+
+    if args.cmd == "freeze-suite":
+        from src.suites import freeze_suite
+        out = freeze_suite(con, args.name, k=args.k, domain=args.domain, category=args.category,
+                           from_jsonl=args.from_jsonl)
+        print(f"Froze suite {out['name']}@v{out['version']} ({out['n_items']} questions)")
+        return
+
+    if args.cmd == "suites":
+        from src.suites import list_suites
+        rows = list_suites(con)
+        if not rows:
+            print("No suites. Create one with `freeze-suite --name NAME`.")
+        for r in rows:
+            last = "-" if r["last_mean"] is None else f"{r['last_mean']:.3f}"
+            print(f"{r['name']}@v{r['version']}: {r['n_items']} items | {r['n_replays']} replays | "
+                  f"last mean={last} | {r['source']} | {r['created_at']}")
+        return
+
+    if args.cmd == "replay":
+        from src.suites import diff_replays, format_replay, replay_suite, write_diff
+        model = args.replay_model or solve_model
+        print(f"Replaying {args.suite} with {model} ({args.workers} workers)")
+        _trace_begin(args)
+        out = replay_suite(
+            clients["solve"], caps, con,
+            judge_client=clients["judge"],
+            suite=args.suite,
+            base_url=solve_url,
+            solve_model=model,
+            judge_model=judge_model,
+            workers=args.workers,
+            local_grading=not args.no_local_grading,
+            structured_judge=args.structured_judge,
+        )
+        diff = diff_replays(con, out["replay_id"], against=args.against)
+        print(format_replay(out, diff))
+        if args.out:
+            print(f"Wrote {write_diff(diff, args.out)}")
+        _trace_end(args, "replay-" + out["replay_id"])
+        if diff["against"] is not None:
+            regressions = diff["counts"].get("regression", 0)
+            if args.max_new_failures is not None and regressions > args.max_new_failures:
+                raise SystemExit(f"Gate failed: {regressions} regressions > --max-new-failures {args.max_new_failures}")
+            if (args.max_mean_drop is not None and diff["mean_delta"] is not None
+                    and -diff["mean_delta"] > args.max_mean_drop):
+                raise SystemExit(f"Gate failed: mean dropped {-diff['mean_delta']:.3f} > --max-mean-drop "
+                                 f"{args.max_mean_drop}")
+        return
+
+    if args.cmd == "compact":
+        from src.store import compact
+        out = compact(con, args.db)
+        print(f"Compacted {args.db}: {out['bytes_before']:,} -> {out['bytes_after']:,} bytes "
+              f"(saved {out['bytes_saved']:,}) | migrated {out['results_migrated']} results | "
+              f"{out['blobs']} blobs | removed {out['orphans_removed']} orphans")
+        return
+
+    if args.cmd == "loadtest":
+        from src.loadtest import format_step, run_loadtest, write_results
+        from src.utils import now_iso
+        steps = [int(c) for c in args.concurrency.split(",") if c.strip()]
+        print(f"Load test: {solve_model} at {solve_url}, concurrency {steps}")
+        _trace_begin(args)
+        results = run_loadtest(
+            clients["solve"], caps, con,
+            judge_client=clients["judge"],
+            solve_model=solve_model,
+            judge_model=judge_model,
+            steps=steps,
+            requests_per_step=args.requests_per_step,
+            domain=args.domain,
+            stream=not args.no_stream,
+            judge_sample=args.judge_sample,
+            max_error_rate=args.max_error_rate,
+            on_step=lambda s: print(format_step(s)),
+        )
+        stamp = now_iso()
+        path = write_results(results, args.out, {"run_at": stamp, "base_url": solve_url,
+                                                 "solve_model": solve_model, "judge_model": judge_model})
+        if hasattr(clients["solve"], "stats"):
+            for r in clients["solve"].stats():
+                print(f"  replica {r['url']}: requests={r['requests']} errors={r['errors']}"
+                      + (" (ejected)" if r["ejected"] else ""))
+        print(f"Wrote {path}")
+        if args.plot_dir:
+            from src.plots import plot_saturation
+            print(f"Wrote {plot_saturation(results, out_dir=args.plot_dir, fmt=args.format)}")
+        _trace_end(args, "loadtest-" + stamp.replace(":", "").replace("+0000", "Z"))
+        return
+
+    if args.cmd == "simulate":
+        from src.simulate import format_results, sweep
+
+        def floats(v):
+            return [float(x) for x in v.split(",") if x.strip()]
+
+        results = sweep(floats(args.alpha), floats(args.step), floats(args.floor),
+                        trajectories=args.trajectories, iterations=args.iterations, n_gen=args.n_gen,
+                        n_run=args.n_run, regression=args.regression, detect_drop=args.detect_drop,
+                        judge_sd=args.judge_sd, seed=args.seed)
+        print(format_results(results, args.n_run))
+        return
+
+    if args.cmd == "export-columnar":
+        from src.columnar import export_columnar
+        counts = export_columnar(con, out_dir=args.out_dir)
+        print(f"Exported {counts['results']} results, {counts['questions']} questions, "
+              f"{counts['runs']} runs to {args.out_dir}")
+        return
+
     if args.cmd == "analyze":
-        print(make_analyze(con))
+        from src.analytics import load_snapshot
+        from src.analyze import analyze as make_analyze
+        src = _engine(args, con)
+        print(make_analyze(src, snapshot=load_snapshot(src, n_boot=_bootstrap_resamples(args)),
+                           latency_window=args.latency_window, latency_threshold=args.latency_threshold))
         return
     
+    if args.cmd == "taxonomy":
+        from src import taxonomy
+        if args.rebuild:
+            n = taxonomy.rebuild(con)
+            con.commit()
+            print(f"Rebuilt {n} category nodes.")
+        nodes = taxonomy.tree(con, taxonomy.normalize(args.root) if args.root else None)
+        if not nodes:
+            print("No categories yet. Run `generate` first.")
+            return
+        for t in nodes:
+            mean = f"{t['mean']:.3f}" if t["mean"] is not None else "N/A"
+            print(f"{'  ' * t['depth']}- {t['path']}: questions={t['n_questions']} results={t['n_results']} mean={mean}")
+        return
+
     if args.cmd == "visualize":
-        outs = visualize_all(con, out_dir=args.out_dir)
+        from src.plots import visualize_all
+        src = _engine(args, con)
+        outs = visualize_all(src, out_dir=args.out_dir, fmt=args.format, dpi=args.dpi, force=args.force,
+                             node=subtree)
+        if not outs:
+            print(f"Figures in {args.out_dir} are up to date.")
+            return
         print("Wrote figures:")
         for k, v in outs.items():
             print(f"  - {k}: {v}")
@@ -0,0 +1,82 @@
+# scripts/importtime.py
+"""
+Cold-start benchmark for scripts/bench.py.
+
+Each case runs in a fresh interpreter, so nothing is cached in sys.modules.
+A case fails if it imports a module it must not import, or if its median
+wall time exceeds the budget. Exits non-zero on any failure.
+
+  python -m scripts.importtime
+  python -m scripts.importtime --repeat 7 --budget-ms 400
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Modules that only network / plotting / columnar subcommands may pull in.
+HEAVY = ["openai", "matplotlib", "pyarrow", "duckdb", "httpx"]
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+argv, watch = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+import scripts.bench as bench
+if argv:
+    sys.argv = ["bench"] + argv
+    bench.main()
+ms = (time.perf_counter() - t0) * 1000.0
+heavy = [m for m in watch if m in sys.modules]
+sys.stderr.write("IMPORTTIME " + json.dumps({"ms": ms, "heavy": heavy}) + "\n")
+"""
+
+
+def run_case(argv, repeat: int):
+    times, heavy = [], []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", CHILD, json.dumps(argv), json.dumps(HEAVY)],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        line = next((l for l in proc.stderr.splitlines() if l.startswith("IMPORTTIME ")), None)
+        if proc.returncode != 0 or line is None:
+            raise RuntimeError(f"bench {' '.join(argv) or '(import)'} failed:\n{proc.stderr[-2000:]}")
+        out = json.loads(line[len("IMPORTTIME "):])
+        times.append(out["ms"])
+        heavy = out["heavy"]
+    return statistics.median(times), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start latency guard for scripts/bench.py")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per case (median is reported).")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="Max median wall time per case.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = str(Path(tmp) / "bench.sqlite")
+        cases = [
+            ("import", []),
+            ("init", ["--db", db, "init"]),
+            ("report", ["--db", db, "report"]),
+            ("analyze", ["--db", db, "analyze"]),
+        ]
+        failed = False
+        print(f"{'case':<10} {'median ms':>10}  heavy imports")
+        for name, argv in cases:
+            ms, heavy = run_case(argv, args.repeat)
+            bad = ms > args.budget_ms or bool(heavy)
+            failed |= bad
+            print(f"{name:<10} {ms:>10.1f}  {', '.join(heavy) or '-'}{'  <- FAIL' if bad else ''}")
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# scripts/mock_server.py
+"""
+Local stand-in for an OpenAI-compatible endpoint, for harness benchmarks and
+offline development. Implements POST /v1/chat/completions (including
+stream=true) and GET /v1/models.
+
+Replies are canned by role, recognised from the system prompt: generator
+calls get a JSON list of novel questions (labelled "<category>/<subtopic>"
+under the categories the prompt allows), judge and repair calls get a
+judgment, and solve calls get a short answer. Latency comes from a
+configurable distribution. Server errors and 429s can be injected at given
+rates. --max-concurrency caps requests served at once, as a real replica's
+batch size would; the rest queue.
+
+--prefix-cache emulates server-side prompt caching. Prompts are hashed in
+16-token blocks, and a request reuses the longest previously seen prefix
+of at least --cache-min-tokens (default 1024). The reused length is reported as
+usage.prompt_tokens_details.cached_tokens. --prefill-ms-per-1k adds latency
+per uncached prompt token, so prompt layout changes show up as latency.
+
+  python -m scripts.mock_server --port 8765 --latency lognormal:800,0.6 --rate-limit-rate 0.02
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock python -m scripts.bench iterate
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from src.evolve import CATEGORIES
+from src.generate import GEN_SYSTEM
+from src.judge import FIX_SYSTEM, JUDGE_SYSTEM
+
+SUBTOPICS = ["core", "applied", "edge_cases"]
+CHARS_PER_TOKEN = 4
+CACHE_BLOCK_TOKENS = 16     # caching granularity
+CACHE_MIN_TOKENS = 1024     # shortest cacheable prefix on hosted APIs; self-hosted servers often cache any length
+CACHE_ENTRIES = 200_000
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Latency in seconds from a spec (milliseconds):
+      fixed:MS | uniform:LO,HI | lognormal:MEDIAN,SIGMA | exp:MEAN
+    """
+    kind, _, params = spec.partition(":")
+    vals = [float(v) for v in params.split(",") if v] if params else []
+    if kind == "fixed":
+        ms = vals[0] if vals else 0.0
+        return lambda rng: ms / 1000.0
+    if kind == "uniform" and len(vals) == 2:
+        return lambda rng: rng.uniform(vals[0], vals[1]) / 1000.0
+    if kind == "lognormal" and len(vals) == 2:
+        import math
+        mu = math.log(max(vals[0], 1e-9))
+        return lambda rng: rng.lognormvariate(mu, vals[1]) / 1000.0
+    if kind == "exp" and len(vals) == 1:
+        return lambda rng: rng.expovariate(1000.0 / max(vals[0], 1e-9))
+    raise ValueError(f"Bad latency spec {spec!r} (fixed:MS | uniform:LO,HI | lognormal:MEDIAN,SIGMA | exp:MEAN)")
+
+
+def _judgment(rng: random.Random) -> dict:
+    parts = [round(rng.random(), 2) for _ in range(3)]
+    score = round(sum(parts) / 3, 4)
+    return {
+        "score": score,
+        "pass": score >= 0.7,
+        "reasons": [rng.choice(["wrong final value", "missed a constraint", "incomplete reasoning",
+                                "unclear explanation", "correct and complete"])],
+        "rubric_breakdown": dict(zip(("correctness", "completeness", "clarity"), parts)),
+        "confidence": round(rng.uniform(0.3, 1.0), 2),
+    }
+
+
+def _questions(user: str, rng: random.Random) -> list:
+    m = re.search(r"Generate (\d+) novel", user)
+    n = int(m.group(1)) if m else 5
+    with_checks = '"type": "numeric"' in user
+    m = re.search(r"<category> is one of \[([^\]]*)\]", user)
+    allowed = re.findall(r"'([^']+)'", m.group(1)) if m else CATEGORIES
+    items = []
+    for _ in range(n):
+        cat = rng.choice(allowed)
+        tag = uuid.uuid4().hex[:12]
+        it = {"category": f"{cat}/{rng.choice(SUBTOPICS)}", "difficulty": rng.randint(1, 5),
+              "prompt": f"[{tag}] Mock {cat} question: explain step by step how to solve case {tag}."}
+        if with_checks and cat.split("/")[0] == "math":
+            it["check"] = {"type": "numeric", "expected": rng.randint(0, 9), "tolerance": 1e-6}
+        items.append(it)
+    return items
+
+
+def reply_for(messages: list, rng: random.Random) -> str:
+    system = messages[0].get("content", "") if messages else ""
+    user = messages[-1].get("content", "") if messages else ""
+    role = system.split("\n", 1)[0]   # the instructions after the first line may change with prompt layout
+    if role == GEN_SYSTEM:
+        return json.dumps(_questions(user, rng))
+    if role in (JUDGE_SYSTEM.split("\n", 1)[0], FIX_SYSTEM.split("\n", 1)[0]):
+        return json.dumps(_judgment(rng))
+    return f"Working through it step by step, the answer is {rng.randint(0, 9)}."
+
+
+def _prompt_text(messages: list) -> str:
+    return "".join(f"<{m.get('role', '')}>{m.get('content', '')}" for m in messages)
+
+
+class MockState:
+    def __init__(self, latency: str = "fixed:0", error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 seed: Optional[int] = None, max_concurrency: int = 0, prefix_cache: bool = False,
+                 prefill_ms_per_1k: float = 0.0, cache_min_tokens: int = CACHE_MIN_TOKENS):
+        self.latency = parse_latency(latency)
+        self.slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self.prefix_cache = prefix_cache
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.cache_min_chars = cache_min_tokens * CHARS_PER_TOKEN
+        self._cache: "OrderedDict[bytes, None]" = OrderedDict()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def cached_chars(self, text: str) -> int:
+        """Length of the longest cached block-aligned prefix of `text`; caches its prefixes."""
+        if not self.prefix_cache:
+            return 0
+        h = hashlib.blake2b(digest_size=16)
+        keys = []
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        for end in range(block, len(text) + 1, block):
+            h.update(text[end - block:end].encode("utf-8"))
+            keys.append((end, h.digest()))
+        hit = 0
+        with self._lock:
+            for end, key in keys:
+                if key not in self._cache:
+                    break
+                self._cache.move_to_end(key)
+                hit = end
+            for _, key in keys:
+                self._cache[key] = None
+            while len(self._cache) > CACHE_ENTRIES:
+                self._cache.popitem(last=False)
+        return hit if hit >= self.cache_min_chars else 0
+
+    def draw(self):
+        """(delay_s, status, rng) for one request; the shared RNG is only touched under the lock."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency(self._rng)
+            u = self._rng.random()
+            rng = random.Random(self._rng.getrandbits(64))
+        if u < self.rate_limit_rate:
+            return delay, 429, rng
+        if u < self.rate_limit_rate + self.error_rate:
+            return delay, 500, rng
+        return delay, 200, rng
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body are separate writes; avoid 40ms delayed-ACK stalls
+
+        def _json(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+            else:
+                self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+                return
+
+            if state.slots is None:
+                self._complete(body)
+                return
+            with state.slots:
+                self._complete(body)
+
+        def _complete(self, body: dict):
+            delay, status, rng = state.draw()
+            if status == 429:
+                self._json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error",
+                                           "code": "rate_limit_exceeded"}}, {"Retry-After": "0"})
+                return
+            if status == 500:
+                time.sleep(delay)
+                self._json(500, {"error": {"message": "Injected server error (mock)", "type": "server_error"}})
+                return
+
+            model = body.get("model", "mock")
+            messages = body.get("messages") or []
+            content = reply_for(messages, rng)
+            text = _prompt_text(messages)
+            prompt_tokens = len(text) // CHARS_PER_TOKEN
+            cached_tokens = state.cached_chars(text) // CHARS_PER_TOKEN
+            delay += (prompt_tokens - cached_tokens) / 1000.0 * state.prefill_ms_per_1k / 1000.0
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // CHARS_PER_TOKEN,
+                     "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            cid, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+
+            if body.get("stream"):
+                self._stream(cid, created, model, content, delay)
+                return
+            time.sleep(delay)
+            self._json(200, {
+                "id": cid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        def _stream(self, cid: str, created: int, model: str, content: str, delay: float):
+            # First token after ~20% of the latency budget, the rest spread over the remainder.
+            pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            time.sleep(delay * 0.2)
+            step = delay * 0.8 / len(pieces)
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(step)
+                chunk = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            done = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port: int = 0, addr: str = "127.0.0.1", **state_kwargs):
+    """Serve from a daemon thread. Returns the server; its base URL is base_url(server)."""
+    server = ThreadingHTTPServer((addr, port), make_handler(MockState(**state_kwargs)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+def base_url(server) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock OpenAI-compatible endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--addr", default="127.0.0.1")
+    parser.add_argument("--latency", default="fixed:0",
+                        help="fixed:MS | uniform:LO,HI | lognormal:MEDIAN,SIGMA | exp:MEAN (milliseconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429.")
+    parser.add_argument("--max-concurrency", type=int, default=0,
+                        help="Requests served at once; the rest queue (0 = unlimited).")
+    parser.add_argument("--prefix-cache", action="store_true",
+                        help="Emulate server-side prompt caching (reported as cached_tokens).")
+    parser.add_argument("--cache-min-tokens", type=int, default=CACHE_MIN_TOKENS,
+                        help="Shortest prefix the emulated cache reuses.")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0,
+                        help="Extra latency per 1000 uncached prompt tokens.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.addr, args.port), make_handler(MockState(
+        latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed,
+        max_concurrency=args.max_concurrency, prefix_cache=args.prefix_cache,
+        prefill_ms_per_1k=args.prefill_ms_per_1k, cache_min_tokens=args.cache_min_tokens)))
+    server.daemon_threads = True
+    print(f"Mock endpoint on {base_url(server)} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
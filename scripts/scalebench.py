@@ -0,0 +1,282 @@
+# scripts/scalebench.py
+"""
+Harness scalability benchmark against the local mock endpoint.
+
+For each bank size, a seeded DB is built (questions plus a run history). Then
+generate, run, iterate, analyze and visualize each run in a fresh
+interpreter against scripts/mock_server.py. The *-failover cases repeat run
+and iterate with a dead replica (DEAD_REPLICA) beside the mock for the solve
+and judge roles. A run that fails there means router failover is broken.
+Per case it reports:
+  - wall time
+  - harness overhead per question (wall minus time inside LLM calls)
+  - SQL time (every sqlite3 execute/fetch/commit, from all threads)
+  - peak RSS
+
+Set the mock latency to 0 (the default) so the numbers are pure harness
+cost. Module imports happen before the clock starts; scripts/importtime.py
+covers cold start. With --baseline, the script exits non-zero when a case is slower than
+--tolerance × the baseline.
+
+  python -m scripts.scalebench --sizes 1000,10000
+  python -m scripts.scalebench --out data/scalebench.json --baseline data/scalebench-main.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+CHILD = r"""
+import json, sqlite3, sys, threading, time
+from functools import partial
+
+_sql = [0.0]
+_lock = threading.Lock()
+
+def _timed(fn):
+    def wrapper(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return fn(*a, **kw)
+        finally:
+            dt = time.perf_counter() - t0
+            with _lock:
+                _sql[0] += dt
+    return wrapper
+
+class Cursor(sqlite3.Cursor):
+    execute = _timed(sqlite3.Cursor.execute)
+    executemany = _timed(sqlite3.Cursor.executemany)
+    executescript = _timed(sqlite3.Cursor.executescript)
+    fetchone = _timed(sqlite3.Cursor.fetchone)
+    fetchmany = _timed(sqlite3.Cursor.fetchmany)
+    fetchall = _timed(sqlite3.Cursor.fetchall)
+    __next__ = _timed(sqlite3.Cursor.__next__)
+
+class Connection(sqlite3.Connection):
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+    def executescript(self, sql):
+        return self.cursor().executescript(sql)
+    commit = _timed(sqlite3.Connection.commit)
+
+sqlite3.connect = partial(sqlite3.connect, factory=Connection)
+
+import scripts.bench as bench
+import src.client, src.generate, src.run, src.analyze, src.plots  # cold start is scripts.importtime's job
+from src import tracing
+
+tracer = tracing.start()
+sys.argv = ["bench"] + json.loads(sys.argv[1])
+t0 = time.perf_counter()
+bench.main()
+wall = time.perf_counter() - t0
+llm = sum(ev["dur"] for ev in tracer.events if ev["name"].startswith("llm.")) / 1e6
+
+import resource
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+sys.stderr.write("SCALEBENCH " + json.dumps({"wall_s": wall, "llm_s": llm, "sql_s": _sql[0], "peak_rss_mb": rss_mb}) + "\n")
+"""
+
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+RUN_SIZE = 100
+DEAD_REPLICA = "http://127.0.0.1:9/v1"   # discard port: connections are refused
+WORDS = ("river", "ledger", "prime", "orbit", "syntax", "fossil", "tariff", "enzyme", "quartz", "sonnet")
+
+
+def seed_db(path: str, n_questions: int, n_results: int, seed: int = 0) -> None:
+    """A bank of n_questions plus n_results results spread over runs of RUN_SIZE."""
+    from src import bandit, failures, taxonomy
+    from src.evolve import CATEGORIES
+    from src.store import connect, init_db
+
+    rng = random.Random(seed)
+    con = connect(path)
+    init_db(con)
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def questions():
+        for i in range(n_questions):
+            cat = CATEGORIES[i % len(CATEGORIES)]
+            prompt = (f"Seeded {cat} question {i}: relate {rng.choice(WORDS)} to {rng.choice(WORDS)} "
+                      f"under constraint {rng.randint(0, 10**6)}.")
+            check = json.dumps({"type": "numeric", "expected": i % 10}) if cat == "math" and i % 3 == 0 else None
+            yield (f"q{i:09d}", (t0 + timedelta(seconds=i)).isoformat(), "general", cat,
+                   1 + i % 5, prompt, hashlib.sha256(prompt.encode("utf-8")).hexdigest(), check)
+
+    con.executemany("""INSERT INTO questions(question_id, created_at, domain, category, difficulty, prompt,
+                       prompt_hash, check_json) VALUES(?,?,?,?,?,?,?,?)""", questions())
+    con.commit()
+
+    ema = 0.0
+    for r in range((n_results + RUN_SIZE - 1) // RUN_SIZE):
+        run_id = f"seed-run-{r:07d}"
+        run_at = (t0 + timedelta(days=30, minutes=r)).isoformat()
+        k = min(RUN_SIZE, n_results - r * RUN_SIZE)
+        rows = []
+        for j in range(k):
+            parts = [rng.random() for _ in range(3)]
+            score = sum(parts) / 3
+            rejudged = rng.random() < 0.3
+            rows.append((f"{run_id}-{j:04d}", run_id, f"q{rng.randrange(n_questions):09d}", score,
+                         rng.random(), rng.randint(300, 3000), run_at, *parts, int(score >= 0.7), int(rejudged),
+                         rng.random() * 0.3 if rejudged else 0.0, rng.choice(WORDS), "llm"))
+        batch_mean = sum(row[3] for row in rows) / k
+        ema = 0.2 * batch_mean + 0.8 * ema
+        con.execute("""INSERT INTO runs(run_id, run_at, base_url, solve_model, judge_model, n_questions, domain,
+                       batch_mean, ema_after, target_difficulty, n_local_graded, n_judge_calls,
+                       n_local_repairs, n_llm_repairs, n_judge_failed)
+                       VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+                    (run_id, run_at, "http://seed", "mock", "mock", k, "general",
+                     batch_mean, ema, 1 + r % 5, 0, k, 0, 0, 0))
+        con.executemany("""INSERT INTO results(result_id, run_id, question_id, score, confidence, latency_ms,
+                           created_at, correctness, completeness, clarity, passed, rejudged, disagreement,
+                           reason, grader) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", rows)
+        if r % 100 == 99:
+            con.commit()
+    con.commit()
+    # raw inserts bypass store.insert_result, which maintains these incrementally
+    failures.rebuild(con)
+    bandit.rebuild(con)
+    taxonomy.rebuild(con)
+    con.commit()
+    con.close()
+
+
+def run_case(argv, env) -> dict:
+    proc = subprocess.run([sys.executable, "-c", CHILD, json.dumps(argv)],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    line = next((l for l in proc.stderr.splitlines() if l.startswith("SCALEBENCH ")), None)
+    if proc.returncode != 0 or line is None:
+        raise RuntimeError(f"bench {' '.join(argv)} failed:\n{proc.stderr[-2000:]}")
+    return json.loads(line[len("SCALEBENCH "):])
+
+
+def cases(args, figs_dir: str, base_url: str):
+    """(name, bench argv, questions processed)."""
+    dead = [f"--{role}-base-url={base_url},{DEAD_REPLICA}" for role in ("solve", "judge")]
+    return [
+        ("generate", ["generate", "--n", str(args.n_gen)], args.n_gen),
+        ("run", ["run", "--n", str(args.n_run)], args.n_run),
+        ("iterate", ["iterate", "--iterations", str(args.iterations), "--n-gen", str(args.n_gen),
+                     "--n-run", str(args.n_run)], args.iterations * (args.n_gen + args.n_run)),
+        ("analyze", ["analyze"], 0),
+        ("visualize", ["visualize", "--out-dir", figs_dir, "--force", "--dpi", "72"], 0),
+        ("run-failover", dead + ["run", "--n", str(args.n_run)], args.n_run),
+        ("iter-failover", dead + ["iterate", "--iterations", str(args.iterations), "--n-gen", str(args.n_gen),
+                                  "--n-run", str(args.n_run)], args.iterations * (args.n_gen + args.n_run)),
+    ]
+
+
+def compare(rows, baseline: dict, tolerance: float):
+    base = {(b["size"], b["case"]): b for b in baseline.get("results", [])}
+    failures = []
+    for r in rows:
+        b = base.get((r["size"], r["case"]))
+        if not b:
+            continue
+        key = "overhead_ms_per_q" if r["questions"] else "wall_s"
+        if b[key] > 0 and r[key] > tolerance * b[key]:
+            failures.append(f"{r['case']}@{r['size']}: {key} {r[key]:.3f} vs baseline {b[key]:.3f}")
+        if b["peak_rss_mb"] > 0 and r["peak_rss_mb"] > tolerance * b["peak_rss_mb"]:
+            failures.append(f"{r['case']}@{r['size']}: peak_rss_mb {r['peak_rss_mb']:.0f} "
+                            f"vs baseline {b['peak_rss_mb']:.0f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Harness scalability benchmark against the local mock endpoint")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated bank sizes (questions).")
+    parser.add_argument("--results-per-question", type=float, default=0.5,
+                        help="Seeded result history, as a multiple of the bank size.")
+    parser.add_argument("--n-gen", type=int, default=20)
+    parser.add_argument("--n-run", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--latency", default="fixed:0", help="Mock latency spec (see scripts/mock_server.py).")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--base-url", default=None, help="Use an already running endpoint instead of the mock.")
+    parser.add_argument("--work-dir", default=None, help="Where seeded DBs live (default: a temp dir).")
+    parser.add_argument("--reuse", action="store_true", help="Reuse seeded DBs from --work-dir.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Write results as JSON.")
+    parser.add_argument("--baseline", default=None, help="JSON from an earlier --out to compare against.")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown vs the baseline.")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        from scripts import mock_server
+        server = mock_server.start_server(latency=args.latency, error_rate=args.error_rate,
+                                          rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+        base_url = mock_server.base_url(server)
+
+    work = Path(args.work_dir or tempfile.mkdtemp(prefix="scalebench-"))
+    work.mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "mock"), OPENAI_BASE_URL=base_url,
+               OPENAI_MODEL="mock")
+
+    rows = []
+    print(f"{'size':>9} {'case':<13} {'wall s':>8} {'llm s':>8} {'sql s':>8} {'ovh ms/q':>9} "
+          f"{'sql ms/q':>9} {'peak MB':>8}")
+    try:
+        for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            seeded = work / f"bank-{size}.seed.sqlite"
+            if not (args.reuse and seeded.exists()):
+                for p in work.glob(f"bank-{size}.seed.sqlite*"):
+                    p.unlink()
+                seed_db(str(seeded), size, int(size * args.results_per_question), seed=args.seed)
+            db = work / f"bank-{size}.sqlite"
+            for p in work.glob(f"bank-{size}.sqlite*"):
+                p.unlink()
+            shutil.copyfile(seeded, db)
+
+            for name, argv, n_q in cases(args, str(work / f"figs-{size}"), base_url):
+                m = run_case(["--db", str(db), "--base-url", base_url] + argv, env)
+                row = {"size": size, "case": name, "questions": n_q, **m,
+                       "overhead_ms_per_q": (m["wall_s"] - m["llm_s"]) * 1000 / n_q if n_q else 0.0,
+                       "sql_ms_per_q": m["sql_s"] * 1000 / n_q if n_q else 0.0}
+                rows.append(row)
+                per_q = (f"{row['overhead_ms_per_q']:>9.2f} {row['sql_ms_per_q']:>9.2f}" if n_q
+                         else f"{'-':>9} {'-':>9}")
+                print(f"{size:>9} {name:<13} {m['wall_s']:>8.2f} {m['llm_s']:>8.2f} {m['sql_s']:>8.2f} "
+                      f"{per_q} {m['peak_rss_mb']:>8.0f}", flush=True)
+            if not args.work_dir:
+                for p in work.glob(f"bank-{size}.*"):
+                    p.unlink()
+    finally:
+        if server is not None:
+            server.shutdown()
+        if not args.work_dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps({"args": vars(args), "results": rows}, indent=2), encoding="utf-8")
+        print(f"Wrote {args.out}")
+
+    if args.baseline:
+        failures = compare(rows, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        for f in failures:
+            print("REGRESSION", f)
+        if failures:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
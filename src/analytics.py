@@ -0,0 +1,287 @@
+# src/analytics.py
+"""
+Shared analytics snapshot for report, analyze and plots.
+
+Everything is materialized once from the rollup tables into NumPy arrays
+keyed by category × difficulty and by run, plus the small runs table and an
+index-backed worst-k lookup. The renderers never query the DB themselves, so
+`iterate` printing report + analyze (or `visualize` drawing four figures)
+pays for one load instead of a dozen scans of results ⋈ questions.
+
+Cells are kept per full category path (see taxonomy.py). Stats for any node
+fold those cells into the node's units, i.e. its subcategories, so every
+depth is served from the same arrays. Top-level categories (CATEGORIES first,
+then discovered roots) are the default level, and the bootstrap CIs are
+computed there.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import latency, metrics
+from .bootstrap import DEFAULT_RESAMPLES, bootstrap_cis, load_samples
+from .evolve import CATEGORIES
+from .taxonomy import child_of
+
+
+class Snapshot:
+    def __init__(
+        self,
+        categories: List[str],
+        difficulties: List[int],
+        runs: List[dict],
+        cell_cat: np.ndarray,
+        cell_diff: np.ndarray,
+        n: np.ndarray,
+        total: np.ndarray,
+        sumsq: np.ndarray,
+        dis_sum: np.ndarray,
+        run_n: np.ndarray,
+        run_sum: np.ndarray,
+        run_dis: np.ndarray,
+        n_questions: int,
+        worst: List[dict],
+        ci: Optional[dict] = None,
+    ):
+        self.categories = categories
+        self.difficulties = difficulties
+        self.runs = runs                  # ordered by run_at
+        # category × difficulty cells
+        self.cell_cat = cell_cat          # index into categories
+        self.cell_diff = cell_diff        # raw difficulty value
+        self.n = n
+        self.sum = total
+        self.sumsq = sumsq
+        self.dis_sum = dis_sum
+        # per run, aligned with self.runs
+        self.run_n = run_n
+        self.run_sum = run_sum
+        self.run_dis = run_dis
+        self.n_questions = n_questions
+        self.worst = worst                # worst results by score, ascending
+        self.ci = ci                      # bootstrap intervals (see bootstrap.bootstrap_cis)
+        # top-level categories and their × difficulty cells (the bootstrap's level)
+        self.roots, cat_root = self._fold(None)
+        self.cell_root = cat_root[cell_cat]
+        keys: Dict[Tuple[str, int], int] = {}
+        self.cell_group = np.array([keys.setdefault((self.roots[r], int(d)), len(keys))
+                                    for r, d in zip(self.cell_root, cell_diff)], dtype=np.int64)
+        self.root_cells = list(keys)
+
+    def _fold(self, node: Optional[str]) -> Tuple[List[str], np.ndarray]:
+        """Units of `node` (roots when None) and the unit index of every category (-1 outside the subtree)."""
+        units: List[str] = []
+        idx: Dict[str, int] = {}
+        cat_unit = np.full(len(self.categories), -1, dtype=np.int64)
+        for i, c in enumerate(self.categories):
+            u = child_of(c, node)
+            if u is None:
+                continue
+            if u not in idx:
+                idx[u] = len(units)
+                units.append(u)
+            cat_unit[i] = idx[u]
+        return units, cat_unit
+
+    def subcategories(self, node: str) -> List[str]:
+        """Children of `node` that have results."""
+        units, _ = self._fold(node)
+        return [u for u in units if u != node]
+
+    @property
+    def n_results(self) -> int:
+        return int(self.n.sum())
+
+    # ---- category level ----
+    def category_stats(self, node: str = None) -> Dict[str, Tuple[float, int]]:
+        """(mean, n) per top-level category, or per unit of `node`."""
+        units, cat_unit = self._fold(node)
+        cell_unit = cat_unit[self.cell_cat]
+        inside = cell_unit >= 0
+        n = np.bincount(cell_unit[inside], weights=self.n[inside], minlength=len(units))
+        s = np.bincount(cell_unit[inside], weights=self.sum[inside], minlength=len(units))
+        return {c: (float(s[i] / n[i]), int(n[i])) for i, c in enumerate(units) if n[i] > 0}
+
+    def category_means(self, node: str = None) -> Dict[str, float]:
+        return {c: m for c, (m, _) in self.category_stats(node).items()}
+
+    def category_ci(self) -> Dict[str, Tuple[float, float]]:
+        """Bootstrap CIs per top-level category."""
+        if not self.ci:
+            return {}
+        lo, hi = self.ci["category"]
+        return {c: (float(lo[i]), float(hi[i])) for i, c in enumerate(self.roots) if not np.isnan(lo[i])}
+
+    # ---- category × difficulty ----
+    def cell_stats(self, node: str = None) -> Dict[Tuple[str, int], Tuple[float, int]]:
+        """(mean, n) per (top-level category, difficulty), or per (unit of `node`, difficulty)."""
+        units, cat_unit = self._fold(node)
+        acc: Dict[Tuple[str, int], List[float]] = {}
+        for c, d, n, s in zip(cat_unit[self.cell_cat], self.cell_diff, self.n, self.sum):
+            if c >= 0:
+                a = acc.setdefault((units[c], int(d)), [0.0, 0.0])
+                a[0] += n
+                a[1] += s
+        return {k: (float(s / n), int(n)) for k, (n, s) in acc.items() if n > 0}
+
+    def cell_ci(self) -> Dict[Tuple[str, int], Tuple[float, float]]:
+        """Bootstrap CIs per (top-level category, difficulty)."""
+        if not self.ci:
+            return {}
+        lo, hi = self.ci["cell"]
+        return {k: (float(a), float(b)) for k, a, b in zip(self.root_cells, lo, hi) if not np.isnan(a)}
+
+    # ---- per run ----
+    def run_disagreement(self) -> List[Tuple[str, float]]:
+        """(run_id, avg disagreement) for runs with results, in run order."""
+        return [(self.runs[i]["run_id"], float(self.run_dis[i] / self.run_n[i]))
+                for i in np.flatnonzero(self.run_n)]
+
+    def run_deltas(self) -> List[dict]:
+        """Mean change between consecutive runs of the same (solve_model, domain), with CI."""
+        if not self.ci:
+            return []
+        out = []
+        for j, i, lo, hi in self.ci["run_delta"]:
+            delta = self.run_sum[i] / self.run_n[i] - self.run_sum[j] / self.run_n[j]
+            out.append({"run": self.runs[i], "prev": self.runs[j], "delta": float(delta), "lo": lo, "hi": hi})
+        return out
+
+    def latency_regressions(self, stage: str, window: int = latency.DEFAULT_WINDOW,
+                            threshold: float = latency.DEFAULT_THRESHOLD) -> Dict[str, List[Tuple[str, float]]]:
+        return latency.tail_regressions(self.runs, stage, window=window, threshold=threshold)
+
+    def avg_disagreement(self) -> Optional[float]:
+        total = self.n.sum()
+        return float(self.dis_sum.sum() / total) if total else None
+
+    def scored_runs(self) -> List[dict]:
+        return [r for r in self.runs if r["batch_mean"] is not None]
+
+    def repair_rates(self) -> List[dict]:
+        by_model: Dict[str, dict] = {}
+        for r in self.runs:
+            if r["n_judge_calls"] is None:
+                continue
+            m = by_model.setdefault(r["judge_model"], {"judge_model": r["judge_model"], "calls": 0,
+                                                       "local_rep": 0, "llm_rep": 0, "failed": 0})
+            m["calls"] += r["n_judge_calls"] or 0
+            m["local_rep"] += r["n_local_repairs"] or 0
+            m["llm_rep"] += r["n_llm_repairs"] or 0
+            m["failed"] += r["n_judge_failed"] or 0
+        return [by_model[k] for k in sorted(by_model)]
+
+    def cache_totals(self) -> Dict[str, Tuple[int, int]]:
+        """{stage: (prompt tokens, cached tokens)} over runs that recorded usage."""
+        out = {}
+        for st in metrics.CACHE_STAGES:
+            p, c = metrics.CACHE_COLUMNS[st]
+            rows = [r for r in self.runs if r[p]]
+            out[st] = (sum(r[p] for r in rows), sum(r[c] or 0 for r in rows))
+        return out
+
+    def rejudge_stats(self) -> List[dict]:
+        """Per (judge model, policy): rejudge rate and mean disagreement captured per extra call."""
+        groups: Dict[Tuple[str, str], dict] = {}
+        for i, r in enumerate(self.runs):
+            if r["n_rejudged"] is None or r["n_judge_calls"] is None:
+                continue
+            key = (r["judge_model"], r["rejudge_policy"] or "confidence")
+            g = groups.setdefault(key, {"judge_model": key[0], "policy": key[1], "runs": 0,
+                                        "judged": 0, "rejudged": 0, "dis_sum": 0.0})
+            g["runs"] += 1
+            g["judged"] += r["n_judge_calls"] - r["n_rejudged"]
+            g["rejudged"] += r["n_rejudged"]
+            g["dis_sum"] += float(self.run_dis[i])
+        out = []
+        for key in sorted(groups):
+            g = groups[key]
+            g["rate"] = g["rejudged"] / g["judged"] if g["judged"] else 0.0
+            g["dis_per_call"] = g["dis_sum"] / g["rejudged"] if g["rejudged"] else None
+            out.append(g)
+        return out
+
+
+def load_snapshot(con, worst_k: int = 5, n_boot: int = DEFAULT_RESAMPLES) -> Snapshot:
+    """n_boot=0 skips the bootstrap (and its scan of results)."""
+    latency_cols = ", ".join(c for s in latency.STAGES for c in latency.COLUMNS[s])
+    cache_cols = ", ".join(c for s in metrics.CACHE_STAGES for c in metrics.CACHE_COLUMNS[s])
+    runs = [dict(r) for r in con.execute(f"""
+        SELECT run_id, run_at, base_url, n_questions, batch_mean, ema_after, target_difficulty,
+               n_local_graded, judge_model, solve_model, domain,
+               n_judge_calls, n_local_repairs, n_llm_repairs, n_judge_failed, n_rejudged, rejudge_policy,
+               {latency_cols}, {cache_cols}
+        FROM runs
+        ORDER BY run_at ASC
+    """).fetchall()]
+    run_idx = {r["run_id"]: i for i, r in enumerate(runs)}
+
+    cells = con.execute("""
+        SELECT category, difficulty, SUM(n) AS n, SUM(sum) AS sum, SUM(sumsq) AS sumsq, SUM(dis_sum) AS dis_sum
+        FROM rollup_total
+        GROUP BY category, difficulty
+        ORDER BY category, difficulty
+    """).fetchall()
+
+    categories = list(CATEGORIES)
+    cat_idx = {c: i for i, c in enumerate(categories)}
+    for row in cells:
+        if row["category"] not in cat_idx:
+            cat_idx[row["category"]] = len(categories)
+            categories.append(row["category"])
+
+    cell_cat = np.array([cat_idx[r["category"]] for r in cells], dtype=np.int64)
+    cell_diff = np.array([int(r["difficulty"]) for r in cells], dtype=np.int64)
+    stats = np.array([(r["n"], r["sum"], r["sumsq"], r["dis_sum"]) for r in cells],
+                     dtype=np.float64).reshape(len(cells), 4)
+
+    run_n = np.zeros(len(runs))
+    run_sum = np.zeros(len(runs))
+    run_dis = np.zeros(len(runs))
+    for r in con.execute("""
+        SELECT run_id, SUM(n) AS n, SUM(sum) AS sum, SUM(dis_sum) AS dis_sum
+        FROM rollup_run
+        GROUP BY run_id
+    """).fetchall():
+        i = run_idx.get(r["run_id"])
+        if i is not None:
+            run_n[i], run_sum[i], run_dis[i] = r["n"], r["sum"], r["dis_sum"]
+
+    difficulties = [int(r["difficulty"]) for r in con.execute("""
+        SELECT DISTINCT difficulty FROM questions
+        WHERE difficulty IS NOT NULL
+        ORDER BY difficulty ASC
+    """).fetchall()]
+    n_questions = con.execute("SELECT COUNT(*) AS n FROM questions").fetchone()["n"]
+
+    worst = [dict(r) for r in con.execute("""
+        SELECT q.prompt, r.score, r.confidence, r.disagreement, r.reason
+        FROM results r
+        JOIN questions q ON q.question_id = r.question_id
+        ORDER BY r.score ASC, r.result_id ASC
+        LIMIT ?
+    """, (worst_k,)).fetchall()]
+
+    snap = Snapshot(
+        categories=categories,
+        difficulties=difficulties,
+        runs=runs,
+        cell_cat=cell_cat,
+        cell_diff=cell_diff,
+        n=stats[:, 0],
+        total=stats[:, 1],
+        sumsq=stats[:, 2],
+        dis_sum=stats[:, 3],
+        run_n=run_n,
+        run_sum=run_sum,
+        run_dis=run_dis,
+        n_questions=int(n_questions),
+        worst=worst,
+    )
+    if n_boot and len(cells):
+        cell_idx = {(categories[c], int(d)): i for i, (c, d) in enumerate(zip(cell_cat, cell_diff))}
+        samples = load_samples(con, run_idx, cell_idx)
+        scopes = [(r["solve_model"], r["domain"]) for r in runs]
+        snap.ci = bootstrap_cis(samples, snap.cell_root, len(snap.roots), scopes, n_boot=n_boot,
+                                cell_group=snap.cell_group, n_groups=len(snap.root_cells))
+    return snap
@@ -1,25 +1,38 @@
-import json
-from .evolve import CATEGORIES
+from .analytics import Snapshot, load_snapshot
+from .latency import COLUMNS, DEFAULT_THRESHOLD, DEFAULT_WINDOW, STAGES
+from .metrics import CACHE_COLUMNS, CACHE_STAGES
 
-def analyze(con) -> str:
+def _fmt_ms(values) -> str:
+    return "/".join("-" if v is None else f"{v:.0f}" for v in values)
+
+def _tree_lines(snap: Snapshot, node: str, indent: int) -> list:
+    lines = []
+    for c, (mean, n) in snap.category_stats(node).items():
+        if c == node:
+            continue
+        lines.append(f"{'  ' * indent}- {c}: {mean:.3f} (n={n})")
+        lines.extend(_tree_lines(snap, c, indent + 1))
+    return lines
+
+def analyze(con, snapshot: Snapshot = None, latency_window: int = DEFAULT_WINDOW,
+            latency_threshold: float = DEFAULT_THRESHOLD) -> str:
+    snap = snapshot or load_snapshot(con)
     lines = []
 
     # -----------------------------
     # Run history
     # -----------------------------
-    runs = con.execute("""
-        SELECT run_at, n_questions, batch_mean, ema_after, target_difficulty
-        FROM runs
-        ORDER BY run_at ASC
-    """).fetchall()
+    runs = snap.scored_runs()
 
-    lines.append("Run history (time | n | batch_mean | ema | target_difficulty):")
+    lines.append("Run history (time | n | batch_mean | ema | target_difficulty | locally graded):")
     if runs:
         for r in runs[-10:]:
+            local = r["n_local_graded"]
+            share = f"{local / max(1, r['n_questions']):.0%}" if local is not None else "N/A"
             lines.append(
                 f"  {r['run_at']} | n={r['n_questions']} | "
                 f"mean={r['batch_mean']:.3f} | ema={r['ema_after']:.3f} | "
-                f"d={r['target_difficulty']}"
+                f"d={r['target_difficulty']} | local={share}"
             )
     else:
         lines.append("  (no runs yet)")
@@ -30,86 +43,137 @@ def analyze(con) -> str:
     lines.append("")
     lines.append("Category mean scores:")
 
-    cat_means = con.execute("""
-        SELECT q.category, AVG(r.score) AS mean_score, COUNT(*) AS n
-        FROM results r
-        JOIN questions q ON q.question_id = r.question_id
-        GROUP BY q.category
-    """).fetchall()
+    cat_dict = snap.category_stats()
+    cat_ci = snap.category_ci()
 
-    cat_dict = {row["category"]: (row["mean_score"], row["n"]) for row in cat_means}
-
-    for c in CATEGORIES:
+    for c in snap.roots:
         if c in cat_dict:
             mean, n = cat_dict[c]
-            lines.append(f"  - {c}: {mean:.3f} (n={n})")
+            ci = f" [{cat_ci[c][0]:.3f}, {cat_ci[c][1]:.3f}]" if c in cat_ci else ""
+            lines.append(f"  - {c}: {mean:.3f}{ci} (n={n})")
         else:
             lines.append(f"  - {c}: N/A")
 
+    # -----------------------------
+    # Subcategories (category paths below the top level)
+    # -----------------------------
+    tree = []
+    for c in snap.roots:
+        if snap.subcategories(c):
+            tree.append(f"  - {c}")
+            tree.extend(_tree_lines(snap, c, 2))
+    if tree:
+        lines.append("")
+        lines.append("Subcategory mean scores:")
+        lines.extend(tree)
+
     # -----------------------------
     # Category × Difficulty matrix
     # -----------------------------
     lines.append("")
-    lines.append("Category × Difficulty matrix (mean score (count)):")
-
-    matrix = con.execute("""
-        SELECT q.category, q.difficulty,
-               AVG(r.score) AS mean_score,
-               COUNT(*) AS n
-        FROM results r
-        JOIN questions q ON q.question_id = r.question_id
-        GROUP BY q.category, q.difficulty
-        ORDER BY q.category, q.difficulty
-    """).fetchall()
-
-    # organize
-    grid = {}
-    for row in matrix:
-        cat = row["category"]
-        diff = row["difficulty"]
-        mean = row["mean_score"]
-        n = row["n"]
-        grid.setdefault(cat, {})[diff] = (mean, n)
+    lines.append("Category × Difficulty matrix (mean score ± CI half-width (count)):")
+
+    grid = snap.cell_stats()
+    grid_ci = snap.cell_ci()
 
     diffs = [1, 2, 3, 4, 5]
 
-    header = "               " + "  ".join([f"d={d}" for d in diffs])
-    lines.append(header)
+    header = "               " + "".join([f"{'d=' + str(d):<16}" for d in diffs])
+    lines.append(header.rstrip())
 
-    for c in CATEGORIES:
+    for c in snap.roots:
         row_str = f"{c:<15}"
         for d in diffs:
-            if c in grid and d in grid[c]:
-                mean, n = grid[c][d]
-                row_str += f"{mean:.2f}({n})  "
+            if (c, d) in grid:
+                mean, n = grid[(c, d)]
+                cell = f"{mean:.2f}"
+                if (c, d) in grid_ci:
+                    lo, hi = grid_ci[(c, d)]
+                    cell += f"±{(hi - lo) / 2:.2f}"
+                row_str += f"{cell + f'({n})':<16}"
             else:
-                row_str += "   -      "
-        lines.append(row_str)
+                row_str += f"{'-':<16}"
+        lines.append(row_str.rstrip())
+
+    # -----------------------------
+    # Run-to-run deltas
+    # -----------------------------
+    deltas = snap.run_deltas()
+
+    if deltas:
+        lines.append("")
+        lines.append(
+            f"Run-to-run mean deltas ({snap.ci['level']:.0%} bootstrap CI, "
+            f"B={snap.ci['n_boot']}, stratified by run):"
+        )
+        for d in deltas[-10:]:
+            r = d["run"]
+            flag = ""
+            if d["hi"] < 0:
+                flag = "  <- regression"
+            elif d["lo"] > 0:
+                flag = "  <- improvement"
+            lines.append(
+                f"  {r['run_at']} | {r['solve_model']}/{r['domain'] or '-'} | "
+                f"delta={d['delta']:+.3f} [{d['lo']:+.3f}, {d['hi']:+.3f}]{flag}"
+            )
+
+    # -----------------------------
+    # Latency percentiles and tail regressions
+    # -----------------------------
+    lat_runs = [r for r in snap.runs if any(r[COLUMNS[st][0]] is not None for st in STAGES)]
+
+    if lat_runs:
+        flagged = {st: snap.latency_regressions(st, window=latency_window, threshold=latency_threshold)
+                   for st in STAGES}
+        lines.append("")
+        lines.append(
+            f"Latency per call (ms, p50/p90/p99; flagged when p90 or p99 > {latency_threshold:g}x the median "
+            f"of the previous {latency_window} runs on the same endpoint and model):"
+        )
+        for r in lat_runs[-10:]:
+            flags = [f"{st} {q} x{ratio:.2f}" for st in STAGES for q, ratio in flagged[st].get(r["run_id"], [])]
+            flag = f"  <- tail regression: {', '.join(flags)}" if flags else ""
+            lines.append(
+                f"  {r['run_at']} | {r['solve_model']}/{r['domain'] or '-'} | "
+                f"solve={_fmt_ms(r[c] for c in COLUMNS['solve'])} | "
+                f"judge={_fmt_ms(r[c] for c in COLUMNS['judge'])}{flag}"
+            )
+        shown = {r["run_id"] for r in lat_runs[-10:]}
+        older = {rid for st in STAGES for rid in flagged[st]} - shown
+        if older:
+            lines.append(f"  ({len(older)} earlier run(s) also flagged)")
+
+    # -----------------------------
+    # Prompt-cache hit rates
+    # -----------------------------
+    cache_runs = [r for r in snap.runs if any(r[CACHE_COLUMNS[st][0]] for st in CACHE_STAGES)]
+
+    if cache_runs:
+        def share(prompt, cached):
+            return f"{cached / prompt:.1%} of {prompt:,}" if prompt else "-"
+
+        lines.append("")
+        lines.append("Prompt cache (prompt tokens served from the endpoint's prefix cache):")
+        for r in cache_runs[-10:]:
+            lines.append(
+                f"  {r['run_at']} | {r['solve_model']}/{r['domain'] or '-'} | " + " | ".join(
+                    f"{st}={share(*(r[c] or 0 for c in CACHE_COLUMNS[st]))}" for st in CACHE_STAGES)
+            )
+        totals = snap.cache_totals()
+        lines.append("  all runs: " + " | ".join(f"{st}={share(*totals[st])}" for st in CACHE_STAGES))
 
     # -----------------------------
     # Worst failures
     # -----------------------------
-    rows = con.execute("""
-        SELECT q.prompt, r.score, r.confidence, r.judge_json
-        FROM results r
-        JOIN questions q ON q.question_id = r.question_id
-        ORDER BY r.score ASC
-        LIMIT 5
-    """).fetchall()
+    rows = snap.worst[:5]
 
     if rows:
         lines.append("")
         lines.append("Worst examples:")
         for row in rows:
-            try:
-                j = json.loads(row["judge_json"])
-                dis = float(j.get("disagreement", 0.0))
-                rs = j.get("reasons", [])
-                reason = rs[0] if isinstance(rs, list) and rs else "(no reason)"
-            except Exception:
-                dis = 0.0
-                reason = "(parse error)"
-
+            dis = row["disagreement"] or 0.0
+            reason = row["reason"] or "(no reason)"
             lines.append(
                 f"  score={row['score']:.3f} | "
                 f"conf={row['confidence']:.2f} | "
@@ -117,18 +181,48 @@ def analyze(con) -> str:
                 f"{reason}"
             )
 
+    # -----------------------------
+    # Judge repair rates
+    # -----------------------------
+    rep = snap.repair_rates()
+
+    if rep:
+        lines.append("")
+        lines.append("Judge repair rates (per judge model):")
+        for row in rep:
+            calls = max(1, row["calls"] or 0)
+            lines.append(
+                f"  - {row['judge_model']}: calls={row['calls']} | "
+                f"local_repair={row['local_rep'] / calls:.1%} | "
+                f"llm_repair={row['llm_rep'] / calls:.1%} | "
+                f"failed={row['failed']}"
+            )
+
+    # -----------------------------
+    # Rejudge spend vs yield
+    # -----------------------------
+    rj = snap.rejudge_stats()
+
+    if rj:
+        lines.append("")
+        lines.append("Rejudge policy (per judge model; disagreement captured per extra call):")
+        for g in rj:
+            per_call = f"{g['dis_per_call']:.4f}" if g["dis_per_call"] is not None else "N/A"
+            lines.append(
+                f"  - {g['judge_model']} [{g['policy']}]: runs={g['runs']} | "
+                f"rejudge_rate={g['rate']:.1%} ({g['rejudged']}/{g['judged']}) | "
+                f"dis_per_call={per_call}"
+            )
+
     # -----------------------------
     # Uncertainty summary
     # -----------------------------
-    u = con.execute("""
-        SELECT AVG(ABS(json_extract(judge_json, '$.disagreement'))) AS avg_dis
-        FROM results
-    """).fetchone()
+    avg_dis = snap.avg_disagreement()
 
-    if u and u["avg_dis"] is not None:
+    if avg_dis is not None:
         lines.append("")
         lines.append(
-            f"Uncertainty proxy: avg judge disagreement = {u['avg_dis']:.4f}"
+            f"Uncertainty proxy: avg judge disagreement = {avg_dis:.4f}"
         )
 
     return "\n".join(lines)
@@ -0,0 +1,205 @@
+# src/bandit.py
+"""
+Bandit allocation of generation and evaluation effort across categories.
+
+Each (solve_model, domain) scope keeps a Beta posterior over the mean score
+of every category and every (category, difficulty) cell, at every level of
+the category path (see taxonomy.py). A result with score s adds s to the
+success mass and 1 - s to the failure mass of its cells (a fractional
+Bernoulli update). Masses decay with a half-life of
+HALF_LIFE_HOURS, and the posterior is Beta(1 + success, 1 + failure). Old
+evidence therefore fades back to the uniform prior: a category that has not
+been measured recently, or has few results, keeps a wide posterior and
+keeps getting probed.
+
+Cells live in `state` as "bandit:<category>[:<difficulty>]@<model>/<domain>"
+holding {"s", "f", "t"} (masses as of hour t). record_result updates two rows
+per level of the result's category path. Reads decay every cell of a scope to the scope's latest update,
+so an idle period does not erase what is known.
+
+Allocators (weakness is sought, so low scores are "rewarding"):
+  - "weakness": the original 1 - mean category weights (evolve.category_weights)
+  - "thompson": draw a mean from every posterior, give the slot to the lowest
+  - "ucb": give the slot to the lowest lower-confidence bound
+    (mean - UCB_Z * sd). After each slot a pseudo-observation at the
+    posterior mean narrows the chosen cell, which spreads a batch across cells.
+"""
+import json
+import math
+import random
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .defaults import ALLOCATORS
+from .evolve import CATEGORIES, WEIGHT_FLOOR, category_means, category_weights
+from .taxonomy import ancestors
+
+HALF_LIFE_HOURS = 72.0
+UCB_Z = 1.0
+DRAWS = 1000           # slots simulated to turn an allocator into category weights
+DIFFICULTIES = range(1, 6)
+KEY = "bandit"
+BUILT_KEY = "bandit_built"
+
+Posterior = Tuple[float, float]
+
+
+def _hours(ts: str) -> float:
+    return datetime.fromisoformat(ts).timestamp() / 3600.0
+
+
+def _scope(solve_model: Optional[str], domain: Optional[str]) -> str:
+    # same suffix as store.state_key
+    return f"@{solve_model or '*'}/{domain or '*'}"
+
+
+def cell_key(category: str, difficulty: Optional[int], solve_model: Optional[str], domain: Optional[str]) -> str:
+    cell = category if difficulty is None else f"{category}:{int(difficulty)}"
+    return f"{KEY}:{cell}{_scope(solve_model, domain)}"
+
+
+def _put(con, key: str, s: float, f: float, t: float) -> None:
+    con.execute("INSERT INTO state(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, json.dumps({"s": s, "f": f, "t": t})))
+
+
+def _decay(hours: float) -> float:
+    return 2.0 ** (-hours / HALF_LIFE_HOURS)
+
+
+def _keys(category: str, difficulty: int, solve_model: Optional[str], domain: Optional[str]) -> List[str]:
+    return [key for node in ancestors(category)
+            for key in (cell_key(node, None, solve_model, domain), cell_key(node, difficulty, solve_model, domain))]
+
+
+def record_result(con, *, run_id: str, question_id: str, score: float, created_at: str) -> None:
+    """O(depth) posterior update for one result (caller commits)."""
+    row = con.execute("""
+        SELECT q.category, q.difficulty, ru.solve_model, ru.domain
+        FROM questions q, runs ru
+        WHERE q.question_id = ? AND ru.run_id = ?
+    """, (question_id, run_id)).fetchone()
+    if row is None:
+        return
+    t = _hours(created_at)
+    score = min(1.0, max(0.0, float(score)))
+    for key in _keys(*row):
+        cur = con.execute("SELECT value FROM state WHERE key=?", (key,)).fetchone()
+        if cur is None:
+            _put(con, key, score, 1.0 - score, t)
+            continue
+        c = json.loads(cur[0])
+        if t >= c["t"]:
+            d = _decay(t - c["t"])
+            _put(con, key, c["s"] * d + score, c["f"] * d + 1.0 - score, t)
+        else:  # out-of-order write: decay the new observation instead
+            d = _decay(c["t"] - t)
+            _put(con, key, c["s"] + score * d, c["f"] + (1.0 - score) * d, c["t"])
+
+
+def rebuild(con) -> int:
+    """Recompute every posterior from results (for existing DBs and raw bulk loads). Returns the cell count (caller commits)."""
+    con.execute("DELETE FROM state WHERE key LIKE ?", (f"{KEY}:%",))
+    latest = con.execute("SELECT MAX(created_at) FROM results").fetchone()[0]
+    ref = _hours(latest) if latest else 0.0
+    cells: Dict[str, List[float]] = {}
+    for category, difficulty, solve_model, domain, score, created_at in con.execute("""
+        SELECT q.category, q.difficulty, ru.solve_model, ru.domain, r.score, r.created_at
+        FROM results r
+        JOIN questions q ON q.question_id = r.question_id
+        JOIN runs ru ON ru.run_id = r.run_id
+    """):
+        t = _hours(created_at)
+        w = 2.0 ** ((t - ref) / HALF_LIFE_HOURS)   # forward decay against a fixed reference
+        score = min(1.0, max(0.0, float(score)))
+        for key in _keys(category, difficulty, solve_model, domain):
+            c = cells.setdefault(key, [0.0, 0.0, t])
+            c[0] += score * w
+            c[1] += (1.0 - score) * w
+            c[2] = max(c[2], t)
+    for key, (s, f, t) in cells.items():
+        grow = _decay(t - ref)   # restate the masses as of the cell's own latest update
+        _put(con, key, s * grow, f * grow, t)
+    _put_built(con)
+    return len(cells)
+
+
+def _put_built(con) -> None:
+    con.execute("INSERT INTO state(key,value) VALUES(?,'1') ON CONFLICT(key) DO NOTHING", (BUILT_KEY,))
+
+
+def posteriors(con, cells: List[Tuple[str, Optional[int]]], solve_model: Optional[str],
+               domain: Optional[str]) -> Dict[Tuple[str, Optional[int]], Posterior]:
+    """Beta(alpha, beta) per (category, difficulty or None) cell, decayed to the scope's latest update."""
+    keys = {cell_key(c, d, solve_model, domain): (c, d) for c, d in cells}
+    stored = {}
+    for i in range(0, len(keys), 500):
+        chunk = list(keys)[i:i + 500]
+        for key, value in con.execute(f"SELECT key, value FROM state WHERE key IN ({','.join('?' * len(chunk))})",
+                                      chunk):
+            stored[keys[key]] = json.loads(value)
+    now = max((c["t"] for c in stored.values()), default=0.0)
+    out = {}
+    for cell in keys.values():
+        c = stored.get(cell)
+        if c is None:
+            out[cell] = (1.0, 1.0)
+        else:
+            d = _decay(now - c["t"])
+            out[cell] = (1.0 + c["s"] * d, 1.0 + c["f"] * d)
+    return out
+
+
+def allocate(post: Dict[Hashable, Posterior], n: int, method: str = "thompson",
+             rng: random.Random = None) -> Dict[Hashable, int]:
+    """Split n slots across the posteriors' cells, favouring low (or uncertain) mean scores."""
+    if method not in ("thompson", "ucb"):
+        raise RuntimeError(f"Unknown bandit allocator {method!r} (expected thompson or ucb).")
+    rng = rng or random.Random()
+    counts = {c: 0 for c in post}
+    if not post:
+        return counts
+    if method == "thompson":
+        for _ in range(n):
+            draws = {c: rng.betavariate(a, b) for c, (a, b) in post.items()}
+            counts[min(draws, key=draws.get)] += 1
+        return counts
+
+    ab = dict(post)
+    for _ in range(n):
+        def lcb(c):
+            a, b = ab[c]
+            return a / (a + b) - UCB_Z * math.sqrt(a * b / ((a + b) ** 2 * (a + b + 1.0)))
+        c = min(ab, key=lcb)
+        counts[c] += 1
+        a, b = ab[c]
+        ab[c] = (a + a / (a + b), b + b / (a + b))
+    return counts
+
+
+def allocation_weights(con, allocator: str = "weakness", solve_model: str = None, domain: str = None,
+                       categories: List[str] = CATEGORIES, floor: float = WEIGHT_FLOOR, slots: int = None,
+                       rng: random.Random = None, node: str = None) -> Dict[str, float]:
+    """
+    Category weights for sample_categories under `allocator`, floored like
+    category_weights. `categories` are the units of `node` (taxonomy.units). Thompson weights are the probability of each category
+    being the weakest (DRAWS draws). UCB weights are its allocation of a batch
+    of `slots` picks (default DRAWS).
+    """
+    if allocator not in ALLOCATORS:
+        raise RuntimeError(f"Unknown allocator {allocator!r} (expected one of {ALLOCATORS}).")
+    if allocator == "weakness":
+        return category_weights(category_means(con, node), categories, floor=floor)
+    post = posteriors(con, [(c, None) for c in categories], solve_model, domain)
+    n = slots if allocator == "ucb" and slots else DRAWS
+    counts = allocate(post, n, allocator, rng=rng)
+    w = {c: max(floor, counts[(c, None)] / n) for c in categories}
+    s = sum(w.values())
+    return {c: v / s for c, v in w.items()}
+
+
+def category_order(con, solve_model: str = None, domain: str = None,
+                   categories: List[str] = CATEGORIES) -> List[str]:
+    """Categories, weakest first by posterior mean."""
+    post = posteriors(con, [(c, None) for c in categories], solve_model, domain)
+    return sorted(categories, key=lambda c: post[(c, None)][0] / sum(post[(c, None)]))
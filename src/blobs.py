@@ -0,0 +1,58 @@
+# src/blobs.py
+"""
+Content-addressed, compressed storage for large cold payloads (solver answers,
+raw judge JSON). Rows are keyed by the sha256 of the uncompressed text, so
+identical payloads are stored once.
+"""
+import hashlib
+import zlib
+from typing import Optional, Tuple
+
+try:  # optional, better ratio and speed than zlib
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
+
+BLOBS_SQL = """
+CREATE TABLE IF NOT EXISTS blobs (
+  hash TEXT PRIMARY KEY,
+  codec TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  data BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def compress(text: str) -> Tuple[str, bytes]:
+    raw = text.encode("utf-8")
+    if _zstd is not None:
+        return "zstd", _zstd.ZstdCompressor(level=6).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+def decompress(codec: str, data: bytes) -> str:
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if codec == "zstd":
+        if _zstd is None:
+            raise RuntimeError("Blob is zstd-compressed; install `zstandard` to read it.")
+        return _zstd.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "raw":
+        return bytes(data).decode("utf-8")
+    raise ValueError(f"Unknown blob codec: {codec}")
+
+def put_blob(con, text: str) -> str:
+    """Store text (deduplicated by hash) and return its hash. Caller commits."""
+    h = content_hash(text)
+    if con.execute("SELECT 1 FROM blobs WHERE hash=?", (h,)).fetchone() is None:
+        codec, data = compress(text)
+        con.execute("INSERT OR IGNORE INTO blobs(hash, codec, size, data) VALUES(?,?,?,?)",
+                    (h, codec, len(text.encode("utf-8")), data))
+    return h
+
+def get_blob(con, h: Optional[str]) -> Optional[str]:
+    if not h:
+        return None
+    row = con.execute("SELECT codec, data FROM blobs WHERE hash=?", (h,)).fetchone()
+    return decompress(row["codec"], row["data"]) if row else None
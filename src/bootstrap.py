@@ -0,0 +1,201 @@
+# src/bootstrap.py
+"""
+Vectorized, run-stratified bootstrap confidence intervals.
+
+Each replicate resamples results with replacement *within* every run, so each
+run keeps its size and its mix of runs. All replicates in a chunk are drawn
+as one (B, N) index matrix. Cell counts and sums come from a single bincount
+over (replicate, cell) keys, and per-run sums come from reduceat over the
+run-sorted columns. No Python loop runs per resample.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_RESAMPLES = 1000
+MIN_RESAMPLES = 100
+MAX_DRAWS = 1 << 23        # indices drawn per analyze call (B × N) before B is reduced
+CHUNK_DRAWS = 1 << 21      # working set per chunk
+
+
+class Samples:
+    """Per-result arrays sorted by run: run index, cell index, score."""
+
+    def __init__(self, run: np.ndarray, cell: np.ndarray, score: np.ndarray, n_runs: int):
+        self.run = run
+        self.cell = cell
+        self.score = score
+        self.counts = np.bincount(run, minlength=n_runs)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+
+def load_samples(con, run_idx: Dict[str, int], cell_idx: Dict[Tuple[str, int], int]) -> Samples:
+    """
+    Scan results once and map them onto the snapshot's run and cell indexes.
+    Rows come back one per run (group_concat), which keeps Python object churn
+    to a few thousand rows instead of one tuple per result. Results of unknown
+    runs/cells are dropped.
+    """
+    q_cell = {}
+    for qid, cat, diff in con.execute("SELECT question_id, category, difficulty FROM questions").fetchall():
+        c = cell_idx.get((cat, int(diff) if diff is not None else None))
+        if c is not None:
+            q_cell[qid] = c
+
+    runs, cells, scores = [], [], []
+    for run_id, n, qids, vals in con.execute("""
+        SELECT run_id, COUNT(*) AS n, group_concat(question_id, ',') AS qids, group_concat(score, ',') AS vals
+        FROM results
+        WHERE score IS NOT NULL
+        GROUP BY run_id
+    """).fetchall():
+        i = run_idx.get(run_id)
+        if i is None:
+            continue
+        runs.append(np.full(n, i, dtype=np.int64))
+        cells.extend(q_cell.get(q, -1) for q in qids.split(","))
+        scores.append(vals)
+
+    if not runs:
+        return Samples(np.zeros(0, np.int64), np.zeros(0, np.int32), np.zeros(0), len(run_idx))
+    run = np.concatenate(runs)
+    cell = np.array(cells, dtype=np.int64)
+    score = np.array(",".join(scores).split(","), dtype=np.float64)
+
+    # drop unknown cells; order by (run, cell, score) so replicates don't depend on scan order
+    keep = cell >= 0
+    run, cell, score = run[keep], cell[keep], score[keep]
+    order = np.lexsort((score, cell, run))
+    return Samples(run[order], cell[order].astype(np.int32), score[order], len(run_idx))
+
+
+def n_resamples(n_rows: int, requested: int = DEFAULT_RESAMPLES) -> int:
+    """Cap B so that B × N stays within MAX_DRAWS (never below MIN_RESAMPLES)."""
+    if n_rows <= 0:
+        return 0
+    return max(min(requested, MIN_RESAMPLES), min(requested, MAX_DRAWS // n_rows))
+
+
+def resample(samples: Samples, n_cells: int, n_boot: int, seed: Optional[int] = 0):
+    """
+    Return replicate matrices (cell_n, cell_sum, run_sum), shaped (B, cells),
+    (B, cells) and (B, runs).
+    """
+    rng = np.random.default_rng(seed)
+    N = len(samples)
+    R = len(samples.counts)
+    pos_start = samples.starts[samples.run].astype(np.int32)
+    pos_n = samples.counts[samples.run].astype(np.float32)
+    nonempty = np.flatnonzero(samples.counts)
+
+    cell_n = np.zeros((n_boot, n_cells))
+    cell_sum = np.zeros((n_boot, n_cells))
+    run_sum = np.zeros((n_boot, R))
+
+    chunk = max(1, CHUNK_DRAWS // max(1, N))
+    for b0 in range(0, n_boot, chunk):
+        b = min(chunk, n_boot - b0)
+        u = rng.random((b, N), dtype=np.float32)
+        u *= pos_n
+        idx = u.astype(np.int32)
+        np.minimum(idx, pos_n.astype(np.int32) - 1, out=idx)   # float32 rounding guard
+        idx += pos_start
+
+        s = samples.score[idx]
+        key = samples.cell[idx]
+        key += (np.arange(b, dtype=np.int32) * n_cells)[:, None]
+        flat = key.ravel()
+        cell_n[b0:b0 + b] = np.bincount(flat, minlength=b * n_cells).reshape(b, n_cells)
+        cell_sum[b0:b0 + b] = np.bincount(flat, weights=s.ravel(), minlength=b * n_cells).reshape(b, n_cells)
+        run_sum[b0:b0 + b, nonempty] = np.add.reduceat(s, samples.starts[nonempty], axis=1)
+
+    return cell_n, cell_sum, run_sum
+
+
+def percentile_ci(reps: np.ndarray, level: float = 0.95) -> np.ndarray:
+    """
+    Column-wise percentile interval, shape (2, k), linear interpolation.
+    NaN replicates (e.g. a cell not drawn in that replicate) are ignored.
+    Vectorized over columns: np.nanquantile falls back to a per-column loop.
+    """
+    a = (1.0 - level) / 2.0
+    srt = np.sort(reps, axis=0)                     # NaNs sort last
+    valid = (~np.isnan(reps)).sum(axis=0)
+    last = np.maximum(valid - 1, 0)
+    out = np.empty((2, reps.shape[1]))
+    for row, q in enumerate((a, 1.0 - a)):
+        pos = q * last
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, last)
+        frac = pos - lo
+        v_lo = np.take_along_axis(srt, lo[None, :], axis=0)[0]
+        v_hi = np.take_along_axis(srt, hi[None, :], axis=0)[0]
+        out[row] = v_lo + (v_hi - v_lo) * frac
+    out[:, valid == 0] = np.nan
+    return out
+
+
+def bootstrap_cis(
+    samples: Samples,
+    cell_cat: np.ndarray,
+    n_categories: int,
+    scopes: List[Tuple[str, ...]],
+    n_boot: int = DEFAULT_RESAMPLES,
+    level: float = 0.95,
+    seed: Optional[int] = 0,
+    cell_group: Optional[np.ndarray] = None,
+    n_groups: Optional[int] = None,
+) -> Optional[dict]:
+    """
+    CIs for category means, category × difficulty cell means and run-to-run
+    deltas between consecutive runs of the same scope (solve_model, domain).
+    With `cell_group`, "cell" intervals are for groups of cells (e.g. every
+    subcategory of a top-level category at one difficulty).
+
+    Returns {"n_boot", "level", "category": (2, K), "cell": (2, cells),
+    "run_delta": [(prev_idx, idx, lo, hi), ...]} or None when there is no data.
+    """
+    B = n_resamples(len(samples), n_boot)
+    if B == 0:
+        return None
+    n_cells = len(cell_cat)
+    cell_n, cell_sum, run_sum = resample(samples, n_cells, B, seed)
+
+    # categories: fold cells into their category (a tiny (cells × K) matmul)
+    fold = np.zeros((n_cells, n_categories))
+    fold[np.arange(n_cells), cell_cat] = 1.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cat_means = (cell_sum @ fold) / (cell_n @ fold)
+        if cell_group is None:
+            cell_means = cell_sum / cell_n
+        else:
+            group = np.zeros((n_cells, n_groups))
+            group[np.arange(n_cells), cell_group] = 1.0
+            cell_means = (cell_sum @ group) / (cell_n @ group)
+        run_means = run_sum / samples.counts
+
+    # consecutive runs within each scope
+    pairs = []
+    last: Dict[Tuple[str, ...], int] = {}
+    for i, scope in enumerate(scopes):
+        if samples.counts[i] == 0:
+            continue
+        if scope in last:
+            pairs.append((last[scope], i))
+        last[scope] = i
+    deltas = []
+    if pairs:
+        prev, cur = np.array(pairs).T
+        bounds = percentile_ci(run_means[:, cur] - run_means[:, prev], level)
+        deltas = [(int(j), int(i), float(lo), float(hi)) for j, i, lo, hi in zip(prev, cur, *bounds)]
+
+    return {
+        "n_boot": B,
+        "level": level,
+        "category": percentile_ci(cat_means, level),
+        "cell": percentile_ci(cell_means, level),
+        "run_delta": deltas,
+    }
@@ -1,9 +1,213 @@
 # src/client.py
+"""
+OpenAI clients per role (gen / solve / judge).
+
+Each role takes a comma-separated list of replica base URLs and falls back to
+--base-url / OPENAI_BASE_URL. Each replica gets its own HTTP connection pool,
+sized per role (POOL_SIZES). A role with one URL gets a plain OpenAI client. With several
+URLs it gets a Router, which exposes the same `chat.completions.create` and
+sends each request to the replica with the fewest outstanding requests.
+Replicas that fail EJECT_AFTER times in a row (connection errors, timeouts,
+5xx) are skipped for a cool-down that doubles on each repeat ejection; a
+replica that fails its first request after a cool-down is ejected again
+straight away. Clients do not retry inside the SDK: a Router fails over to
+another replica, and openai_safe.chat_create_safe re-sends (and counts)
+transient failures.
+"""
+import itertools
 import os
-from openai import OpenAI
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+from openai import APIConnectionError, APIStatusError, OpenAI
+
+from . import metrics
+
+ROLES = ("gen", "solve", "judge")
+# Connections per replica. Generation is a few long calls, solving fans out widest.
+POOL_SIZES = {"gen": 4, "solve": 64, "judge": 32}
+KEEPALIVE_EXPIRY = 30.0
+EJECT_AFTER = 3
+EJECT_SECONDS = 5.0
+MAX_EJECT_SECONDS = 120.0
 
-def make_client(api_key: str | None = None, base_url: str | None = None) -> OpenAI:
+
+def make_client(api_key: str | None = None, base_url: str | None = None, pool_size: int | None = None) -> OpenAI:
+    kwargs = {}
+    if pool_size:
+        from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient
+        limits = type(DEFAULT_CONNECTION_LIMITS)  # the SDK's own httpx Limits class
+        kwargs["http_client"] = DefaultHttpxClient(limits=limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=KEEPALIVE_EXPIRY))
     return OpenAI(
         api_key=api_key or os.getenv("OPENAI_API_KEY"),
         base_url=base_url or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        max_retries=0,   # chat_create_safe retries
+        **kwargs,
     )
+
+
+def split_urls(spec: str | None) -> List[str]:
+    return [u.strip() for u in (spec or "").split(",") if u.strip()]
+
+
+def role_urls(role: str, spec: str | None = None, base_url: str | None = None) -> List[str]:
+    """Replica URLs for a role: `spec`, then OPENAI_<ROLE>_BASE_URL, then base_url."""
+    return split_urls(spec or os.getenv(f"OPENAI_{role.upper()}_BASE_URL") or base_url)
+
+
+def make_clients(base_url: str | None = None, urls: Dict[str, str] | None = None,
+                 pool_sizes: Dict[str, int] | None = None, api_key: str | None = None) -> Dict[str, object]:
+    """
+    {role: client} for ROLES. `urls` maps a role to a comma-separated URL
+    list (see role_urls). Pool sizes default to POOL_SIZES, overridable with
+    OPENAI_<ROLE>_POOL.
+    """
+    urls = urls or {}
+    clients = {}
+    for role in ROLES:
+        replicas = role_urls(role, urls.get(role), base_url)
+        pool = (pool_sizes or {}).get(role) or int(os.getenv(f"OPENAI_{role.upper()}_POOL", POOL_SIZES[role]))
+        if len(replicas) <= 1:
+            clients[role] = make_client(api_key=api_key, base_url=replicas[0] if replicas else None, pool_size=pool)
+        else:
+            clients[role] = Router([Replica(u) for u in replicas],
+                                   [make_client(api_key=api_key, base_url=u, pool_size=pool) for u in replicas],
+                                   role=role)
+    return clients
+
+
+def _is_replica_fault(e: Exception) -> bool:
+    """
+    Connection errors, timeouts (APITimeoutError is an APIConnectionError) and
+    5xx count against a replica; 4xx and local errors (e.g. a TypeError from bad
+    request kwargs) are the request's fault.
+    """
+    if isinstance(e, APIStatusError):
+        return e.status_code >= 500
+    return isinstance(e, APIConnectionError)
+
+
+class Replica:
+    """Health and load counters for one replica URL."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0        # consecutive
+        self.ejections = 0       # consecutive, for the backoff
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+
+class _TrackedStream:
+    """Keeps a streamed request outstanding until the stream is consumed or closed."""
+
+    def __init__(self, stream, done):
+        self._stream = stream
+        self._done = done
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                yield chunk
+        except Exception as e:
+            self._finish(not _is_replica_fault(e))
+            raise
+        self._finish(True)
+
+    def _finish(self, ok: bool):
+        if self._done is not None:
+            done, self._done = self._done, None
+            done(ok)
+
+    def close(self):
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+        self._finish(True)
+
+    def __del__(self):
+        self._finish(True)
+
+
+class Router:
+    """Least-outstanding balancing with health ejection over replica clients."""
+
+    def __init__(self, replicas: List[Replica], clients: List[object], role: str = "", lock=None):
+        if not replicas or len(replicas) != len(clients):
+            raise RuntimeError("Router needs one client per replica (and at least one replica).")
+        self.replicas = replicas
+        self.clients = clients
+        self.role = role
+        self._lock = lock or threading.Lock()
+        self._rr = itertools.count()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **options) -> "Router":
+        """Per-client options (e.g. max_retries=0) over the same replicas and health state."""
+        return Router(self.replicas, [c.with_options(**options) for c in self.clients], role=self.role,
+                      lock=self._lock)
+
+    def _pick(self, tried=()) -> int:
+        now = time.monotonic()
+        with self._lock:
+            left = [i for i in range(len(self.replicas)) if i not in tried]
+            healthy = [i for i in left if self.replicas[i].ejected_until <= now]
+            if not healthy:
+                # everything left is ejected: probe the replica that comes back first
+                healthy = [min(left, key=lambda i: self.replicas[i].ejected_until)]
+            start = next(self._rr) % len(healthy)   # rotate tie-breaks so idle replicas share load
+            i = min(healthy[start:] + healthy[:start], key=lambda i: self.replicas[i].outstanding)
+            r = self.replicas[i]
+            r.outstanding += 1
+            r.requests += 1
+        metrics.ROUTER_OUTSTANDING.inc(role=self.role, replica=r.url)
+        return i
+
+    def _done(self, r: Replica, ok: bool) -> None:
+        with self._lock:
+            r.outstanding -= 1
+            if ok:
+                r.failures = 0
+                r.ejections = 0
+            else:
+                r.errors += 1
+                r.failures += 1
+                # r.ejections is only cleared by a success, so a failed probe after a cool-down re-ejects
+                if r.failures >= EJECT_AFTER or r.ejections:
+                    r.ejected_until = time.monotonic() + min(MAX_EJECT_SECONDS, EJECT_SECONDS * 2 ** r.ejections)
+                    r.ejections += 1
+                    r.failures = 0
+                    metrics.ROUTER_EJECTIONS.inc(role=self.role, replica=r.url)
+        metrics.ROUTER_OUTSTANDING.dec(role=self.role, replica=r.url)
+
+    def _create(self, **kwargs):
+        # A replica fault fails over to the next replica not tried yet; the caller
+        # only sees it once every replica has failed this request.
+        tried = set()
+        while True:
+            i = self._pick(tried)
+            r = self.replicas[i]
+            try:
+                resp = self.clients[i].chat.completions.create(**kwargs)
+                break
+            except Exception as e:
+                fault = _is_replica_fault(e)
+                self._done(r, not fault)
+                tried.add(i)
+                if not fault or len(tried) == len(self.replicas):
+                    raise
+                metrics.ROUTER_FAILOVERS.inc(role=self.role, replica=r.url)
+        if kwargs.get("stream") and not hasattr(resp, "choices"):
+            return _TrackedStream(resp, lambda ok: self._done(r, ok))
+        self._done(r, True)
+        return resp
+
+    def stats(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [{"url": r.url, "requests": r.requests, "errors": r.errors, "outstanding": r.outstanding,
+                     "ejected": r.ejected_until > now} for r in self.replicas]
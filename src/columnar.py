@@ -0,0 +1,224 @@
+# src/columnar.py
+"""
+Columnar (Parquet) export of the benchmark history and a DuckDB-backed,
+sqlite-compatible connection over it.
+
+Layout under out_dir:
+  results/run_date=YYYY-MM-DD/model=<solve_model>/part-<first>-<last>.parquet
+  questions/part-<first>-<last>.parquet
+  runs.parquet          (rewritten on every export; runs are updated in place)
+
+Results and questions are append-only, so exports are incremental on rowid.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import quote
+
+from .store import _set_state
+
+CHUNK_ROWS = 50_000
+
+RESULTS_SQL = """
+    SELECT r.rowid AS result_rowid, r.result_id, r.run_id, r.question_id,
+           r.score, r.confidence, r.latency_ms, r.created_at,
+           r.correctness, r.completeness, r.clarity, r.passed, r.rejudged,
+           r.disagreement, r.reason, r.grader,
+           q.category, q.difficulty, q.domain,
+           ru.run_at, ru.solve_model, ru.judge_model
+    FROM results r
+    JOIN questions q ON q.question_id = r.question_id
+    JOIN runs ru ON ru.run_id = r.run_id
+    WHERE r.rowid > ? AND r.rowid <= ?
+    ORDER BY r.rowid
+"""
+
+QUESTIONS_SQL = """
+    SELECT rowid AS question_rowid, question_id, created_at, domain, category, difficulty, prompt, prompt_hash, check_json
+    FROM questions
+    WHERE rowid > ? AND rowid <= ?
+    ORDER BY rowid
+"""
+
+
+def _require(module: str):
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise RuntimeError(f"The columnar engine needs `{module}` (pip install {module}).") from e
+
+
+def _schemas():
+    pa = _require("pyarrow")
+    results = pa.schema([
+        ("result_rowid", pa.int64()), ("result_id", pa.string()), ("run_id", pa.string()),
+        ("question_id", pa.string()), ("score", pa.float64()), ("confidence", pa.float64()),
+        ("latency_ms", pa.int64()), ("created_at", pa.string()),
+        ("correctness", pa.float64()), ("completeness", pa.float64()), ("clarity", pa.float64()),
+        ("passed", pa.int64()), ("rejudged", pa.int64()), ("disagreement", pa.float64()),
+        ("reason", pa.string()), ("grader", pa.string()),
+        ("category", pa.string()), ("difficulty", pa.int64()), ("domain", pa.string()),
+        ("run_at", pa.string()), ("solve_model", pa.string()), ("judge_model", pa.string()),
+    ])
+    questions = pa.schema([
+        ("question_rowid", pa.int64()), ("question_id", pa.string()), ("created_at", pa.string()),
+        ("domain", pa.string()), ("category", pa.string()), ("difficulty", pa.int64()),
+        ("prompt", pa.string()), ("prompt_hash", pa.string()), ("check_json", pa.string()),
+    ])
+    return results, questions
+
+
+def _write(rows: List[dict], schema, path: Path) -> None:
+    pa = _require("pyarrow")
+    import pyarrow.parquet as pq
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pylist(rows, schema=schema)
+    pq.write_table(table, path)
+
+
+def _last_rowid(con, key: str) -> int:
+    row = con.execute("SELECT value FROM state WHERE key=?", (key,)).fetchone()
+    return int(row["value"]) if row else 0
+
+
+def export_columnar(con, out_dir: str = "data/columnar") -> Dict[str, int]:
+    """
+    Append results/questions written since the last export as Parquet files
+    partitioned by run date and solve model. Returns counts of exported rows.
+    """
+    results_schema, questions_schema = _schemas()
+    out = Path(out_dir)
+
+    # --- questions (append-only) ---
+    q_last = _last_rowid(con, "columnar_last_question_rowid")
+    q_max = con.execute("SELECT COALESCE(MAX(rowid), 0) AS m FROM questions").fetchone()["m"]
+    n_questions = 0
+    cur = con.execute(QUESTIONS_SQL, (q_last, q_max))
+    while True:
+        chunk = [dict(r) for r in cur.fetchmany(CHUNK_ROWS)]
+        if not chunk:
+            break
+        first, last = chunk[0]["question_rowid"], chunk[-1]["question_rowid"]
+        _write(chunk, questions_schema, out / "questions" / f"part-{first:012d}-{last:012d}.parquet")
+        n_questions += len(chunk)
+
+    # --- results (append-only), partitioned by run date / solve model ---
+    r_last = _last_rowid(con, "columnar_last_result_rowid")
+    r_max = con.execute("SELECT COALESCE(MAX(rowid), 0) AS m FROM results").fetchone()["m"]
+    n_results = 0
+    cur = con.execute(RESULTS_SQL, (r_last, r_max))
+    while True:
+        chunk = [dict(r) for r in cur.fetchmany(CHUNK_ROWS)]
+        if not chunk:
+            break
+        parts: Dict[Tuple[str, str], List[dict]] = {}
+        for r in chunk:
+            parts.setdefault((r["run_at"][:10], r["solve_model"]), []).append(r)
+        for (run_date, model), rows in parts.items():
+            first, last = rows[0]["result_rowid"], rows[-1]["result_rowid"]
+            path = (out / "results" / f"run_date={run_date}" / f"model={quote(model, safe='')}"
+                    / f"part-{first:012d}-{last:012d}.parquet")
+            _write(rows, results_schema, path)
+        n_results += len(chunk)
+
+    # --- runs (small, mutable): full snapshot ---
+    runs = [dict(r) for r in con.execute("SELECT * FROM runs ORDER BY run_at").fetchall()]
+    if runs:
+        pa = _require("pyarrow")
+        import pyarrow.parquet as pq
+        out.mkdir(parents=True, exist_ok=True)
+        pq.write_table(pa.Table.from_pylist(runs), out / "runs.parquet")
+
+    _set_state(con, "columnar_last_question_rowid", str(q_max))
+    _set_state(con, "columnar_last_result_rowid", str(r_max))
+    con.commit()
+
+    return {"questions": n_questions, "results": n_results, "runs": len(runs)}
+
+
+def _row_type(cols: List[str]):
+    """Tuple rows addressable by name or position, like sqlite3.Row."""
+    index = {c: i for i, c in enumerate(cols)}
+
+    class Row(tuple):
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            return tuple.__getitem__(self, index[key] if isinstance(key, str) else key)
+
+        def keys(self):
+            return list(cols)
+
+    return Row
+
+
+class _Cursor:
+    def __init__(self, cur):
+        self._cur = cur
+        self._row = _row_type([d[0] for d in cur.description] if cur.description else [])
+
+    def fetchall(self) -> list:
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def fetchone(self):
+        r = self._cur.fetchone()
+        return self._row(r) if r is not None else None
+
+
+class DuckConnection:
+    """
+    Minimal sqlite3-compatible facade over DuckDB, with `results`, `questions`
+    and `runs` views on the Parquet export. The analytics SQL runs unchanged.
+    """
+
+    def __init__(self, columnar_dir: str = "data/columnar"):
+        duckdb = _require("duckdb")
+        base = Path(columnar_dir)
+        if not (base / "runs.parquet").exists():
+            raise RuntimeError(f"No columnar export in {columnar_dir}. Run `export-columnar` first.")
+        self._db = duckdb.connect()
+        results_schema, questions_schema = _schemas()
+
+        if any((base / "results").glob("**/*.parquet")):
+            self._db.execute(f"""
+                CREATE VIEW results AS
+                SELECT * EXCLUDE (run_date, model)
+                FROM read_parquet('{(base / "results" / "**" / "*.parquet").as_posix()}', hive_partitioning = true)
+            """)
+        else:
+            self._db.register("results", results_schema.empty_table())
+
+        if any((base / "questions").glob("*.parquet")):
+            self._db.execute(f"""
+                CREATE VIEW questions AS
+                SELECT * FROM read_parquet('{(base / "questions" / "*.parquet").as_posix()}')
+            """)
+        else:
+            self._db.register("questions", questions_schema.empty_table())
+
+        self._db.execute(f"CREATE VIEW runs AS SELECT * FROM read_parquet('{(base / 'runs.parquet').as_posix()}')")
+
+        # The SQLite store keeps rollups incrementally; here they are vectorized views.
+        self._db.execute("""
+            CREATE VIEW rollup_run AS
+            SELECT category, difficulty, run_id, solve_model,
+                   COUNT(*) AS n, SUM(score) AS sum, SUM(score * score) AS sumsq,
+                   SUM(COALESCE(disagreement, 0.0)) AS dis_sum
+            FROM results
+            GROUP BY category, difficulty, run_id, solve_model
+        """)
+        self._db.execute("""
+            CREATE VIEW rollup_total AS
+            SELECT category, difficulty, solve_model,
+                   COUNT(*) AS n, SUM(score) AS sum, SUM(score * score) AS sumsq,
+                   SUM(COALESCE(disagreement, 0.0)) AS dis_sum
+            FROM results
+            GROUP BY category, difficulty, solve_model
+        """)
+
+    def execute(self, sql: str, params=()) -> _Cursor:
+        return _Cursor(self._db.execute(sql, list(params)))
+
+    def close(self) -> None:
+        self._db.close()
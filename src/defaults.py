@@ -0,0 +1,10 @@
+# src/defaults.py
+"""
+Defaults shared by scripts/bench.py and the modules that implement them. This
+module imports nothing, so the CLI can build its parser without loading them.
+"""
+ALLOCATORS = ("weakness", "thompson", "ucb")
+EMA_ALPHA = 0.2
+DIFFICULTY_STEP = 0.02     # EMA change needed to move the target difficulty
+REJUDGE_POLICIES = ("confidence", "cost")
+REJUDGE_BUDGET = 0.2       # share of LLM-judged items rejudged under the "cost" policy
@@ -1,27 +1,24 @@
 from typing import Dict, List
 import random
 
+from .taxonomy import rollup_stats
+
 CATEGORIES = ["reasoning", "math", "logic", "factual", "instruction_following"]
 
-def category_means(con) -> Dict[str, float]:
-    rows = con.execute("""
-        SELECT q.category AS category, AVG(r.score) AS mean_score, COUNT(*) AS n
-        FROM results r
-        JOIN questions q ON q.question_id = r.question_id
-        GROUP BY q.category
-    """).fetchall()
+def category_means(con, node: str = None) -> Dict[str, float]:
+    # Served from the rollup table: O(categories × difficulties), independent of history size.
+    # Category paths fold into their top-level category, or into the units of `node` (see taxonomy.py).
+    return {c: float(m) for c, (m, _) in rollup_stats(con, node).items()}
 
-    means = {}
-    for row in rows:
-        means[row["category"]] = float(row["mean_score"])
-    return means
+WEIGHT_FLOOR = 0.05
 
-def category_weights(means: Dict[str, float], categories: List[str] = CATEGORIES) -> Dict[str, float]:
+def category_weights(means: Dict[str, float], categories: List[str] = CATEGORIES,
+                     floor: float = WEIGHT_FLOOR) -> Dict[str, float]:
     # Higher weight for weaker categories
     w = {}
     for c in categories:
         m = means.get(c, 0.5)  # unseen categories treated as medium
-        w[c] = max(0.05, 1.0 - m)
+        w[c] = max(floor, 1.0 - m)
     s = sum(w.values())
     return {k: v / s for k, v in w.items()}
 
@@ -0,0 +1,226 @@
+# src/export.py
+"""
+Streaming, sharded export of the question bank or the result history to
+JSONL or CSV, optionally gzip-compressed.
+
+Rows are read from one cursor with fetchmany(BATCH_ROWS) and written straight
+out, so memory stays flat whatever the history size. Output rolls over to a
+new shard once the current one reaches `shard_bytes` on disk (checked after
+each batch, so shards overshoot by at most one batch). Filters (run_at range,
+solve model, category subtree, domain) are part of the SQL WHERE clause.
+
+out_dir/manifest-<kind>.json lists every shard with its row count, size, sha256 and
+rowid range, plus the filters and the column list. Gzip shards are written
+with mtime=0, so re-exporting the same rows gives byte-identical shards and
+checksums.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .blobs import get_blob
+from .taxonomy import normalize, subtree_sql
+from .utils import now_iso
+
+KINDS = ("results", "questions")
+FORMATS = ("jsonl", "csv")
+BATCH_ROWS = 5000
+DEFAULT_SHARD_MB = 256
+GZIP_LEVEL = 6   # level 9 (the gzip default) is ~3x slower for a few percent smaller shards
+
+RESULTS_SQL = """
+    SELECT r.rowid AS result_rowid, r.result_id, r.run_id, r.question_id,
+           r.score, r.confidence, r.latency_ms, r.created_at,
+           r.correctness, r.completeness, r.clarity, r.passed, r.rejudged,
+           r.disagreement, r.reason, r.grader, r.answer_hash,
+           q.category, q.difficulty, q.domain,
+           ru.run_at, ru.solve_model, ru.judge_model
+    FROM results r
+    JOIN questions q ON q.question_id = r.question_id
+    JOIN runs ru ON ru.run_id = r.run_id
+    WHERE {where}
+    ORDER BY r.rowid
+"""
+
+QUESTIONS_SQL = """
+    SELECT q.rowid AS question_rowid, q.question_id, q.created_at, q.domain, q.category, q.difficulty,
+           q.prompt, q.prompt_hash, q.check_json
+    FROM questions q
+    WHERE {where}
+    ORDER BY q.rowid
+"""
+
+
+def _filters(kind: str, since: str = None, until: str = None, model: str = None,
+             category: str = None, domain: str = None):
+    """(WHERE clause, params). Run filters on a question export keep questions with a matching result."""
+    run_clauses, params = [], []
+    if since:
+        run_clauses.append("ru.run_at >= ?")
+        params.append(since)
+    if until:
+        run_clauses.append("ru.run_at < ?")
+        params.append(until)
+    if model:
+        run_clauses.append("ru.solve_model = ?")
+        params.append(model)
+    clauses = []
+    if kind == "results":
+        clauses += run_clauses
+    elif run_clauses:
+        clauses.append("EXISTS (SELECT 1 FROM results r JOIN runs ru ON ru.run_id = r.run_id "
+                       f"WHERE r.question_id = q.question_id AND {' AND '.join(run_clauses)})")
+    if category:
+        # a category path matches its whole subtree (see taxonomy.py)
+        match, args = subtree_sql("q.category", category)
+        clauses.append(match)
+        params.extend(args)
+    if domain:
+        clauses.append("q.domain = ?")
+        params.append(domain)
+    return " AND ".join(clauses) or "1", params
+
+
+class _Shard:
+    """One output file: counts and hashes the bytes as they reach the disk."""
+
+    def __init__(self, path: Path, compress: bool):
+        self.path = path
+        self.rows = 0
+        self.bytes = 0
+        self.first = self.last = None
+        self._sha = hashlib.sha256()
+        self._raw = open(path, "wb")
+        self._out = (gzip.GzipFile(filename="", mode="wb", fileobj=self, mtime=0, compresslevel=GZIP_LEVEL)
+                     if compress else self)
+
+    # file protocol for GzipFile
+    def write(self, b) -> int:
+        self._sha.update(b)
+        self.bytes += len(b)
+        return self._raw.write(b)
+
+    def flush(self) -> None:
+        self._raw.flush()
+
+    def add(self, data: bytes, n: int, first: int, last: int) -> None:
+        self._out.write(data)
+        if self._out is not self:
+            self._out.flush()   # hand buffered output to _raw so `bytes` tracks the file size
+        self.rows += n
+        self.first = first if self.first is None else self.first
+        self.last = last
+
+    def close(self) -> Dict:
+        if self._out is not self:
+            self._out.close()
+        self._raw.close()
+        return {"file": self.path.name, "rows": self.rows, "bytes": self.bytes, "sha256": self._sha.hexdigest(),
+                "first_rowid": self.first, "last_rowid": self.last}
+
+
+_to_json = json.JSONEncoder(ensure_ascii=False, check_circular=False).encode
+
+
+def _encode(fmt: str, columns: List[str], rows: List[tuple], header: bool) -> bytes:
+    if fmt == "jsonl":
+        return "".join(_to_json(dict(zip(columns, r))) + "\n" for r in rows).encode("utf-8")
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    if header:
+        w.writerow(columns)
+    w.writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
+
+def export_sharded(con, out_dir: str, *, kind: str = "results", fmt: str = "jsonl", compress: bool = True,
+                   shard_bytes: int = DEFAULT_SHARD_MB << 20, since: str = None, until: str = None,
+                   model: str = None, category: str = None, domain: str = None,
+                   answers: bool = False, on_shard=None) -> Dict:
+    """
+    Export `kind` rows matching the filters into shards under out_dir and
+    write manifest-<kind>.json. `since`/`until` bound runs.run_at (until exclusive).
+    `answers` adds each result's answer text from the blob store. Old shards of
+    the same kind in out_dir are removed first. Returns the manifest.
+    """
+    if kind not in KINDS:
+        raise RuntimeError(f"Unknown export kind {kind!r} (expected one of {KINDS}).")
+    if fmt not in FORMATS:
+        raise RuntimeError(f"Unknown export format {fmt!r} (expected one of {FORMATS}).")
+    if answers and kind != "results":
+        raise RuntimeError("Answers can only be exported with --kind results.")
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    for old in out.glob(f"{kind}-[0-9][0-9][0-9][0-9][0-9].*"):
+        old.unlink()
+
+    category = normalize(category) or None
+    filters = {"since": since, "until": until, "model": model, "category": category, "domain": domain}
+    where, params = _filters(kind, **filters)
+    cur = con.cursor()
+    cur.execute((RESULTS_SQL if kind == "results" else QUESTIONS_SQL).format(where=where), params)
+    columns = [d[0] for d in cur.description]
+    if answers:
+        answer_at = columns.index("answer_hash")
+        blobs = con.cursor()
+        columns = columns + ["answer"]
+    suffix = f".{fmt}" + (".gz" if compress else "")
+
+    shards: List[Dict] = []
+    shard: Optional[_Shard] = None
+    n_rows = 0
+    while True:
+        batch = cur.fetchmany(BATCH_ROWS)
+        if not batch:
+            break
+        rows = [tuple(r) for r in batch]
+        if answers:
+            rows = [r + (get_blob(blobs, r[answer_at]),) for r in rows]
+        if shard is None:
+            shard = _Shard(out / f"{kind}-{len(shards):05d}{suffix}", compress)
+        shard.add(_encode(fmt, columns, rows, header=shard.rows == 0), len(rows), rows[0][0], rows[-1][0])
+        n_rows += len(rows)
+        if shard.bytes >= shard_bytes:
+            shards.append(shard.close())
+            shard = None
+            if on_shard:
+                on_shard(shards[-1])
+    if shard is not None:
+        shards.append(shard.close())
+        if on_shard:
+            on_shard(shards[-1])
+
+    manifest = {
+        "kind": kind, "format": fmt, "compression": "gzip" if compress else None, "exported_at": now_iso(),
+        "filters": {k: v for k, v in filters.items() if v}, "columns": columns, "rows": n_rows,
+        "bytes": sum(s["bytes"] for s in shards), "shards": shards,
+    }
+    (out / f"manifest-{kind}.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def verify_manifest(out_dir: str, kind: str = "results") -> List[str]:
+    """Re-hash every shard listed in out_dir/manifest-<kind>.json; returns the files that do not match."""
+    out = Path(out_dir)
+    path = out / f"manifest-{kind}.json"
+    if not path.exists():
+        raise RuntimeError(f"No {path.name} in {out_dir}. Run `export --kind {kind}` first.")
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    bad = []
+    for s in manifest["shards"]:
+        sha = hashlib.sha256()
+        try:
+            with open(out / s["file"], "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+        except FileNotFoundError:
+            bad.append(s["file"])
+            continue
+        if sha.hexdigest() != s["sha256"]:
+            bad.append(s["file"])
+    return bad
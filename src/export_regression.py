@@ -1,10 +1,13 @@
 import json
+import sqlite3
+
+from .export import BATCH_ROWS
 
 def export_regression(con, out_path: str, k: int = 20) -> int:
     con.row_factory = sqlite3.Row  # <-- key line
     cur = con.cursor()
 
-    rows = cur.execute("""
+    cur.execute("""
         SELECT
             q.question_id,
             q.category,
@@ -16,10 +19,17 @@ def export_regression(con, out_path: str, k: int = 20) -> int:
         GROUP BY q.question_id
         ORDER BY worst_score ASC
         LIMIT ?
-    """, (k,)).fetchall()
+    """, (k,))
 
+    n = 0
     with open(out_path, "w", encoding="utf-8") as f:
-        for row in rows:
-            f.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+        # stream: k can be the whole bank
+        while True:
+            rows = cur.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                f.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+            n += len(rows)
 
-    return len(rows)
+    return n
@@ -0,0 +1,183 @@
+# src/failures.py
+"""
+Incremental failure index behind the generator's "failure themes".
+
+Every failing result (score < FAIL_THRESHOLD) adds its judge or grader
+reasons to failure_clusters, keyed by (domain, category, signature). The
+signature is the sorted set of content-word stems. Rephrasings such as
+"Missed a constraint" and "missing constraints." therefore share a cluster.
+
+Counts decay with a half-life of HALF_LIFE_HOURS. The index uses forward
+decay: an event at time t adds 2^((t - ref) / half-life) to its cluster's
+mass. Ordering by mass equals ordering by decayed count at any later time,
+so the (domain, mass) index returns the top clusters by reading k rows.
+Once increments pass 2^RESCALE_HALF_LIVES, all masses are scaled down, `ref`
+moves forward, and clusters that have decayed away are dropped.
+"""
+import json
+import re
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from .blobs import decompress
+
+FAIL_THRESHOLD = 0.7
+HALF_LIFE_HOURS = 72.0
+RESCALE_HALF_LIVES = 40
+PRUNE_MASS = 1e-3          # relative to one fresh event
+MAX_TERMS = 12
+MAX_REASONS = 5
+REF_KEY = "failure_index_ref"
+
+FAILURES_SQL = """
+CREATE TABLE IF NOT EXISTS failure_clusters (
+  domain TEXT NOT NULL,
+  category TEXT NOT NULL,
+  signature TEXT NOT NULL,
+  exemplar TEXT NOT NULL,
+  n INTEGER NOT NULL,
+  mass REAL NOT NULL,
+  last_seen TEXT NOT NULL,
+  PRIMARY KEY (domain, category, signature)
+);
+CREATE INDEX IF NOT EXISTS idx_failure_clusters_mass ON failure_clusters(domain, mass DESC);
+"""
+
+_WORD = re.compile(r"[a-z]+")
+# "not" is deliberately absent: in "does not follow the format" it is the failure
+STOPWORDS = frozenset("""
+a an the and or but of to in on for with at by from into as is are was were be been being it its
+this that these those there their they them he she his her which who what when where how than then
+so too very also just only any some all each both more most other such own same can could should
+would will may might must do does did has have had answer response question model""".split())
+
+_UPSERT = """
+INSERT INTO failure_clusters(domain, category, signature, exemplar, n, mass, last_seen)
+VALUES(?,?,?,?,?,?,?)
+ON CONFLICT(domain, category, signature) DO UPDATE SET
+  n = n + excluded.n,
+  mass = mass + excluded.mass,
+  exemplar = CASE WHEN excluded.last_seen >= last_seen THEN excluded.exemplar ELSE exemplar END,
+  last_seen = MAX(last_seen, excluded.last_seen)
+"""
+
+
+def _stem(w: str) -> str:
+    for suffix in ("ing", "ed", "es", "s", "ly"):
+        if w.endswith(suffix) and len(w) - len(suffix) >= 3:
+            return w[:-len(suffix)]
+    return w
+
+
+def signature(reason: str) -> str:
+    stems = {_stem(w) for w in _WORD.findall(str(reason).lower()) if len(w) > 2 and w not in STOPWORDS}
+    return " ".join(sorted(stems)[:MAX_TERMS])
+
+
+def _clusters(reasons: Iterable[str]) -> List[Tuple[str, str]]:
+    """(signature, exemplar) per distinct signature among a result's first MAX_REASONS reasons."""
+    out, seen = [], set()
+    for reason in list(reasons)[:MAX_REASONS]:
+        sig = signature(reason)
+        if sig and sig not in seen:
+            seen.add(sig)
+            out.append((sig, str(reason).strip()[:300]))
+    return out
+
+
+def _hours(ts: str) -> float:
+    return datetime.fromisoformat(ts).timestamp() / 3600.0
+
+
+def _get_ref(con) -> Optional[float]:
+    row = con.execute("SELECT value FROM state WHERE key=?", (REF_KEY,)).fetchone()
+    return float(row[0]) if row else None
+
+
+def _set_ref(con, ref: float) -> None:
+    con.execute("INSERT INTO state(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (REF_KEY, repr(ref)))
+
+
+def _rescale(con, ref: float, new_ref: float) -> None:
+    con.execute("UPDATE failure_clusters SET mass = mass * ?", (2.0 ** ((ref - new_ref) / HALF_LIFE_HOURS),))
+    con.execute("DELETE FROM failure_clusters WHERE mass < ?", (PRUNE_MASS,))
+    _set_ref(con, new_ref)
+
+
+def record_failure(con, *, question_id: str, reasons: Iterable[str], score: float, created_at: str) -> None:
+    """Add a result's reasons to the index (caller commits). Passing results are ignored."""
+    if score >= FAIL_THRESHOLD or not reasons:
+        return
+    q = con.execute("SELECT domain, category FROM questions WHERE question_id=?", (question_id,)).fetchone()
+    if q is None:
+        return
+    t = _hours(created_at)
+    ref = _get_ref(con)
+    if ref is None:
+        ref = t
+        _set_ref(con, ref)
+    elif (t - ref) / HALF_LIFE_HOURS > RESCALE_HALF_LIVES:
+        _rescale(con, ref, t)
+        ref = t
+    mass = 2.0 ** ((t - ref) / HALF_LIFE_HOURS)
+
+    for sig, exemplar in _clusters(reasons):
+        con.execute(_UPSERT, (q[0], q[1], sig, exemplar, 1, mass, created_at))
+
+
+def _stored_reasons(codec: Optional[str], data: Optional[bytes], inline: Optional[str], first: str) -> List[str]:
+    """A result's judge reasons from its blob (or pre-compaction judge_json); just `first` if unreadable."""
+    try:
+        raw = decompress(codec, data) if codec is not None else inline
+        reasons = json.loads(raw).get("reasons") if raw else None
+    except (ValueError, AttributeError, RuntimeError):
+        reasons = None
+    return [str(r) for r in reasons] if isinstance(reasons, list) and reasons else [first]
+
+
+def rebuild(con) -> int:
+    """
+    Rebuild the index from results with the same reasons record_failure used:
+    each result's stored judge reasons (results.reason alone when there is no
+    judge payload). Returns the cluster count (caller commits).
+    """
+    latest = con.execute("SELECT MAX(created_at) FROM results WHERE score < ?", (FAIL_THRESHOLD,)).fetchone()[0]
+    con.execute("DELETE FROM failure_clusters")
+    if latest is None:
+        return 0
+    ref = _hours(latest)
+
+    inline = "r.judge_json" if "judge_json" in {r[1] for r in con.execute("PRAGMA table_info(results)")} else "NULL"
+    clusters = {}
+    for domain, category, reason, created_at, codec, data, judge_json in con.execute(f"""
+        SELECT q.domain, q.category, r.reason, r.created_at, b.codec, b.data, {inline}
+        FROM results r
+        JOIN questions q ON q.question_id = r.question_id
+        LEFT JOIN blobs b ON b.hash = r.judge_hash
+        WHERE r.score < ? AND r.reason IS NOT NULL
+    """, (FAIL_THRESHOLD,)):
+        mass = 2.0 ** ((_hours(created_at) - ref) / HALF_LIFE_HOURS)
+        for sig, exemplar in _clusters(_stored_reasons(codec, data, judge_json, reason)):
+            c = clusters.setdefault((domain, category, sig), [exemplar, 0, 0.0, created_at])
+            c[1] += 1
+            c[2] += mass
+            if created_at >= c[3]:
+                c[0], c[3] = exemplar, created_at
+
+    con.executemany(_UPSERT, [(domain, category, sig, str(exemplar).strip()[:300], n, mass, last_seen)
+                              for (domain, category, sig), (exemplar, n, mass, last_seen) in clusters.items()
+                              if mass >= PRUNE_MASS])
+    _set_ref(con, ref)
+    return con.execute("SELECT COUNT(*) FROM failure_clusters").fetchone()[0]
+
+
+def top_themes(con, domain: str, k: int = 8) -> List[str]:
+    """The k heaviest current failure clusters as "reason (category)" lines."""
+    rows = con.execute("""
+        SELECT category, exemplar FROM failure_clusters
+        WHERE domain = ?
+        ORDER BY mass DESC
+        LIMIT ?
+    """, (domain, k)).fetchall()
+    return [f"{r[1]} ({r[0]})" for r in rows]
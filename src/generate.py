@@ -2,20 +2,27 @@ import json
 from typing import List, Dict
 from .utils import new_id, now_iso, sha256_text
 from .openai_safe import chat_create_safe, ModelCaps
-from .evolve import CATEGORIES, category_means, category_weights, sample_categories
+from .evolve import CATEGORIES, sample_categories
+from .graders import GRADERS, parse_check
+from .store import get_scoped_state
+from . import bandit, failures, metrics, taxonomy, tracing
 
 GEN_SYSTEM = "You generate novel benchmark questions for evaluating LLMs."
 
+# Layout for server-side prompt caching: the instructions (fixed per with_checks)
+# and the append-only prior-question list come first, so consecutive generator
+# calls share a long byte-identical prefix. Per-call values go last.
 GEN_USER_TEMPLATE = """
-Generate {n} novel questions for an LLM benchmark.
+Generate novel questions for an LLM benchmark.
 
 Return ONLY valid JSON: a list of objects, each with keys:
-- category: one of {categories}
+- category: a lowercase category path "<category>/<subcategory>" ("/"-separated, deeper levels allowed),
+  where <category> is one of {categories} or a category named in the requested mix below
 - difficulty: integer 1..5
-- prompt: string
+- prompt: string{check_block}
 
 Hard constraints:
-- Every question must be novel vs the prior list below (no repeats, no paraphrases).
+- Every question must be novel vs the prior questions listed below (no repeats, no paraphrases).
 - Avoid the same template with different numbers/entities.
 - Keep prompts self-contained.
 
@@ -26,87 +33,106 @@ Difficulty scale (must follow these anchors):
 - 4: multi-step + constraints/edge cases/traps; requires structured reasoning.
 - 5: hardest: multi-step + strict constraints + plausible pitfalls; cannot be solved by a single fact or a single arithmetic step; still self-contained and judgeable.
 
-Target difficulty: {target_difficulty}/5
-
 Difficulty distribution rule (independent of n):
-- At least 60% of the questions must have difficulty >= {target_difficulty}.
+- At least 60% of the questions must have difficulty >= the target difficulty given below.
 - The remaining questions can be any difficulty 1..5 to preserve diversity.
 
+Prior questions to avoid:
+{prior_prompts}
+
+This request:
+Generate {n} novel questions.
+Target difficulty: {target_difficulty}/5
 Requested category mix (approximate): {requested_mix}
 
 Common failure themes to target (optional inspiration):
 {failure_themes}
-
-Prior questions to avoid:
-{prior_prompts}
 """
 
-def _get_state(con, key: str, default: str) -> str:
-    row = con.execute("SELECT value FROM state WHERE key=?", (key,)).fetchone()
-    return row["value"] if row else default
-
-def fetch_prior_prompts(con, limit: int = 200) -> List[str]:
-    rows = con.execute("SELECT prompt FROM questions ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+CHECK_BLOCK = """
+- check (optional): a machine-checkable reference, ONLY when the answer can be verified mechanically
+  (mostly math and instruction_following). One of:
+  {{"type": "numeric", "expected": 42, "tolerance": 1e-6}}  -- the final number in the answer
+  {{"type": "regex", "pattern": "...", "flags": "i"}}       -- the answer must match the pattern
+  {{"type": "json", "required_keys": ["..."]}}              -- the answer must be valid JSON
+  {{"type": "constraints", "min_words": 0, "max_words": 50, "num_lines": 3,
+    "must_include": ["..."], "must_exclude": ["..."], "lowercase": false}}
+  Omit the key when the answer needs judgment.
+  Allowed types: {check_types}"""
+
+DEFAULT_DOMAIN = "general"   # questions generated without --domain are filed here
+PRIOR_BLOCK = 50
+
+def fetch_prior_prompts(con, limit: int = 200, block: int = PRIOR_BLOCK) -> List[str]:
+    """
+    The latest `limit` to `limit + block` prompts, oldest first. The window starts
+    on a multiple of `block` rowids, so it only slides every `block` inserts and
+    new prompts append at the end, keeping the listed prefix cacheable.
+    """
+    top = con.execute("SELECT MAX(rowid) FROM questions").fetchone()[0] or 0
+    start = max(0, (top - limit) // block * block)
+    rows = con.execute("SELECT prompt FROM questions WHERE rowid > ? ORDER BY rowid", (start,)).fetchall()
     return [r["prompt"] for r in rows]
 
-def fetch_failure_themes(con, k: int = 8) -> List[str]:
-    # Pull worst results and extract first reason lines
-    rows = con.execute("""
-        SELECT r.judge_json
-        FROM results r
-        ORDER BY r.score ASC
-        LIMIT ?
-    """, (k,)).fetchall()
-
-    themes = []
-    for row in rows:
-        try:
-            j = json.loads(row["judge_json"])
-            rs = j.get("reasons", [])
-            if isinstance(rs, list) and rs:
-                themes.append(str(rs[0]))
-        except Exception:
-            continue
-
-    # de-dup lightly
-    out = []
-    seen = set()
-    for t in themes:
-        key = t.strip().lower()
-        if key and key not in seen:
-            seen.add(key)
-            out.append(t.strip())
-    return out[:k]
-
-def _requested_mix_from_history(con, n: int) -> str:
-    means = category_means(con)
-    weights = category_weights(means, CATEGORIES)
+def fetch_failure_themes(con, k: int = 8, domain: str = "general") -> List[str]:
+    # Heaviest recency-weighted failure clusters (maintained as results are written)
+    return failures.top_themes(con, domain, k=k)
+
+def _requested_mix_from_history(con, n: int, allocator: str = "weakness", solve_model: str = None,
+                                domain: str = None, subtree: str = None) -> str:
+    units = taxonomy.units(con, subtree, first=CATEGORIES if subtree is None else ())
+    weights = bandit.allocation_weights(con, allocator, solve_model, domain, categories=units, slots=n,
+                                        node=subtree)
     sampled = sample_categories(weights, n)
-    counts = {c: 0 for c in CATEGORIES}
+    counts = {c: 0 for c in units}
     for s in sampled:
         counts[s] += 1
-    parts = [f"{c}:{counts[c]}" for c in CATEGORIES if counts[c] > 0]
+    parts = [f"{c}:{counts[c]}" for c in units if counts[c] > 0]
     return ", ".join(parts) if parts else "balanced"
 
-def generate_questions(client, caps: ModelCaps, con, model: str, n: int, domain: str = "general", max_attempts: int = 6) -> List[Dict]:
+def generate_questions(
+    client,
+    caps: ModelCaps,
+    con,
+    model: str,
+    n: int,
+    domain: str = None,
+    max_attempts: int = 6,
+    with_checks: bool = False,
+    solve_model: str = None,
+    allocator: str = "weakness",
+    subtree: str = None,
+) -> List[Dict]:
+    """
+    Category labels are normalized to taxonomy paths and registered in the
+    taxonomy. With `subtree`, the requested mix covers that path's units and
+    every question is filed under it. Questions are filed under `domain`
+    (DEFAULT_DOMAIN when None); target difficulty and allocation come from the
+    (solve_model, domain) state scope, which is "*" when None, as in run_benchmark.
+    """
     inserted: List[Dict] = []
     attempts = 0
 
-    target_difficulty = int(_get_state(con, "target_difficulty", "2"))
-    requested_mix = _requested_mix_from_history(con, n)
-    failures = fetch_failure_themes(con, k=8)
-    failure_block = "\n".join([f"- {t}" for t in failures]) if failures else "(none yet)"
+    with tracing.span("generate.history"):
+        # difficulty is tracked per (solve_model, domain); see store.state_key
+        target_difficulty = int(get_scoped_state(con, "target_difficulty", "2", solve_model, domain))
+        requested_mix = _requested_mix_from_history(con, n, allocator, solve_model, domain, subtree)
+        themes = fetch_failure_themes(con, k=8, domain=domain or DEFAULT_DOMAIN)
+    failure_block = "\n".join([f"- {t}" for t in themes]) if themes else "(none yet)"
+    check_block = CHECK_BLOCK.format(check_types=sorted(GRADERS)) if with_checks else ""
 
     while len(inserted) < n and attempts < max_attempts:
         attempts += 1
         need = n - len(inserted)
 
-        prior = fetch_prior_prompts(con, limit=200)
+        with tracing.span("generate.prior_prompts"):
+            prior = fetch_prior_prompts(con, limit=200)
         prior_block = "\n".join([f"- {p}" for p in prior]) if prior else "(none)"
 
         user_prompt = GEN_USER_TEMPLATE.format(
             n=need,
-            categories=CATEGORIES,
+            categories=[subtree] if subtree else CATEGORIES,
+            check_block=check_block,
             target_difficulty=target_difficulty,
             requested_mix=requested_mix,
             failure_themes=failure_block,
@@ -119,29 +145,44 @@ def generate_questions(client, caps: ModelCaps, con, model: str, n: int, domain:
             messages=[{"role": "system", "content": GEN_SYSTEM},
                       {"role": "user", "content": user_prompt}],
             temperature=1.0,
+            stage="generate",
         )
 
         raw = resp.choices[0].message.content
         items = json.loads(raw)
 
-        for it in items:
-            prompt = it["prompt"].strip()
-            h = sha256_text(prompt)
-
-            exists = con.execute("SELECT 1 FROM questions WHERE prompt_hash=?", (h,)).fetchone()
-            if exists:
-                continue
-
-            qid = new_id()
-            con.execute(
-                """INSERT INTO questions(question_id, created_at, domain, category, difficulty, prompt, prompt_hash)
-                   VALUES(?,?,?,?,?,?,?)""",
-                (qid, now_iso(), domain, it["category"], int(it["difficulty"]), prompt, h)
-            )
-            inserted.append({"question_id": qid, **it})
-
-        con.commit()
-
+        with tracing.span("generate.insert", n=len(items)):
+            for it in items:
+                prompt = it["prompt"].strip()
+                h = sha256_text(prompt)
+
+                exists = con.execute("SELECT 1 FROM questions WHERE prompt_hash=?", (h,)).fetchone()
+                if exists:
+                    continue
+
+                category = taxonomy.normalize(it.get("category"))
+                if not category:
+                    continue
+                if not taxonomy.within(category, subtree):
+                    category = f"{subtree}/{category.rsplit('/', 1)[-1]}"
+
+                check = parse_check(it.get("check")) if with_checks else None
+
+                qid = new_id()
+                cur = con.execute(
+                    """INSERT OR IGNORE INTO questions(question_id, created_at, domain, category, difficulty, prompt, prompt_hash, check_json)
+                       VALUES(?,?,?,?,?,?,?,?)""",
+                    (qid, now_iso(), domain or DEFAULT_DOMAIN, category, int(it["difficulty"]), prompt, h,
+                     json.dumps(check) if check else None)
+                )
+                if cur.rowcount == 0:
+                    continue  # another process inserted the same prompt concurrently
+                taxonomy.register(con, category)
+                inserted.append({"question_id": qid, **it, "category": category})
+
+            con.commit()
+
+    metrics.QUESTIONS_GENERATED.inc(len(inserted), domain=domain or DEFAULT_DOMAIN)
     if len(inserted) < n:
         raise RuntimeError(f"Only generated {len(inserted)}/{n} novel questions after {max_attempts} attempts.")
 
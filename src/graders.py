@@ -0,0 +1,156 @@
+# src/graders.py
+import json
+import re
+from typing import Callable, Dict, Optional
+
+# A grader takes (check_spec, answer) and returns a judge-shaped dict when the
+# answer can be scored mechanically, or None when the item is ambiguous and
+# should go to the LLM judge.
+Grader = Callable[[dict, str], Optional[dict]]
+
+GRADERS: Dict[str, Grader] = {}
+
+_NUM_RE = re.compile(r"-?\d+(?:,\d{3})*(?:\.\d+)?(?:[eE]-?\d+)?")
+
+
+def register_grader(kind: str) -> Callable[[Grader], Grader]:
+    def deco(fn: Grader) -> Grader:
+        GRADERS[kind] = fn
+        return fn
+    return deco
+
+
+def parse_check(raw) -> Optional[dict]:
+    """
+    Validate a generator-emitted check spec. Unknown or malformed specs are
+    dropped (the question is still stored and judged by the LLM).
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(raw, dict) or raw.get("type") not in GRADERS:
+        return None
+    return raw
+
+
+def _verdict(kind: str, score: float, reason: str) -> dict:
+    score = max(0.0, min(1.0, float(score)))
+    return {
+        "score": score,
+        "pass": score >= 0.7,
+        "reasons": [reason],
+        "rubric_breakdown": {"correctness": score, "completeness": score, "clarity": score},
+        "confidence": 1.0,
+        "grader": f"local:{kind}",
+    }
+
+
+def _to_float(s: str) -> Optional[float]:
+    try:
+        return float(s.replace(",", ""))
+    except ValueError:
+        return None
+
+
+@register_grader("numeric")
+def grade_numeric(check: dict, answer: str) -> Optional[dict]:
+    expected = _to_float(str(check.get("expected", "")))
+    if expected is None:
+        return None
+    tol = float(check.get("tolerance", 1e-6))
+    found = [v for v in (_to_float(m) for m in _NUM_RE.findall(answer)) if v is not None]
+    if not found:
+        return None
+
+    final = found[-1]
+    if abs(final - expected) <= tol * max(1.0, abs(expected)):
+        return _verdict("numeric", 1.0, f"Final value {final:g} matches expected {expected:g}.")
+    if any(abs(v - expected) <= tol * max(1.0, abs(expected)) for v in found[:-1]):
+        # Expected value appears but is not the final one: let the LLM decide.
+        return None
+    return _verdict("numeric", 0.0, f"Final value {final:g} does not match expected {expected:g}.")
+
+
+@register_grader("regex")
+def grade_regex(check: dict, answer: str) -> Optional[dict]:
+    pattern = check.get("pattern")
+    if not isinstance(pattern, str):
+        return None
+    flags = re.IGNORECASE if "i" in str(check.get("flags", "")) else 0
+    try:
+        ok = re.search(pattern, answer, flags) is not None
+    except re.error:
+        return None
+    if ok:
+        return _verdict("regex", 1.0, "Answer matches the required pattern.")
+    return _verdict("regex", 0.0, "Answer does not match the required pattern.")
+
+
+@register_grader("json")
+def grade_json(check: dict, answer: str) -> Optional[dict]:
+    s = answer.strip()
+    if s.startswith("```"):
+        s = s.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
+    try:
+        obj = json.loads(s)
+    except json.JSONDecodeError:
+        return _verdict("json", 0.0, "Answer is not valid JSON.")
+
+    required = check.get("required_keys") or []
+    if required:
+        if not isinstance(obj, dict):
+            return _verdict("json", 0.0, "Answer is JSON but not an object.")
+        missing = [k for k in required if k not in obj]
+        if missing:
+            frac = 1.0 - len(missing) / len(required)
+            return _verdict("json", frac, f"JSON is missing keys: {missing}.")
+    return _verdict("json", 1.0, "Answer is valid JSON with the required structure.")
+
+
+@register_grader("constraints")
+def grade_constraints(check: dict, answer: str) -> Optional[dict]:
+    """
+    Word/line/format constraints for instruction_following items, e.g.
+    {"type": "constraints", "max_words": 50, "must_include": ["apple"], "lowercase": true}
+    Score is the fraction of constraints satisfied.
+    """
+    words = len(answer.split())
+    lines = [ln for ln in answer.splitlines() if ln.strip()]
+    low = answer.lower()
+
+    results = []
+    if "min_words" in check:
+        results.append(("min_words", words >= int(check["min_words"])))
+    if "max_words" in check:
+        results.append(("max_words", words <= int(check["max_words"])))
+    if "num_lines" in check:
+        results.append(("num_lines", len(lines) == int(check["num_lines"])))
+    for w in check.get("must_include") or []:
+        results.append((f"include '{w}'", str(w).lower() in low))
+    for w in check.get("must_exclude") or []:
+        results.append((f"exclude '{w}'", str(w).lower() not in low))
+    if check.get("lowercase"):
+        results.append(("lowercase", answer == answer.lower()))
+    if check.get("uppercase"):
+        results.append(("uppercase", answer == answer.upper()))
+
+    if not results:
+        return None
+    failed = [name for name, ok in results if not ok]
+    score = 1.0 - len(failed) / len(results)
+    reason = f"Violated constraints: {failed}." if failed else "All constraints satisfied."
+    return _verdict("constraints", score, reason)
+
+
+def grade_locally(check: Optional[dict], answer: str) -> Optional[dict]:
+    if not check:
+        return None
+    fn = GRADERS.get(check.get("type"))
+    if fn is None:
+        return None
+    try:
+        return fn(check, answer)
+    except Exception:
+        return None
@@ -1,8 +1,14 @@
+import ast
 import json
+import re
+from typing import Optional
+from . import metrics, tracing
 from .openai_safe import chat_create_safe, ModelCaps
 
 JUDGE_SYSTEM = "You are a strict grader. Output JSON only."
 
+# Fixed rubric first, then question, then answer: every judgment shares the
+# rubric prefix and a rejudge repeats the whole prompt (prompt-cache friendly).
 JUDGE_TEMPLATE = """
 Grade the answer to the question using this rubric (partial credit allowed):
 - correctness (0..1)
@@ -59,6 +65,33 @@ Text:
 {text}
 """
 
+JUDGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "number"},
+        "pass": {"type": "boolean"},
+        "reasons": {"type": "array", "items": {"type": "string"}},
+        "rubric_breakdown": {
+            "type": "object",
+            "properties": {
+                "correctness": {"type": "number"},
+                "completeness": {"type": "number"},
+                "clarity": {"type": "number"},
+            },
+            "required": ["correctness", "completeness", "clarity"],
+            "additionalProperties": False,
+        },
+        "confidence": {"type": "number"},
+    },
+    "required": ["score", "pass", "reasons", "rubric_breakdown", "confidence"],
+    "additionalProperties": False,
+}
+
+JUDGE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "judgment", "strict": True, "schema": JUDGE_SCHEMA},
+}
+
 def _strip_fences(s: str) -> str:
     s = s.strip()
     if s.startswith("```"):
@@ -93,7 +126,38 @@ def _normalize(d: dict) -> dict:
         "confidence": conf,
     }
 
-def judge_answer(client, caps: ModelCaps, model: str, question: str, answer: str) -> dict:
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+def _repair_local(raw: str) -> Optional[dict]:
+    """
+    Tolerant parser for near-JSON judge output: surrounding prose, trailing
+    commas, single quotes and Python literals. Returns None if still unparseable.
+    """
+    start, end = raw.find("{"), raw.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    body = _TRAILING_COMMA.sub(r"\1", raw[start:end + 1])
+
+    try:
+        d = json.loads(body)
+    except json.JSONDecodeError:
+        py = re.sub(r"\btrue\b", "True", body)
+        py = re.sub(r"\bfalse\b", "False", py)
+        py = re.sub(r"\bnull\b", "None", py)
+        try:
+            d = ast.literal_eval(py)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    return d if isinstance(d, dict) else None
+
+def judge_answer(client, caps: ModelCaps, model: str, question: str, answer: str, structured: bool = False,
+                 stage: str = "judge", tokens: Optional[dict] = None) -> dict:
+    """
+    Returns the normalized judgment plus a "repair" key: "none", "local"
+    (tolerant parser) or "llm" (extra FIX_TEMPLATE call). `stage` labels
+    metrics ("judge" or "rejudge"); `tokens` accumulates usage over the judge
+    and any repair call (see chat_create_safe).
+    """
     prompt = JUDGE_TEMPLATE.format(question=question, answer=answer)
     resp = chat_create_safe(
         client, caps,
@@ -101,20 +165,40 @@ def judge_answer(client, caps: ModelCaps, model: str, question: str, answer: str
         messages=[{"role": "system", "content": JUDGE_SYSTEM},
                   {"role": "user", "content": prompt}],
         temperature=0.0,
+        response_format=JUDGE_RESPONSE_FORMAT if structured else None,
+        stage=stage,
+        tokens=tokens,
     )
 
-    raw = _strip_fences(resp.choices[0].message.content)
+    raw = _strip_fences(resp.choices[0].message.content or "")
 
     try:
-        return _normalize(json.loads(raw))
+        d = json.loads(raw)
     except json.JSONDecodeError:
-        fix_prompt = FIX_TEMPLATE.format(text=raw)
-        fix = chat_create_safe(
-            client, caps,
-            model=model,
-            messages=[{"role": "system", "content": FIX_SYSTEM},
-                      {"role": "user", "content": fix_prompt}],
-            temperature=0.0,
-        )
-        fixed = _strip_fences(fix.choices[0].message.content)
-        return _normalize(json.loads(fixed))
+        d = None
+    if isinstance(d, dict):
+        return {**_normalize(d), "repair": "none"}
+
+    with tracing.span("judge.repair_local"):
+        d = _repair_local(raw)
+    if d is not None:
+        metrics.JUDGE_REPAIRS.inc(kind="local")
+        return {**_normalize(d), "repair": "local"}
+
+    fix_prompt = FIX_TEMPLATE.format(text=raw)
+    fix = chat_create_safe(
+        client, caps,
+        model=model,
+        messages=[{"role": "system", "content": FIX_SYSTEM},
+                  {"role": "user", "content": fix_prompt}],
+        temperature=0.0,
+        response_format=JUDGE_RESPONSE_FORMAT if structured else None,
+        stage="repair",
+        tokens=tokens,
+    )
+    metrics.JUDGE_REPAIRS.inc(kind="llm")
+    fixed = _strip_fences(fix.choices[0].message.content or "")
+    d = json.loads(fixed)
+    if not isinstance(d, dict):
+        raise RuntimeError(f"judge repair returned {type(d).__name__}, not a JSON object")
+    return {**_normalize(d), "repair": "llm"}
@@ -0,0 +1,112 @@
+# src/latency.py
+"""
+Per-run latency percentiles and tail-regression checks.
+
+LatencySketch is an HDR-style log-linear histogram over integer milliseconds:
+values below 2**(SUB_BITS + 1) get exact buckets, and above that every power of
+two is split into 2**SUB_BITS buckets. Quantiles are within ~0.8% of the true
+value. Recording costs O(1), and memory stays bounded by the number of distinct
+buckets (about 1.5k for values up to a day), whatever the run size.
+
+Runs store p50/p90/p99 for the solve and judge calls. analyze compares each
+run's tail against the median of the trailing window of runs on the same
+endpoint and model.
+"""
+import math
+from statistics import median
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SUB_BITS = 7
+QUANTILES = (0.5, 0.9, 0.99)
+STAGES = ("solve", "judge")
+DEFAULT_WINDOW = 10
+DEFAULT_THRESHOLD = 1.5
+MIN_HISTORY = 3
+
+# runs.<stage>_p<q>_ms, in QUANTILES order
+COLUMNS = {s: [f"{s}_p{round(q * 100)}_ms" for q in QUANTILES] for s in STAGES}
+
+
+class LatencySketch:
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.n = 0
+        self.min = math.inf
+        self.max = 0
+
+    @staticmethod
+    def _index(v: int) -> int:
+        shift = max(0, v.bit_length() - SUB_BITS - 1)
+        return (shift << SUB_BITS) + (v >> shift)
+
+    @staticmethod
+    def _value(idx: int) -> float:
+        """Midpoint of the bucket's value range."""
+        shift = max(0, (idx >> SUB_BITS) - 1)
+        lo = (idx - (shift << SUB_BITS)) << shift
+        return lo + ((1 << shift) - 1) / 2.0
+
+    def record(self, ms: float) -> None:
+        v = max(0, int(round(ms)))
+        i = self._index(v)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.n += 1
+        self.min = min(self.min, v)
+        self.max = max(self.max, v)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Nearest-rank quantile, clamped to the observed min/max."""
+        if not self.n:
+            return None
+        rank = max(1, math.ceil(q * self.n))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return float(min(self.max, max(self.min, self._value(i))))
+        return float(self.max)
+
+    def percentiles(self) -> List[Optional[float]]:
+        return [self.quantile(q) for q in QUANTILES]
+
+
+def backfill_solve_percentiles(con) -> None:
+    """Fill runs.solve_p*_ms from results.latency_ms (older runs did not time the judge; caller commits)."""
+    sketches: Dict[str, LatencySketch] = {}
+    for r in con.execute("SELECT run_id, latency_ms FROM results WHERE latency_ms IS NOT NULL"):
+        sketches.setdefault(r["run_id"], LatencySketch()).record(r["latency_ms"])
+    cols = ", ".join(f"{c}=?" for c in COLUMNS["solve"])
+    con.executemany(f"UPDATE runs SET {cols} WHERE run_id=?",
+                    [(*s.percentiles(), run_id) for run_id, s in sketches.items()])
+
+
+def tail_regressions(
+    runs: Iterable[dict],
+    stage: str,
+    window: int = DEFAULT_WINDOW,
+    threshold: float = DEFAULT_THRESHOLD,
+) -> Dict[str, List[Tuple[str, float]]]:
+    """
+    run_id -> [(quantile label, ratio)] for runs whose p90 or p99 exceeds
+    `threshold` × the median of the previous `window` runs with the same
+    base_url and stage model. Runs need MIN_HISTORY prior runs to be judged.
+    `runs` must be in run order.
+    """
+    model_key = "solve_model" if stage == "solve" else "judge_model"
+    tails = list(zip(("p90", "p99"), COLUMNS[stage][1:]))
+    history: Dict[Tuple[str, str], List[dict]] = {}
+    out: Dict[str, List[Tuple[str, float]]] = {}
+    for r in runs:
+        if r.get(COLUMNS[stage][0]) is None:
+            continue
+        prev = history.setdefault((r.get("base_url"), r[model_key]), [])
+        if len(prev) >= MIN_HISTORY:
+            flags = []
+            for label, col in tails:
+                base = median(p[col] for p in prev[-window:])
+                if base > 0 and r[col] > threshold * base:
+                    flags.append((label, r[col] / base))
+            if flags:
+                out[r["run_id"]] = flags
+        prev.append(r)
+    return out
@@ -0,0 +1,202 @@
+# src/loadtest.py
+"""
+Endpoint load test: replay bank questions against the solve model while
+ramping concurrency, and record throughput, errors, TTFT, latency percentiles
+and (optionally) judged quality at each step.
+
+Each step is closed-loop. `concurrency` workers keep one request in flight
+each until the step's request budget is spent. Nothing is written to the
+results table, so load tests never move the EMA, rollups or difficulty.
+"""
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from . import tracing
+from .graders import grade_locally
+from .judge import judge_answer
+from .latency import LatencySketch
+from .openai_safe import ModelCaps, chat_create_safe
+from .run import SOLVER_SYSTEM
+
+DEFAULT_STEPS = (1, 2, 4, 8, 16, 32)
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or "429" in str(e) or "rate limit" in str(e).lower()
+
+
+def _consume(resp, t0: float) -> Tuple[str, Optional[float]]:
+    """(answer, ttft_ms). Endpoints that ignore stream=True return a whole completion: no TTFT."""
+    if hasattr(resp, "choices"):
+        return resp.choices[0].message.content or "", None
+    parts: List[str] = []
+    ttft = None
+    for chunk in resp:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if ttft is None:
+                ttft = (time.perf_counter() - t0) * 1000
+            parts.append(delta)
+    return "".join(parts), ttft
+
+
+def load_prompts(con, n: int, domain: str = None, seed: int = 0) -> List[Tuple[str, str, Optional[dict]]]:
+    """
+    Up to n random (question_id, prompt, check) rows from the bank. Only rowids
+    are read for the whole bank; prompts are fetched for the n chosen.
+    """
+    ids = [r[0] for r in con.execute(
+        "SELECT rowid FROM questions WHERE (? IS NULL OR domain = ?)", (domain, domain))]
+    if not ids:
+        raise RuntimeError("No questions in DB. Run `generate` first.")
+    chosen = random.Random(seed).sample(ids, min(n, len(ids)))
+    rows = {}
+    for i in range(0, len(chosen), 500):
+        chunk = chosen[i:i + 500]
+        for r in con.execute(
+            f"SELECT rowid, question_id, prompt, check_json FROM questions "
+            f"WHERE rowid IN ({','.join('?' * len(chunk))})", chunk,
+        ):
+            rows[r[0]] = r
+    return [(r["question_id"], r["prompt"], json.loads(r["check_json"]) if r["check_json"] else None)
+            for r in (rows[i] for i in chosen)]
+
+
+def _solve_one(client, caps: ModelCaps, model: str, prompt: str, stream: bool) -> dict:
+    t0 = time.perf_counter()
+    try:
+        kwargs = {"stream": True} if stream else {}
+        resp = chat_create_safe(
+            client, caps,
+            model=model,
+            messages=[{"role": "system", "content": SOLVER_SYSTEM},
+                      {"role": "user", "content": prompt}],
+            temperature=1.0,
+            stage="loadtest",
+            retries=0,
+            **kwargs,
+        )
+        answer, ttft = _consume(resp, t0)
+        return {"ok": True, "answer": answer, "ttft_ms": ttft, "latency_ms": (time.perf_counter() - t0) * 1000}
+    except Exception as e:
+        return {"ok": False, "rate_limited": _is_rate_limited(e), "latency_ms": (time.perf_counter() - t0) * 1000}
+
+
+def _judge_sample(client, caps: ModelCaps, judge_model: str, items: List[Tuple[tuple, dict]],
+                  workers: int) -> List[float]:
+    def grade(item) -> Optional[float]:
+        (_, prompt, check), out = item
+        local = grade_locally(check, out["answer"])
+        if local is not None:
+            return float(local["score"])
+        try:
+            return float(judge_answer(client, caps, model=judge_model, question=prompt,
+                                      answer=out["answer"]).get("score", 0.0))
+        except Exception:
+            return None  # unusable judgment: left out, as in run.py
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as pool:
+        return [s for s in pool.map(grade, items) if s is not None]
+
+
+def run_step(client, caps: ModelCaps, prompts: Sequence[tuple], *, solve_model: str, judge_model: str,
+             concurrency: int, n_requests: int, offset: int = 0, stream: bool = True,
+             judge_sample: float = 0.0, judge_workers: int = 4, seed: int = 0, judge_client=None) -> dict:
+    items = [prompts[(offset + i) % len(prompts)] for i in range(n_requests)]
+    t0 = time.perf_counter()
+    with tracing.span("loadtest.step", concurrency=concurrency, n=n_requests):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outs = list(pool.map(lambda it: _solve_one(client, caps, solve_model, it[1], stream), items))
+    wall = time.perf_counter() - t0
+
+    lat, ttft = LatencySketch(), LatencySketch()
+    ok = [(it, o) for it, o in zip(items, outs) if o["ok"]]
+    for _, o in ok:
+        lat.record(o["latency_ms"])
+        if o["ttft_ms"] is not None:
+            ttft.record(o["ttft_ms"])
+    n_rate_limited = sum(1 for o in outs if not o["ok"] and o["rate_limited"])
+
+    scores: List[float] = []
+    if judge_sample > 0 and ok:
+        k = max(1, round(judge_sample * len(ok)))
+        with tracing.span("loadtest.judge", n=k):
+            scores = _judge_sample(judge_client or client, caps, judge_model, random.Random(seed).sample(ok, min(k, len(ok))),
+                                   judge_workers)
+
+    p50, p90, p99 = lat.percentiles()
+    t50, t90, _ = ttft.percentiles()
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "ok": len(ok),
+        "errors": n_requests - len(ok),
+        "rate_limited": n_rate_limited,
+        "error_rate": (n_requests - len(ok)) / n_requests,
+        "wall_s": wall,
+        "throughput_rps": len(ok) / wall if wall > 0 else 0.0,
+        "latency_p50_ms": p50, "latency_p90_ms": p90, "latency_p99_ms": p99,
+        "ttft_p50_ms": t50, "ttft_p90_ms": t90,
+        "quality_mean": sum(scores) / len(scores) if scores else None,
+        "n_judged": len(scores),
+    }
+
+
+def run_loadtest(client, caps: ModelCaps, con, *, solve_model: str, judge_model: str,
+                 steps: Sequence[int] = DEFAULT_STEPS, requests_per_step: int = None, domain: str = None,
+                 stream: bool = True, judge_sample: float = 0.0, max_error_rate: float = 0.5,
+                 seed: int = 0, on_step=None, judge_client=None) -> List[dict]:
+    """
+    Run the concurrency ramp and return one summary dict per step. The ramp
+    stops early once a step's error rate exceeds `max_error_rate`. By default
+    each step sends max(20, 4 × concurrency) requests. Quality samples are
+    judged through `judge_client` when given.
+    """
+    # Client-side retries would hide 429s and inflate latency; the load test wants them raw
+    # (_solve_one also passes retries=0 to chat_create_safe).
+    if hasattr(client, "with_options"):
+        client = client.with_options(max_retries=0)
+    judge_client = judge_client or client
+
+    budget = requests_per_step or max(20, 4 * max(steps))
+    prompts = load_prompts(con, budget, domain=domain, seed=seed)
+    results: List[dict] = []
+    offset = 0
+    for c in steps:
+        n = requests_per_step or max(20, 4 * c)
+        step = run_step(client, caps, prompts, solve_model=solve_model, judge_model=judge_model,
+                        concurrency=c, n_requests=n, offset=offset, stream=stream,
+                        judge_sample=judge_sample, seed=seed + c, judge_client=judge_client)
+        offset += n
+        results.append(step)
+        if on_step:
+            on_step(step)
+        if step["error_rate"] > max_error_rate:
+            break
+    return results
+
+
+def format_step(s: Dict) -> str:
+    def ms(v):
+        return "-" if v is None else f"{v:.0f}"
+    quality = "-" if s["quality_mean"] is None else f"{s['quality_mean']:.3f}({s['n_judged']})"
+    return (
+        f"  c={s['concurrency']:<4} n={s['requests']:<5} rps={s['throughput_rps']:>7.2f} "
+        f"err={s['error_rate']:>5.1%} (429={s['rate_limited']}) | "
+        f"ttft p50/p90={ms(s['ttft_p50_ms'])}/{ms(s['ttft_p90_ms'])} | "
+        f"latency p50/p90/p99={ms(s['latency_p50_ms'])}/{ms(s['latency_p90_ms'])}/{ms(s['latency_p99_ms'])} ms | "
+        f"quality={quality}"
+    )
+
+
+def write_results(steps: List[dict], path: str, meta: dict) -> str:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(json.dumps({**meta, "steps": steps}, indent=2), encoding="utf-8")
+    return str(p)
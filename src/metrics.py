@@ -0,0 +1,273 @@
+# src/metrics.py
+"""
+In-process metrics registry for long runs, exported in the Prometheus text
+format. It can be written as a textfile (node_exporter textfile collector) or
+served on a local HTTP endpoint.
+
+Updating a metric takes a lock and a dict lookup, so the pipeline updates
+metrics unconditionally. Exporting is opt-in (--metrics-file / --metrics-port).
+"""
+import math
+import os
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+DB_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[k]) for k in self.labelnames)
+
+    def _labelstr(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, val in items:
+            lines.extend(self._render_one(key, val))
+        return lines
+
+    def _render_one(self, key, val) -> List[str]:
+        return [f"{self.name}{self._labelstr(key)} {_fmt(val)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            h = self._values.get(key)
+            if h is None:
+                h = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    def _render_one(self, key, val) -> List[str]:
+        counts, total, n = val
+        lines, acc = [], 0
+        for le, c in zip(self.buckets + (math.inf,), counts):
+            acc += c
+            le_label = 'le="%s"' % _fmt(le)
+            lines.append(f"{self.name}_bucket{self._labelstr(key, le_label)} {acc}")
+        lines.append(f"{self.name}_sum{self._labelstr(key)} {_fmt(total)}")
+        lines.append(f"{self.name}_count{self._labelstr(key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+def counter(name, doc, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, doc, labelnames))
+
+def gauge(name, doc, labelnames=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, doc, labelnames))
+
+def histogram(name, doc, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, doc, labelnames, buckets))
+
+
+# -----------------------------
+# Pipeline metrics
+# -----------------------------
+LLM_IN_FLIGHT = gauge("bench_llm_requests_in_flight", "LLM requests currently awaiting a response.", ["stage"])
+LLM_SECONDS = histogram("bench_llm_request_seconds", "LLM request latency, including fallback retries.",
+                        ["stage", "model"])
+LLM_REQUESTS = counter("bench_llm_requests_total", "LLM requests by outcome.", ["stage", "model", "outcome"])
+LLM_TOKENS = counter("bench_llm_tokens_total",
+                     "Tokens reported by the endpoint (kind: prompt, completion, cached = prompt tokens hit in "
+                     "the endpoint's prefix cache).", ["stage", "model", "kind"])
+LLM_RETRIES = counter("bench_llm_retries_total",
+                      "Requests re-sent (reason: HTTP status such as 429 or 503, timeout, connection, or a "
+                      "capability fallback: temperature, response_format).", ["model", "reason"])
+ROUTER_OUTSTANDING = gauge("bench_router_outstanding_requests", "Requests in flight per replica.",
+                           ["role", "replica"])
+ROUTER_EJECTIONS = counter("bench_router_ejections_total", "Times a replica was ejected after repeated failures.",
+                           ["role", "replica"])
+ROUTER_FAILOVERS = counter("bench_router_failovers_total",
+                           "Requests re-sent to another replica after this replica failed them.", ["role", "replica"])
+JUDGE_REPAIRS = counter("bench_judge_repairs_total", "Judge outputs that needed repair.", ["kind"])
+JUDGMENTS = counter("bench_judgments_total", "Items scored, by grader (local / llm) and whether rejudged.",
+                    ["grader", "rejudged"])
+JUDGE_FAILED = counter("bench_judge_failed_total", "Items dropped because the judge output was unusable.")
+REJUDGE_RATIO = gauge("bench_run_rejudge_ratio", "Share of LLM-judged items rejudged in the last run.",
+                      ["solve_model", "domain"])
+REJUDGE_YIELD = gauge("bench_run_rejudge_disagreement_per_call",
+                      "Mean |score1 - score2| captured per rejudge call in the last run.", ["solve_model", "domain"])
+QUESTIONS_PER_SEC = gauge("bench_run_questions_per_second", "Scored items per second in the last run.",
+                          ["solve_model", "domain"])
+RUN_LATENCY_MS = gauge("bench_run_latency_ms", "Per-call latency percentiles of the last run (solve / judge).",
+                       ["solve_model", "domain", "stage", "quantile"])
+QUESTIONS_GENERATED = counter("bench_questions_generated_total", "Novel questions inserted.", ["domain"])
+EMA = gauge("bench_ema", "Current EMA of batch mean score.", ["solve_model", "domain"])
+BATCH_MEAN = gauge("bench_batch_mean", "Batch mean score of the last run.", ["solve_model", "domain"])
+DB_WRITE_SECONDS = histogram("bench_db_write_batch_seconds", "StoreWriter transaction latency per batch.",
+                             buckets=DB_BUCKETS)
+DB_WRITES = counter("bench_db_writes_total", "Writes applied by the StoreWriter, by outcome.", ["outcome"])
+
+
+# Per-run prompt-cache telemetry (runs columns; judge includes rejudge and repair calls)
+CACHE_STAGES = ("solve", "judge")
+CACHE_COLUMNS = {s: (f"{s}_prompt_tokens", f"{s}_cached_tokens") for s in CACHE_STAGES}
+
+
+def usage_tokens(resp) -> Tuple[int, int]:
+    """(prompt tokens, prompt tokens served from the endpoint's prefix cache); zeros if not reported."""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    return int(getattr(usage, "prompt_tokens", 0) or 0), int(getattr(details, "cached_tokens", 0) or 0)
+
+
+def record_llm_response(stage: str, model: str, resp) -> None:
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = getattr(usage, kind, None)
+        if n:
+            LLM_TOKENS.inc(n, stage=stage, model=model, kind=kind.split("_")[0])
+    _, cached = usage_tokens(resp)
+    if cached:
+        LLM_TOKENS.inc(cached, stage=stage, model=model, kind="cached")
+
+
+# -----------------------------
+# Exporters
+# -----------------------------
+def write_textfile(path: str) -> None:
+    """Atomically write the registry (tmp + rename), as the textfile collector expects."""
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp, path)
+
+
+class TextfileWriter:
+    """Rewrite the textfile every `interval` seconds until closed (and once more on close)."""
+
+    def __init__(self, path: str, interval: float = 15.0):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="metrics-textfile", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            write_textfile(self.path)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        write_textfile(self.path)
+
+
+def start_http_server(port: int, addr: str = "127.0.0.1"):
+    """Serve /metrics from a daemon thread; call .shutdown() to stop."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # only when serving
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):  # keep the CLI output clean
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
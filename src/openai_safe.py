@@ -1,22 +1,54 @@
-from typing import Any, Dict, Optional
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+from . import metrics, tracing
+
+# Transport retries happen here, not in the SDK (client.make_client sets max_retries=0),
+# so each one is counted. Same policy as the SDK default: 2 retries, 0.5 s doubling to 8 s.
+MAX_RETRIES = 2
+RETRY_BASE_S = 0.5
+RETRY_MAX_S = 8.0
 
 class ModelCaps:
     def __init__(self):
         self.temperature_supported: Dict[str, bool] = {}
+        # keyed by (model, response_format type), e.g. ("gpt-x", "json_schema")
+        self.response_format_supported: Dict[Tuple[str, str], bool] = {}
 
 def _temp_unsupported(e: Exception) -> bool:
     msg = str(e)
     return ("temperature" in msg) and ("Only the default (1) value is supported" in msg or "unsupported_value" in msg)
 
-def chat_create_safe(
-    client,
-    caps: ModelCaps,
-    *,
-    model: str,
-    messages,
-    temperature: Optional[float] = None,
-    **kwargs
-) -> Any:
+def _response_format_unsupported(e: Exception) -> bool:
+    msg = str(e)
+    return "response_format" in msg or "json_schema" in msg or "json_object" in msg
+
+def _retry_reason(e: Exception) -> Optional[str]:
+    """Metric label for a transient failure worth re-sending (the SDK's retry set), else None."""
+    if isinstance(e, APITimeoutError):
+        return "timeout"
+    if isinstance(e, APIConnectionError):
+        return "connection"
+    if isinstance(e, APIStatusError) and (e.status_code in (408, 409, 429) or e.status_code >= 500):
+        return str(e.status_code)
+    return None
+
+def _retry_delay(e: Exception, attempt: int) -> float:
+    try:
+        after = float(e.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        after = None
+    if after is not None and 0 < after <= 60:
+        return after
+    return min(RETRY_MAX_S, RETRY_BASE_S * 2 ** attempt) * (1.0 - 0.25 * random.random())
+
+# json_schema degrades to json_object, which degrades to plain text
+_RF_FALLBACK = {"json_schema": {"type": "json_object"}, "json_object": None}
+
+def _create(client, caps: ModelCaps, *, model: str, messages, temperature: Optional[float], **kwargs) -> Any:
     # If we learned this model can't do temperature, omit it.
     if temperature is not None and model in caps.temperature_supported and not caps.temperature_supported[model]:
         return client.chat.completions.create(model=model, messages=messages, **kwargs)
@@ -31,5 +63,78 @@ def chat_create_safe(
     except Exception as e:
         if temperature is not None and _temp_unsupported(e):
             caps.temperature_supported[model] = False
+            metrics.LLM_RETRIES.inc(model=model, reason="temperature")
             return client.chat.completions.create(model=model, messages=messages, **kwargs)
         raise
+
+def chat_create_safe(
+    client,
+    caps: ModelCaps,
+    *,
+    model: str,
+    messages,
+    temperature: Optional[float] = None,
+    response_format: Optional[dict] = None,
+    stage: str = "other",
+    tokens: Optional[Dict[str, int]] = None,
+    retries: int = MAX_RETRIES,
+    **kwargs
+) -> Any:
+    """
+    `stage` (generate / solve / judge / rejudge / repair / loadtest) only labels metrics;
+    it is not sent to the endpoint. `tokens`, if given, accumulates "prompt" and
+    "cached" token counts from the response usage. Timeouts, connection errors,
+    429 and 5xx are re-sent up to `retries` times with backoff, counted in
+    LLM_RETRIES by status or reason.
+    """
+    metrics.LLM_IN_FLIGHT.inc(stage=stage)
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracing.span(f"llm.{stage}", model=model):
+            attempt = 0
+            while True:
+                try:
+                    resp = _chat_create(client, caps, model=model, messages=messages, temperature=temperature,
+                                        response_format=response_format, **kwargs)
+                    break
+                except Exception as e:
+                    reason = _retry_reason(e)
+                    if reason is None or attempt >= retries:
+                        raise
+                    metrics.LLM_RETRIES.inc(model=model, reason=reason)
+                    time.sleep(_retry_delay(e, attempt))
+                    attempt += 1
+        outcome = "ok"
+        metrics.record_llm_response(stage, model, resp)
+        if tokens is not None:
+            prompt, cached = metrics.usage_tokens(resp)
+            tokens["prompt"] = tokens.get("prompt", 0) + prompt
+            tokens["cached"] = tokens.get("cached", 0) + cached
+        return resp
+    finally:
+        metrics.LLM_IN_FLIGHT.dec(stage=stage)
+        metrics.LLM_SECONDS.observe(time.perf_counter() - t0, stage=stage, model=model)
+        metrics.LLM_REQUESTS.inc(stage=stage, model=model, outcome=outcome)
+
+def _chat_create(client, caps: ModelCaps, *, model: str, messages, temperature: Optional[float],
+                 response_format: Optional[dict], **kwargs) -> Any:
+    # Walk down the response_format fallback chain, skipping formats we learned are unsupported.
+    while response_format is not None:
+        key = (model, response_format.get("type", ""))
+        if caps.response_format_supported.get(key) is False:
+            response_format = _RF_FALLBACK.get(key[1])
+            continue
+        try:
+            resp = _create(client, caps, model=model, messages=messages, temperature=temperature,
+                           response_format=response_format, **kwargs)
+            caps.response_format_supported[key] = True
+            return resp
+        except Exception as e:
+            if not _response_format_unsupported(e):
+                raise
+            caps.response_format_supported[key] = False
+            metrics.LLM_RETRIES.inc(model=model, reason="response_format")
+            response_format = _RF_FALLBACK.get(key[1])
+
+    return _create(client, caps, model=model, messages=messages, temperature=temperature, **kwargs)
@@ -1,14 +1,21 @@
 # src/plots.py
 from __future__ import annotations
 
-import os
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Tuple
 
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are only ever written to files
 import matplotlib.pyplot as plt
 
-from .evolve import CATEGORIES, category_means, category_weights
+from .analytics import Snapshot, load_snapshot
+from .columnar import DuckConnection
+from .evolve import category_weights
+
+FINGERPRINT_FILE = ".fingerprints.json"
 
 
 def _ensure_dir(out_dir: str) -> Path:
@@ -17,20 +24,17 @@ def _ensure_dir(out_dir: str) -> Path:
     return p
 
 
-def plot_evolution(con, out_dir: str = "docs/figs") -> str:
+def plot_evolution(con, out_dir: str = "docs/figs", snapshot: Snapshot = None,
+                   fmt: str = "png", dpi: int = 200) -> str:
     """
     Plot batch mean vs EMA vs target difficulty over run history.
 
     Uses: runs(batch_mean, ema_after, target_difficulty, run_at)
     """
-    outp = _ensure_dir(out_dir) / "evolution.png"
+    outp = _ensure_dir(out_dir) / f"evolution.{fmt}"
 
-    rows = con.execute("""
-        SELECT run_at, batch_mean, ema_after, target_difficulty
-        FROM runs
-        WHERE batch_mean IS NOT NULL AND ema_after IS NOT NULL
-        ORDER BY run_at ASC
-    """).fetchall()
+    snap = snapshot or load_snapshot(con, n_boot=0)
+    rows = [r for r in snap.scored_runs() if r["ema_after"] is not None]
 
     if not rows:
         raise RuntimeError("No run history found (need at least one `run`).")
@@ -59,22 +63,27 @@ def plot_evolution(con, out_dir: str = "docs/figs") -> str:
     ax.legend(lines + lines2, labels + labels2, loc="best")
 
     plt.tight_layout()
-    plt.savefig(outp, dpi=200)
+    plt.savefig(outp, dpi=dpi)
     plt.close()
     return str(outp)
 
 
-def plot_category_pressure(con, out_dir: str = "docs/figs") -> str:
+def plot_category_pressure(con, out_dir: str = "docs/figs", snapshot: Snapshot = None,
+                           fmt: str = "png", dpi: int = 200, node: str = None) -> str:
     """
     Bar chart showing category mean score vs evolution weight (pressure).
-    Uses: category_means() and category_weights() (already in evolve.py)
+    Uses: snapshot category means and category_weights() (evolve.py)
+    Top-level categories, or the subcategories of `node` (a category path).
     """
-    outp = _ensure_dir(out_dir) / "category_pressure.png"
+    outp = _ensure_dir(out_dir) / f"category_pressure.{fmt}"
 
-    means = category_means(con)  # {cat: mean_score}
-    weights = category_weights(means, CATEGORIES)  # {cat: weight}
+    snap = snapshot or load_snapshot(con, n_boot=0)
+    means = snap.category_means(node)  # {cat: mean_score}
+    cats = snap.roots if node is None else list(means)
+    if not cats:
+        raise RuntimeError(f"No results under category {node!r}.")
+    weights = category_weights(means, cats)  # {cat: weight}
 
-    cats = CATEGORIES[:]
     mean_vals = [float(means.get(c, 0.0)) if means.get(c) is not None else 0.0 for c in cats]
     w_vals = [float(weights.get(c, 0.0)) for c in cats]
 
@@ -88,36 +97,31 @@ def plot_category_pressure(con, out_dir: str = "docs/figs") -> str:
 
     plt.xticks(x, cats, rotation=20, ha="right")
     plt.ylim(0, 1.05)
-    plt.xlabel("Category")
+    plt.xlabel("Category" if node is None else f"Subcategory of {node}")
     plt.title("Self-evolution signal: weakness → pressure")
     plt.legend(loc="best")
     plt.tight_layout()
-    plt.savefig(outp, dpi=200)
+    plt.savefig(outp, dpi=dpi)
     plt.close()
     return str(outp)
 
 
-def plot_uncertainty_over_time(con, out_dir: str = "docs/figs") -> str:
+def plot_uncertainty_over_time(con, out_dir: str = "docs/figs", snapshot: Snapshot = None,
+                               fmt: str = "png", dpi: int = 200) -> str:
     """
     Plot average judge disagreement per run (your uncertainty proxy).
-    Uses: results.judge_json -> $.disagreement (already used in analyze.py)
+    Uses: rollup_run.dis_sum via the analytics snapshot
     """
-    outp = _ensure_dir(out_dir) / "uncertainty_over_time.png"
+    outp = _ensure_dir(out_dir) / f"uncertainty_over_time.{fmt}"
 
-    rows = con.execute("""
-        SELECT
-          run_id,
-          AVG(ABS(json_extract(judge_json, '$.disagreement'))) AS avg_dis
-        FROM results
-        GROUP BY run_id
-        ORDER BY MIN(created_at) ASC
-    """).fetchall()
+    snap = snapshot or load_snapshot(con, n_boot=0)
+    rows = snap.run_disagreement()
 
     if not rows:
         raise RuntimeError("No results found (need at least one `run`).")
 
     xs = list(range(1, len(rows) + 1))
-    ys = [float(r["avg_dis"]) if r["avg_dis"] is not None else 0.0 for r in rows]
+    ys = [avg_dis for _, avg_dis in rows]
 
     plt.figure()
     plt.plot(xs, ys, marker="o", label="Avg disagreement")
@@ -126,43 +130,31 @@ def plot_uncertainty_over_time(con, out_dir: str = "docs/figs") -> str:
     plt.title("Uncertainty proxy over time (judge self-consistency)")
     plt.legend(loc="best")
     plt.tight_layout()
-    plt.savefig(outp, dpi=200)
+    plt.savefig(outp, dpi=dpi)
     plt.close()
     return str(outp)
 
 
-def plot_category_difficulty_heatmap(con, out_dir: str = "docs/figs") -> str:
+def plot_category_difficulty_heatmap(con, out_dir: str = "docs/figs", snapshot: Snapshot = None,
+                                     fmt: str = "png", dpi: int = 200, node: str = None) -> str:
     """
     Heatmap of mean score by Category × Difficulty.
-    Categories are fixed by design (CATEGORIES).
-    Difficulty levels are inferred dynamically.
+    Rows are the top-level categories (CATEGORIES, then discovered roots), or
+    the subcategories of `node`. Difficulty levels are inferred dynamically.
     """
-    outp = _ensure_dir(out_dir) / "category_difficulty_heatmap.png"
+    outp = _ensure_dir(out_dir) / f"category_difficulty_heatmap.{fmt}"
 
-    categories = CATEGORIES[:]  # design-level taxonomy
+    snap = snapshot or load_snapshot(con, n_boot=0)
+    categories = snap.roots if node is None else list(snap.category_stats(node))
 
-    # Infer difficulty levels dynamically
-    diff_rows = con.execute("""
-        SELECT DISTINCT difficulty FROM questions
-        WHERE difficulty IS NOT NULL
-        ORDER BY difficulty ASC
-    """).fetchall()
-
-    difficulties = [int(r["difficulty"]) for r in diff_rows]
+    # Difficulty levels are inferred dynamically from the question bank
+    difficulties = snap.difficulties
     if not difficulties:
         raise RuntimeError("No difficulty levels found in questions table.")
 
-    # Fetch mean scores
-    rows = con.execute("""
-        SELECT q.category AS category,
-               q.difficulty AS difficulty,
-               AVG(r.score) AS mean_score
-        FROM results r
-        JOIN questions q ON q.question_id = r.question_id
-        GROUP BY q.category, q.difficulty
-    """).fetchall()
+    cells = snap.cell_stats(node)
 
-    if not rows:
+    if not cells:
         raise RuntimeError("No results found (need at least one `run`).")
 
     # Build index maps
@@ -174,11 +166,9 @@ def plot_category_difficulty_heatmap(con, out_dir: str = "docs/figs") -> str:
         for _ in categories
     ]
 
-    for r in rows:
-        c = r["category"]
-        d = int(r["difficulty"])
+    for (c, d), (mean, _) in cells.items():
         if c in cat_to_idx and d in diff_to_idx:
-            grid[cat_to_idx[c]][diff_to_idx[d]] = float(r["mean_score"])
+            grid[cat_to_idx[c]][diff_to_idx[d]] = mean
 
     plt.figure()
     plt.imshow(grid, aspect="auto", cmap="inferno")
@@ -195,22 +185,142 @@ def plot_category_difficulty_heatmap(con, out_dir: str = "docs/figs") -> str:
     )
 
     plt.xlabel("Difficulty")
-    plt.ylabel("Category")
+    plt.ylabel("Category" if node is None else f"Subcategory of {node}")
     plt.title("Mean score heatmap")
     plt.tight_layout()
-    plt.savefig(outp, dpi=200)
+    plt.savefig(outp, dpi=dpi)
     plt.close()
 
     return str(outp)
 
 
-def visualize_all(con, out_dir: str = "docs/figs") -> Dict[str, str]:
+def plot_saturation(steps: List[dict], out_dir: str = "docs/figs", fmt: str = "png", dpi: int = 200) -> str:
     """
-    Generate the main figures (fast, high-signal) and return paths.
+    Saturation curve from a `loadtest` ramp: throughput and error rate, latency
+    percentiles and (when judged) quality against concurrency.
+    Uses: loadtest.run_loadtest step summaries (not the DB)
     """
+    if not steps:
+        raise RuntimeError("No load-test steps to plot.")
+    outp = _ensure_dir(out_dir) / f"saturation.{fmt}"
+
+    xs = [s["concurrency"] for s in steps]
+    has_quality = any(s["quality_mean"] is not None for s in steps)
+    fig, axes = plt.subplots(3 if has_quality else 2, 1, sharex=True, figsize=(6.4, 7.2 if has_quality else 5.6))
+
+    ax = axes[0]
+    ax.plot(xs, [s["throughput_rps"] for s in steps], marker="o", label="Throughput (req/s)")
+    ax.set_ylabel("Requests / s")
+    ax2 = ax.twinx()
+    ax2.plot(xs, [s["error_rate"] for s in steps], linestyle="--", color="tab:red", label="Error rate")
+    ax2.set_ylabel("Error rate")
+    ax2.set_ylim(0, 1.05)
+    lines, labels = ax.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    ax.legend(lines + lines2, labels + labels2, loc="best")
+    ax.set_title("Endpoint saturation under a concurrency ramp")
+
+    ax = axes[1]
+    for key, label in (("latency_p50_ms", "p50"), ("latency_p90_ms", "p90"), ("latency_p99_ms", "p99"),
+                       ("ttft_p50_ms", "TTFT p50")):
+        ys = [s[key] for s in steps]
+        if any(y is not None for y in ys):
+            ax.plot(xs, [float("nan") if y is None else y for y in ys], marker="o", label=label,
+                    linestyle=":" if key.startswith("ttft") else "-")
+    ax.set_ylabel("Latency (ms)")
+    ax.legend(loc="best")
+
+    if has_quality:
+        ax = axes[2]
+        ax.plot(xs, [float("nan") if s["quality_mean"] is None else s["quality_mean"] for s in steps],
+                marker="o", label="Judged quality")
+        ax.set_ylabel("Mean score")
+        ax.set_ylim(0, 1.05)
+        ax.legend(loc="best")
+
+    axes[-1].set_xscale("log", base=2)
+    axes[-1].set_xticks(xs)
+    axes[-1].set_xticklabels([str(x) for x in xs])
+    axes[-1].set_xlabel("Concurrency")
+
+    plt.tight_layout()
+    plt.savefig(outp, dpi=dpi)
+    plt.close(fig)
+    return str(outp)
+
+
+FIGURES = {
+    "evolution": plot_evolution,
+    "category_pressure": plot_category_pressure,
+    "uncertainty_over_time": plot_uncertainty_over_time,
+    "cat_diff_heatmap": plot_category_difficulty_heatmap,
+}
+CATEGORY_FIGURES = ("category_pressure", "cat_diff_heatmap")   # accept node=<category path>
+
+
+def data_fingerprint(con) -> str:
+    """
+    Max result rowid + run count + finished-run count: changes whenever a run
+    or result is written, and when a run's closing EMA update lands.
+    """
+    rowid = "result_rowid" if isinstance(con, DuckConnection) else "rowid"
+    max_rowid = con.execute(f"SELECT COALESCE(MAX({rowid}), 0) AS m FROM results").fetchone()["m"]
+    row = con.execute("SELECT COUNT(*) AS n, COUNT(ema_after) AS done FROM runs").fetchone()
+    return f"{max_rowid}:{row['n']}:{row['done']}"
+
+
+def _load_fingerprints(out_dir: Path) -> Dict[str, dict]:
+    try:
+        return json.loads((out_dir / FINGERPRINT_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _render(name: str, snap: Snapshot, out_dir: str, fmt: str, dpi: int, node: str = None) -> str:
+    extra = {"node": node} if name in CATEGORY_FIGURES else {}
+    return FIGURES[name](None, out_dir=out_dir, snapshot=snap, fmt=fmt, dpi=dpi, **extra)
+
+
+def visualize_all(con, out_dir: str = "docs/figs", fmt: str = "png", dpi: int = 200,
+                  force: bool = False, workers: int = None, node: str = None) -> Dict[str, str]:
+    """
+    Render the main figures and return {name: path} for the ones written.
+
+    A figure is skipped when the data fingerprint, format, dpi and `node` match
+    its last render and the file still exists, so an unchanged DB costs two
+    cheap queries. Stale figures render from one analytics snapshot in a
+    process pool (Agg backend). `node` draws the category figures over the
+    subcategories of that category path.
+    """
+    out = _ensure_dir(out_dir)
+    fp = data_fingerprint(con)
+    previous = _load_fingerprints(out)
+    key = {"fingerprint": fp, "fmt": fmt, "dpi": dpi}
+
+    def key_for(name: str) -> dict:
+        return dict(key, node=node) if name in CATEGORY_FIGURES else key
+
+    def fresh(name: str) -> bool:
+        prev = previous.get(name) or {}
+        return all(prev.get(k) == v for k, v in key_for(name).items()) and os.path.exists(prev.get("path", ""))
+
+    todo = [name for name in FIGURES if force or not fresh(name)]
+    if not todo:
+        return {}
+
+    snap = load_snapshot(con, n_boot=0)
     outputs = {}
-    outputs["evolution"] = plot_evolution(con, out_dir=out_dir)
-    outputs["category_pressure"] = plot_category_pressure(con, out_dir=out_dir)
-    outputs["uncertainty_over_time"] = plot_uncertainty_over_time(con, out_dir=out_dir)
-    outputs["cat_diff_heatmap"] = plot_category_difficulty_heatmap(con, out_dir=out_dir)
+    workers = min(len(todo), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        for name in todo:
+            outputs[name] = _render(name, snap, out_dir, fmt, dpi, node)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {name: pool.submit(_render, name, snap, out_dir, fmt, dpi, node) for name in todo}
+            for name, fut in futures.items():
+                outputs[name] = fut.result()
+
+    for name, path in outputs.items():
+        previous[name] = dict(key_for(name), path=path)
+    (out / FINGERPRINT_FILE).write_text(json.dumps(previous, indent=2), encoding="utf-8")
     return outputs
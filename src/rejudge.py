@@ -0,0 +1,120 @@
+# src/rejudge.py
+"""
+Rejudge policies for run_benchmark.
+
+"confidence" (the original behaviour) rejudges whenever the judge's
+self-reported confidence is below a threshold. Some judge models report low
+confidence almost always, which doubles judge spend for little disagreement.
+
+"cost" learns from history instead. The expected |score1 - score2| per
+(category, difficulty) for this judge model comes from past rejudged
+results. It is shrunk towards the judge-wide mean for sparse cells. An item
+is rejudged when
+
+    expected disagreement × impact >= bar
+
+Impact is the category's evolve weight relative to the mean (weak
+categories steer generation), plus a bonus for first-pass scores within
+NEAR_BAND of the pass threshold. The bar is the (1 - budget) quantile of
+the same value over recent LLM-judged results, so about `budget` of items
+get a second call. A small exploration share is always rejudged, so
+estimates for cells the policy stops sampling keep updating. Judge models
+with too little history fall back to the confidence rule.
+"""
+import random
+from typing import Dict, List, Tuple
+
+from .defaults import REJUDGE_BUDGET as DEFAULT_BUDGET, REJUDGE_POLICIES as POLICIES
+from .evolve import CATEGORIES, category_means, category_weights
+from .taxonomy import root
+
+PASS_THRESHOLD = 0.7
+NEAR_BAND = 0.15
+EXPLORE = 0.05
+PRIOR_WEIGHT = 5.0       # pseudo-count of the shrinkage prior
+PRIOR_DISAGREEMENT = 0.1
+MIN_HISTORY = 30         # rejudged results needed before "cost" takes over
+VALUE_SAMPLE = 2000      # recent LLM-judged results used to place the bar
+
+
+class ConfidencePolicy:
+    name = "confidence"
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+
+    def should_rejudge(self, category: str, difficulty: int, score: float, confidence: float) -> bool:
+        return confidence < self.threshold
+
+
+class CostPolicy:
+    name = "cost"
+
+    def __init__(self, expected: Dict[Tuple[str, int], float], prior: float, leverage: Dict[str, float],
+                 bar: float, explore: float = EXPLORE, rng: random.Random = None):
+        self.expected = expected
+        self.prior = prior
+        self.leverage = leverage
+        self.bar = bar
+        self.explore = explore
+        self.rng = rng or random.Random()
+
+    def value(self, category: str, difficulty: int, score: float) -> float:
+        near = max(0.0, 1.0 - abs(score - PASS_THRESHOLD) / NEAR_BAND)
+        impact = self.leverage.get(root(category), 1.0) * (1.0 + near)
+        return self.expected.get((category, difficulty), self.prior) * impact
+
+    def should_rejudge(self, category: str, difficulty: int, score: float, confidence: float) -> bool:
+        if self.rng.random() < self.explore:
+            return True
+        return self.value(category, difficulty, score) >= self.bar
+
+
+def _quantile(values: List[float], q: float) -> float:
+    xs = sorted(values)
+    return xs[min(len(xs) - 1, max(0, int(q * len(xs))))]
+
+
+def load_policy(con, name: str, judge_model: str, conf_threshold: float = 0.6,
+                budget: float = DEFAULT_BUDGET, explore: float = EXPLORE):
+    """Build the named policy for `judge_model` from the DB history."""
+    if name not in POLICIES:
+        raise RuntimeError(f"Unknown rejudge policy {name!r} (expected one of {POLICIES}).")
+    if name == "confidence":
+        return ConfidencePolicy(conf_threshold)
+
+    cells = con.execute("""
+        SELECT q.category, q.difficulty, COUNT(*) AS n, SUM(r.disagreement) AS dis
+        FROM results r
+        JOIN runs ru ON ru.run_id = r.run_id
+        JOIN questions q ON q.question_id = r.question_id
+        WHERE r.rejudged = 1 AND ru.judge_model = ?
+        GROUP BY q.category, q.difficulty
+    """, (judge_model,)).fetchall()
+    n_total = sum(r["n"] for r in cells)
+    if n_total < MIN_HISTORY:
+        return ConfidencePolicy(conf_threshold)
+
+    prior = sum(r["dis"] or 0.0 for r in cells) / n_total or PRIOR_DISAGREEMENT
+    expected = {(r["category"], int(r["difficulty"])): ((r["dis"] or 0.0) + PRIOR_WEIGHT * prior)
+                / (r["n"] + PRIOR_WEIGHT) for r in cells}
+
+    weights = category_weights(category_means(con), CATEGORIES)
+    leverage = {c: w * len(weights) for c, w in weights.items()}
+
+    policy = CostPolicy(expected, prior, leverage, bar=0.0, explore=explore)
+    recent = con.execute("""
+        SELECT q.category, q.difficulty,
+               COALESCE((r.correctness + r.completeness + r.clarity) / 3.0, r.score) AS first_score
+        FROM results r
+        JOIN runs ru ON ru.run_id = r.run_id
+        JOIN questions q ON q.question_id = r.question_id
+        WHERE r.grader = 'llm' AND ru.judge_model = ?
+        ORDER BY r.rowid DESC
+        LIMIT ?
+    """, (judge_model, VALUE_SAMPLE)).fetchall()
+    # score is the rejudge average; the rubric columns come from the first judgment, like the live decision
+    values = [policy.value(r["category"], int(r["difficulty"]), float(r["first_score"])) for r in recent]
+    above = max(0.0, budget - explore) / (1.0 - explore)   # exploration spends part of the budget
+    policy.bar = _quantile(values, 1.0 - above)
+    return policy
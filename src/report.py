@@ -1,30 +1,46 @@
-from .evolve import category_means, CATEGORIES
+from .analytics import Snapshot, load_snapshot
 
-def report(con) -> str:
-    q_count = con.execute("SELECT COUNT(*) AS n FROM questions").fetchone()["n"]
-    r_count = con.execute("SELECT COUNT(*) AS n FROM results").fetchone()["n"]
-    last_mean = con.execute("SELECT value FROM state WHERE key='last_batch_mean'").fetchone()
-    ema = con.execute("SELECT value FROM state WHERE key='ema_value'").fetchone()
+def report(con, snapshot: Snapshot = None) -> str:
+    snap = snapshot or load_snapshot(con)
+    q_count = snap.n_questions
+    r_count = snap.n_results
+    # state is namespaced per (solve_model, domain): "ema_value@<model>/<domain>"
+    scoped = con.execute("""
+        SELECT key, value FROM state
+        WHERE key IN ('ema_value', 'last_batch_mean')
+           OR key LIKE 'ema_value@%' OR key LIKE 'last_batch_mean@%'
+        ORDER BY key
+    """).fetchall()
+    by_scope = {}
+    for row in scoped:
+        name, _, scope = row["key"].partition("@")
+        by_scope.setdefault(scope or "(global)", {})[name] = float(row["value"])
 
-    means = category_means(con)
+    means = snap.category_means()
+    cis = snap.category_ci()
 
     lines = []
     lines.append(f"Questions: {q_count} | Results: {r_count}")
-    lines.append(f"Last batch mean: {float(last_mean['value']) if last_mean else None}")
-    lines.append(f"EMA: {float(ema['value']) if ema else None}")
+    if not by_scope:
+        lines.append("Last batch mean: None")
+        lines.append("EMA: None")
+    for scope, vals in by_scope.items():
+        prefix = "" if len(by_scope) == 1 else f"[{scope}] "
+        lines.append(f"{prefix}Last batch mean: {vals.get('last_batch_mean')}")
+        lines.append(f"{prefix}EMA: {vals.get('ema_value')}")
     lines.append("")
     lines.append("Category mean scores:")
-    for c in CATEGORIES:
+    for c in snap.roots:
         val = means.get(c, None)
-        lines.append(f"  - {c}: {val if val is not None else 'N/A'}")
+        if val is None:
+            lines.append(f"  - {c}: N/A")
+        elif c in cis:
+            lines.append(f"  - {c}: {val} (95% CI {cis[c][0]:.3f}–{cis[c][1]:.3f})")
+        else:
+            lines.append(f"  - {c}: {val}")
 
     # show 3 worst failures
-    rows = con.execute("""
-        SELECT q.prompt, r.score
-        FROM results r JOIN questions q ON q.question_id=r.question_id
-        ORDER BY r.score ASC
-        LIMIT 3
-    """).fetchall()
+    rows = snap.worst[:3]
     if rows:
         lines.append("")
         lines.append("Worst 3 examples:")
@@ -1,29 +1,23 @@
 import json
 import time
+from . import latency, metrics, tracing
+from .defaults import DIFFICULTY_STEP, EMA_ALPHA
 from .utils import new_id, now_iso
 from .judge import judge_answer
+from .rejudge import DEFAULT_BUDGET, load_policy
+from .graders import grade_locally
+from .store import StoreWriter, get_scoped_state, state_key
 from .openai_safe import chat_create_safe, ModelCaps
 
 SOLVER_SYSTEM = "Answer the user's question as accurately and clearly as possible."
 
-def get_state(con, key: str, default: str) -> str:
-    row = con.execute("SELECT value FROM state WHERE key=?", (key,)).fetchone()
-    return row["value"] if row else default
-
-def set_state(con, key: str, value: str) -> None:
-    con.execute(
-        "INSERT INTO state(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-        (key, value)
-    )
-    con.commit()
-
 def update_ema(prev_ema: float, batch_mean: float, alpha: float) -> float:
     return alpha * batch_mean + (1.0 - alpha) * prev_ema
 
 def _clamp_int(x: int, lo: int, hi: int) -> int:
     return max(lo, min(hi, int(x)))
 
-def adapt_difficulty(prev_diff: int, prev_ema: float, new_ema: float, step: float = 0.02) -> int:
+def adapt_difficulty(prev_diff: int, prev_ema: float, new_ema: float, step: float = DIFFICULTY_STEP) -> int:
     # simple, explainable adaptive testing
     if new_ema > prev_ema + step:
         return _clamp_int(prev_diff + 1, 1, 5)
@@ -46,9 +40,27 @@ def adapt_difficulty(prev_diff: int, prev_ema: float, new_ema: float, step: floa
 #     """, (n,)).fetchall()
 #     return [(r["question_id"], r["prompt"]) for r in rows]
 
-from .evolve import CATEGORIES
+from . import bandit, taxonomy
+from .evolve import CATEGORIES, category_means
+
+def min_coverage(n: int, k: int) -> int:
+    """Default exploration quota per category for a run of n questions."""
+    return max(1, int(0.2 * n / k))
+
+def coverage_quota(n: int, k: int, min_per_category: int) -> int:
+    """Questions per category in the exploration pass (0: cover the n weakest categories once)."""
+    if n < k:
+        return 0
+    if min_per_category * k > n:
+        return max(1, n // k)
+    return min_per_category
 
-def sample_questions_with_coverage(con, n: int, min_per_category: int = 1):
+def coverage_units(con, subtree: str = None):
+    """Categories the sampler covers: CATEGORIES plus discovered roots, or the units of `subtree`."""
+    return taxonomy.units(con, subtree, first=CATEGORIES if subtree is None else ())
+
+def sample_questions_with_coverage(con, n: int, min_per_category: int = 1, domain: str = None,
+                                   allocator: str = "weakness", solve_model: str = None, subtree: str = None):
     """
     Exploration + exploitation sampler with a 'new-first' preference.
 
@@ -61,39 +73,43 @@ def sample_questions_with_coverage(con, n: int, min_per_category: int = 1):
 
     Notes on terminology:
     - "unevaluated" = no rows in results for that question_id (not the same as 'recently generated').
+
+    If `domain` is given, only questions generated for that domain are sampled.
+
+    With allocator "thompson" or "ucb", categories are ordered by their bandit
+    posterior mean for (solve_model, domain), and the exploitation slots are
+    split across (category, difficulty) cells by bandit.allocate.
+
+    A "category" is a top-level category path, or with `subtree` one unit of
+    that subtree (see taxonomy.units); only questions inside the subtree are
+    sampled.
     """
-    k = len(CATEGORIES)
     if n <= 0:
         return []
+    units = coverage_units(con, subtree)
+    k = len(units)
 
-    # Compute category means (lower = weaker). Unseen/N.A. treated as 0.5
-    rows = con.execute("""
-        SELECT q.category, AVG(r.score) AS mean_score
-        FROM questions q
-        LEFT JOIN results r ON r.question_id = q.question_id
-        GROUP BY q.category
-    """).fetchall()
+    if allocator == "weakness":
+        # Compute category means (lower = weaker). Unseen/N.A. treated as 0.5
+        mean = {c: 0.5 for c in units}
+        for c, m in category_means(con, subtree).items():
+            if c in mean:
+                mean[c] = m
 
-    mean = {c: 0.5 for c in CATEGORIES}
-    for r in rows:
-        if r["category"] in mean and r["mean_score"] is not None:
-            mean[r["category"]] = float(r["mean_score"])
-
-    cats_sorted_weak = sorted(CATEGORIES, key=lambda c: mean.get(c, 0.5))
+        cats_sorted_weak = sorted(units, key=lambda c: mean.get(c, 0.5))
+    else:
+        cats_sorted_weak = bandit.category_order(con, solve_model, domain, units)
 
     # Decide per-category quota
-    per_cat = 0
-    if n >= k:
-        per_cat = min_per_category
-        if per_cat * k > n:
-            per_cat = max(1, n // k)
+    per_cat = coverage_quota(n, k, min_per_category)
 
     selected = []
     selected_ids = set()
 
     # Helper query: for a given category, prefer unevaluated -> least evaluated -> newest generated
-    def pick_from_category(cat: str, limit: int):
-        return con.execute("""
+    def pick_from_category(cat: str, limit: int, difficulty: int = None):
+        match, params = taxonomy.unit_sql("q.category", cat, subtree)
+        return con.execute(f"""
             SELECT q.question_id, q.prompt
             FROM questions q
             LEFT JOIN (
@@ -101,16 +117,16 @@ def sample_questions_with_coverage(con, n: int, min_per_category: int = 1):
                 FROM results
                 GROUP BY question_id
             ) rc ON rc.question_id = q.question_id
-            WHERE q.category = ?
+            WHERE {match} AND (? IS NULL OR q.domain = ?) AND (? IS NULL OR q.difficulty = ?)
             ORDER BY
                 CASE WHEN rc.cnt IS NULL THEN 0 ELSE 1 END ASC,  -- unevaluated first
                 COALESCE(rc.cnt, 0) ASC,                         -- then least evaluated
                 q.created_at DESC                                 -- then most recently generated
             LIMIT ?
-        """, (cat, limit)).fetchall()
+        """, (*params, domain, domain, difficulty, difficulty, limit)).fetchall()
 
     # 1) Exploration: pick per_cat from each category (or weakest categories if n < k)
-    cats_to_cover = CATEGORIES if per_cat > 0 else cats_sorted_weak[:min(n, k)]
+    cats_to_cover = units if per_cat > 0 else cats_sorted_weak[:min(n, k)]
 
     for c in cats_to_cover:
         rows = pick_from_category(c, per_cat if per_cat > 0 else 1)
@@ -125,6 +141,27 @@ def sample_questions_with_coverage(con, n: int, min_per_category: int = 1):
     if remaining <= 0:
         return selected
 
+    if allocator != "weakness":
+        # 2b) Bandit exploitation: split the remaining slots over (category, difficulty)
+        # cells; cells that run out of questions drop out and their slots are re-split.
+        post = bandit.posteriors(con, [(c, d) for c in units for d in bandit.DIFFICULTIES],
+                                 solve_model, domain)
+        while len(selected) < n and post:
+            for (c, d), cnt in bandit.allocate(post, n - len(selected), allocator).items():
+                if cnt == 0:
+                    continue
+                got = 0
+                for r in pick_from_category(c, cnt + len(selected), difficulty=d):
+                    if r["question_id"] in selected_ids:
+                        continue
+                    selected.append((r["question_id"], r["prompt"]))
+                    selected_ids.add(r["question_id"])
+                    got += 1
+                    if got >= cnt:
+                        break
+                if got < cnt:
+                    del post[(c, d)]
+
     # 2) Exploitation: fill remaining by weakness (lowest category mean first),
     # but still prefer unevaluated / least-evaluated within those categories.
     # We'll loop categories from weakest to strongest and pull candidates until filled.
@@ -145,7 +182,8 @@ def sample_questions_with_coverage(con, n: int, min_per_category: int = 1):
 
     # If still not enough (e.g., sparse categories), fallback to global unevaluated/least-evaluated
     if len(selected) < n:
-        rows = con.execute("""
+        match, params = taxonomy.subtree_sql("q.category", subtree) if subtree else ("1", ())
+        rows = con.execute(f"""
             SELECT q.question_id, q.prompt
             FROM questions q
             LEFT JOIN (
@@ -153,12 +191,13 @@ def sample_questions_with_coverage(con, n: int, min_per_category: int = 1):
                 FROM results
                 GROUP BY question_id
             ) rc ON rc.question_id = q.question_id
+            WHERE {match} AND (? IS NULL OR q.domain = ?)
             ORDER BY
                 CASE WHEN rc.cnt IS NULL THEN 0 ELSE 1 END ASC,
                 COALESCE(rc.cnt, 0) ASC,
                 q.created_at DESC
             LIMIT ?
-        """, (n * 3,)).fetchall()
+        """, (*params, domain, domain, n * 3)).fetchall()
 
         for r in rows:
             if r["question_id"] in selected_ids:
@@ -180,29 +219,131 @@ def run_benchmark(
     solve_model: str,
     judge_model: str,
     n: int,
-    alpha: float = 0.2,
-    rejudge_conf_threshold: float = 0.6
+    alpha: float = EMA_ALPHA,
+    rejudge_conf_threshold: float = 0.6,
+    local_grading: bool = True,
+    structured_judge: bool = False,
+    domain: str = None,
+    writer: StoreWriter = None,
+    difficulty_step: float = DIFFICULTY_STEP,
+    rejudge_policy: str = "confidence",
+    rejudge_budget: float = DEFAULT_BUDGET,
+    judge_client=None,
+    allocator: str = "weakness",
+    subtree: str = None,
+):
+    """
+    All writes go through a StoreWriter (one is created for this run if none is
+    passed); `con` is only used for reads. EMA/difficulty state is scoped per
+    (solve_model, domain) so concurrent runs on one DB don't interfere.
+
+    rejudge_policy "confidence" rejudges below rejudge_conf_threshold; "cost"
+    spends about rejudge_budget extra calls per LLM-judged item where history
+    says a second opinion matters (see rejudge.py).
+
+    `client` serves solve calls; judge calls use `judge_client` when given
+    (e.g. a separate judge cluster, see client.make_clients).
+
+    `allocator` picks how exploitation slots are spread: "weakness" (lowest
+    category mean first) or a bandit over decayed posteriors (see bandit.py).
+
+    `subtree` restricts the run to one category path and spreads coverage over
+    its subcategories (see taxonomy.py).
+    """
+    own_writer = writer is None
+    if own_writer:
+        writer = StoreWriter(con.execute("PRAGMA database_list").fetchone()["file"])
+    try:
+        return _run_benchmark(
+            client, caps, con, writer,
+            base_url=base_url, solve_model=solve_model, judge_model=judge_model, n=n, alpha=alpha,
+            rejudge_conf_threshold=rejudge_conf_threshold, local_grading=local_grading,
+            structured_judge=structured_judge, domain=domain, difficulty_step=difficulty_step,
+            rejudge_policy=rejudge_policy, rejudge_budget=rejudge_budget, judge_client=judge_client or client,
+            allocator=allocator, subtree=subtree,
+        )
+    finally:
+        if own_writer:
+            writer.close()
+
+
+def _run_benchmark(
+    client,
+    caps: ModelCaps,
+    con,
+    writer: StoreWriter,
+    *,
+    base_url: str,
+    solve_model: str,
+    judge_model: str,
+    n: int,
+    alpha: float,
+    rejudge_conf_threshold: float,
+    local_grading: bool,
+    structured_judge: bool,
+    domain: str,
+    difficulty_step: float,
+    rejudge_policy: str,
+    rejudge_budget: float,
+    judge_client,
+    allocator: str,
+    subtree: str,
 ):
     run_id = new_id()
+    t_start = time.perf_counter()
 
-    prev_ema = float(get_state(con, "ema_value", "0.0"))
-    prev_diff = int(get_state(con, "target_difficulty", "2"))
+    prev_ema = float(get_scoped_state(con, "ema_value", "0.0", solve_model, domain))
+    prev_diff = int(get_scoped_state(con, "target_difficulty", "2", solve_model, domain))
+    k = len(coverage_units(con, subtree))
 
-    con.execute(
-        "INSERT INTO runs(run_id, run_at, base_url, solve_model, judge_model, n_questions) VALUES(?,?,?,?,?,?)",
-        (run_id, now_iso(), base_url, solve_model, judge_model, int(n))
+    writer.execute(
+        "INSERT INTO runs(run_id, run_at, base_url, solve_model, judge_model, n_questions, domain, allocator) "
+        "VALUES(?,?,?,?,?,?,?,?)",
+        (run_id, now_iso(), base_url, solve_model, judge_model, int(n), domain, allocator)
     )
-    con.commit()
 
     # qs = sample_questions_weighted(con, n)
-    k = len(CATEGORIES)
-    min_per_category = max(1, int( 0.2 * n/len(CATEGORIES) ))
-    qs = sample_questions_with_coverage(con, n, min_per_category=min_per_category)
+    min_per_category = min_coverage(n, k)
+    with tracing.span("run.sample", n=n):
+        qs = sample_questions_with_coverage(con, n, min_per_category=min_per_category, domain=domain,
+                                            allocator=allocator, solve_model=solve_model, subtree=subtree)
 
     if not qs:
+        writer.flush()
         raise RuntimeError("No questions in DB. Run `generate` first.")
 
+    policy = load_policy(con, rejudge_policy, judge_model, conf_threshold=rejudge_conf_threshold,
+                         budget=rejudge_budget)
+    meta = {}
+    if policy.name == "cost":
+        marks = ",".join("?" * len(qs))
+        meta = {r["question_id"]: (r["category"], int(r["difficulty"])) for r in con.execute(
+            f"SELECT question_id, category, difficulty FROM questions WHERE question_id IN ({marks})",
+            [qid for qid, _ in qs]
+        ).fetchall()}
+
+    checks = {}
+    if local_grading:
+        marks = ",".join("?" * len(qs))
+        with tracing.span("run.load_checks"):
+            for r in con.execute(
+                f"SELECT question_id, check_json FROM questions WHERE question_id IN ({marks}) AND check_json IS NOT NULL",
+                [qid for qid, _ in qs]
+            ).fetchall():
+                try:
+                    checks[r["question_id"]] = json.loads(r["check_json"])
+                except json.JSONDecodeError:
+                    continue
+
     scores = []
+    n_local = 0
+    n_judge_calls = 0
+    n_judge_failed = 0
+    n_rejudged = 0
+    dis_captured = 0.0
+    repairs = {"none": 0, "local": 0, "llm": 0}
+    sketches = {s: latency.LatencySketch() for s in latency.STAGES}
+    tokens = {s: {"prompt": 0, "cached": 0} for s in metrics.CACHE_STAGES}
 
     for qid, q in qs:
         # Solve
@@ -213,20 +354,44 @@ def run_benchmark(
             messages=[{"role": "system", "content": SOLVER_SYSTEM},
                       {"role": "user", "content": q}],
             temperature=1.0,
+            stage="solve",
+            tokens=tokens["solve"],
         )
         answer = resp.choices[0].message.content.strip()
         latency_ms = int((time.time() - t0) * 1000)
+        sketches["solve"].record(latency_ms)
+
+        # Deterministic fast-path: machine-checkable items skip the LLM judge entirely
+        with tracing.span("run.local_grade"):
+            local = grade_locally(checks.get(qid), answer)
+        if local is not None:
+            n_local += 1
+            metrics.JUDGMENTS.inc(grader="local", rejudged="false")
+            local["rejudged"] = False
+            local["disagreement"] = 0.0
+            scores.append(float(local["score"]))
+            writer.insert_result(
+                result_id=new_id(), run_id=run_id, question_id=qid, answer=answer, judgment=local,
+                score=local["score"], confidence=1.0, latency_ms=latency_ms, created_at=now_iso()
+            )
+            continue
 
         # Judge (with uncertainty proxy)
         try:
-            j1 = judge_answer(client, caps, model=judge_model, question=q, answer=answer)
-        except Exception as e:
-            j1 = {
-                "score": 0.0, "pass": False,
-                "reasons": [f"Judge failed: {type(e).__name__}"],
-                "rubric_breakdown": {"correctness": 0.0, "completeness": 0.0, "clarity": 0.0},
-                "confidence": 0.0,
-            }
+            n_judge_calls += 1
+            t1 = time.perf_counter()
+            with tracing.span("run.judge"):
+                j1 = judge_answer(judge_client, caps, model=judge_model, question=q, answer=answer,
+                                  structured=structured_judge, tokens=tokens["judge"])
+            sketches["judge"].record((time.perf_counter() - t1) * 1000)
+            j1["grader"] = "llm"
+            repairs[j1["repair"]] += 1
+        except Exception:
+            # An unparseable judgment is not a zero score: leave it out of the batch
+            # mean (and the EMA) instead of recording a fake failure.
+            n_judge_failed += 1
+            metrics.JUDGE_FAILED.inc()
+            continue
 
         score = float(j1.get("score", 0.0))
         conf = float(j1.get("confidence", 0.0))
@@ -234,11 +399,19 @@ def run_benchmark(
         # Rejudge if low confidence (self-consistency)
         j2 = None
         disagreement = 0.0
-        if conf < rejudge_conf_threshold:
+        category, difficulty = meta.get(qid, (None, None))
+        if policy.should_rejudge(category, difficulty, score, conf):
             try:
-                j2 = judge_answer(client, caps, model=judge_model, question=q, answer=answer)
+                n_judge_calls += 1
+                t1 = time.perf_counter()
+                with tracing.span("run.rejudge"):
+                    j2 = judge_answer(judge_client, caps, model=judge_model, question=q, answer=answer,
+                                      structured=structured_judge, stage="rejudge", tokens=tokens["judge"])
+                sketches["judge"].record((time.perf_counter() - t1) * 1000)
+                repairs[j2["repair"]] += 1
                 score2 = float(j2.get("score", score))
                 disagreement = abs(score - score2)
+                dis_captured += disagreement
                 score = 0.5 * (score + score2)  # average
                 conf = max(conf, float(j2.get("confidence", conf)))
             except Exception:
@@ -246,36 +419,69 @@ def run_benchmark(
 
         j_out = dict(j1)
         j_out["rejudged"] = bool(j2 is not None)
+        n_rejudged += j2 is not None
+        metrics.JUDGMENTS.inc(grader="llm", rejudged="true" if j2 is not None else "false")
         j_out["disagreement"] = float(disagreement)
         if j2 is not None:
             j_out["judge2"] = j2
 
         scores.append(score)
 
-        con.execute(
-            """
-            INSERT INTO results(result_id, run_id, question_id, answer, judge_json, score, confidence, latency_ms, created_at)
-            VALUES(?,?,?,?,?,?,?,?,?)
-            """,
-            (new_id(), run_id, qid, answer, json.dumps(j_out), float(score), float(conf), latency_ms, now_iso())
+        writer.insert_result(
+            result_id=new_id(), run_id=run_id, question_id=qid, answer=answer, judgment=j_out,
+            score=score, confidence=conf, latency_ms=latency_ms, created_at=now_iso()
         )
-        con.commit()
 
-    batch_mean = sum(scores) / max(1, len(scores))
+    writer.execute(
+        "UPDATE runs SET n_local_graded=?, n_judge_calls=?, n_local_repairs=?, n_llm_repairs=?, n_judge_failed=?, "
+        "n_rejudged=?, rejudge_policy=? WHERE run_id=?",
+        (n_local, n_judge_calls, repairs["local"], repairs["llm"], n_judge_failed, n_rejudged, policy.name, run_id)
+    )
+    pcts = {s: sketches[s].percentiles() for s in latency.STAGES}
+    cols = ", ".join(f"{c}=?" for s in latency.STAGES for c in latency.COLUMNS[s])
+    writer.execute(f"UPDATE runs SET {cols} WHERE run_id=?",
+                   [v for s in latency.STAGES for v in pcts[s]] + [run_id])
+    cols = ", ".join(f"{c}=?" for s in metrics.CACHE_STAGES for c in metrics.CACHE_COLUMNS[s])
+    writer.execute(f"UPDATE runs SET {cols} WHERE run_id=?",
+                   [tokens[s][k] for s in metrics.CACHE_STAGES for k in ("prompt", "cached")] + [run_id])
+
+    if not scores:
+        writer.flush()
+        raise RuntimeError(f"Run {run_id}: no item could be scored ({n_judge_failed} judge failures); EMA left unchanged.")
+
+    batch_mean = sum(scores) / len(scores)
     ema = update_ema(prev_ema, batch_mean, alpha)
 
     # adaptive difficulty update
-    new_diff = adapt_difficulty(prev_diff, prev_ema, ema)
+    new_diff = adapt_difficulty(prev_diff, prev_ema, ema, step=difficulty_step)
 
-    set_state(con, "ema_value", str(ema))
-    set_state(con, "ema_alpha", str(alpha))
-    set_state(con, "ema_last_run_id", run_id)
-    set_state(con, "last_batch_mean", str(batch_mean))
-    set_state(con, "target_difficulty", str(new_diff))
+    def _state(key: str) -> str:
+        return state_key(key, solve_model, domain)
 
-    # persist run-level summaries (columns added via migration)
-    con.execute("UPDATE runs SET batch_mean=?, ema_after=?, target_difficulty=? WHERE run_id=?",
-                (float(batch_mean), float(ema), int(new_diff), run_id))
-    con.commit()
+    writer.set_state(_state("ema_value"), str(ema))
+    writer.set_state(_state("ema_alpha"), str(alpha))
+    writer.set_state(_state("ema_last_run_id"), run_id)
+    writer.set_state(_state("last_batch_mean"), str(batch_mean))
+    writer.set_state(_state("target_difficulty"), str(new_diff))
 
-    return {"run_id": run_id, "batch_mean": batch_mean, "ema": ema, "n": len(scores), "target_difficulty": new_diff}
+    # persist run-level summaries (columns added via migration)
+    writer.execute("UPDATE runs SET batch_mean=?, ema_after=?, target_difficulty=? WHERE run_id=?",
+                   (float(batch_mean), float(ema), int(new_diff), run_id))
+    writer.flush()
+
+    scope = {"solve_model": solve_model, "domain": domain or "*"}
+    n_llm = len(scores) - n_local
+    metrics.REJUDGE_RATIO.set(n_rejudged / n_llm if n_llm else 0.0, **scope)
+    metrics.REJUDGE_YIELD.set(dis_captured / n_rejudged if n_rejudged else 0.0, **scope)
+    metrics.EMA.set(ema, **scope)
+    metrics.BATCH_MEAN.set(batch_mean, **scope)
+    metrics.QUESTIONS_PER_SEC.set(len(scores) / max(1e-9, time.perf_counter() - t_start), **scope)
+    for stage, values in pcts.items():
+        for q, v in zip(latency.QUANTILES, values):
+            if v is not None:
+                metrics.RUN_LATENCY_MS.set(v, stage=stage, quantile=str(q), **scope)
+
+    return {"run_id": run_id, "batch_mean": batch_mean, "ema": ema, "n": len(scores), "target_difficulty": new_diff,
+            "n_local": n_local, "n_judge_calls": n_judge_calls, "n_llm_repairs": repairs["llm"],
+            "n_judge_failed": n_judge_failed, "rejudge_policy": policy.name, "n_rejudged": n_rejudged,
+            "rejudge_yield": dis_captured / n_rejudged if n_rejudged else None}
@@ -0,0 +1,215 @@
+# src/simulate.py
+"""
+Offline simulator of the adaptive loop, for tuning alpha, the difficulty step
+and the category-weight floor without calling an endpoint.
+
+The solver and judge are replaced by a synthetic ability model. Each
+trajectory has a per-category ability on the logit scale, and an item of
+difficulty d scores
+
+    clip(sigmoid(ability[c] - slope * (d - 3)) + judge noise, 0, 1)
+
+Each iteration mirrors `iterate`:
+  - generate: n_gen fresh questions, split by category_weights, with
+    difficulties drawn the way GEN_USER_TEMPLATE asks (at least 60% at or
+    above the target)
+  - run: the coverage sampler (coverage_quota, then weakest category first).
+    It prefers fresh questions; when a category has none left, it serves
+    older questions of any difficulty.
+  - update_ema and adapt_difficulty
+
+All trajectories advance together as NumPy arrays. update_ema, min_coverage
+and coverage_quota are called directly. category_weights and
+adapt_difficulty have array mirrors, which check_parity() tests against the
+originals before every simulation.
+"""
+from itertools import product
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .evolve import CATEGORIES, WEIGHT_FLOOR, category_weights
+from .run import DIFFICULTY_STEP, adapt_difficulty, coverage_quota, min_coverage, update_ema
+
+GEN_AT_TARGET = 0.6   # share of generated questions at or above the target difficulty
+START_EMA = 0.0       # run.py defaults for a fresh (solve_model, domain) scope
+START_DIFFICULTY = 2
+
+
+def _weights(means: np.ndarray, floor: float) -> np.ndarray:
+    """category_weights over rows of category means."""
+    w = np.maximum(floor, 1.0 - means)
+    return w / w.sum(axis=1, keepdims=True)
+
+
+def _adapt(diff: np.ndarray, prev_ema: np.ndarray, new_ema: np.ndarray, step: float) -> np.ndarray:
+    """adapt_difficulty over arrays."""
+    up = new_ema > prev_ema + step
+    down = ~up & (new_ema < prev_ema - step)
+    return np.clip(diff + up.astype(np.int64) - down.astype(np.int64), 1, 5)
+
+
+def check_parity(floor: float, step: float, n: int = 200, seed: int = 0) -> None:
+    """Fail loudly if the array mirrors drift from evolve.py / run.py."""
+    rng = np.random.default_rng(seed)
+    means = rng.random((n, len(CATEGORIES)))
+    w = _weights(means, floor)
+    diff = rng.integers(1, 6, n)
+    prev, new = rng.random(n), rng.random(n)
+    new[: n // 4] = prev[: n // 4] + rng.choice([-step, step], n // 4)  # exact ties on the step boundary
+    adapted = _adapt(diff, prev, new, step)
+    for i in range(n):
+        ref = category_weights(dict(zip(CATEGORIES, means[i])), CATEGORIES, floor=floor)
+        if not np.allclose(w[i], [ref[c] for c in CATEGORIES]):
+            raise RuntimeError("simulate._weights no longer matches evolve.category_weights")
+        if adapted[i] != adapt_difficulty(int(diff[i]), float(prev[i]), float(new[i]), step=step):
+            raise RuntimeError("simulate._adapt no longer matches run.adapt_difficulty")
+
+
+def _sample_categories(means: np.ndarray, n: int) -> np.ndarray:
+    """(T, n) category index per sampled question, following sample_questions_with_coverage."""
+    t, k = means.shape
+    per_cat = coverage_quota(n, k, min_coverage(n, k))
+    order = np.argsort(means, axis=1, kind="stable")   # weakest first, ties in CATEGORIES order
+    if per_cat == 0:
+        return order[:, :n]
+    base = np.repeat(np.arange(k), per_cat)
+    fill = np.repeat(order[:, :1], n - len(base), axis=1)
+    return np.concatenate([np.broadcast_to(base, (t, len(base))), fill], axis=1)
+
+
+def simulate(
+    *,
+    alpha: float,
+    step: float = DIFFICULTY_STEP,
+    floor: float = WEIGHT_FLOOR,
+    trajectories: int = 2000,
+    iterations: int = 60,
+    n_gen: int = 10,
+    n_run: int = 10,
+    ability_mean: float = 0.5,
+    ability_sd: float = 1.0,
+    category_sd: float = 0.7,
+    slope: float = 0.8,
+    judge_sd: float = 0.15,
+    regression: float = 0.5,
+    regression_at: int = None,
+    window: int = 5,
+    detect_drop: float = 0.05,
+    tolerance: float = 0.03,
+    seed: int = 0,
+) -> Dict[str, float]:
+    """
+    Simulate `trajectories` regressed and `trajectories` control loops. At
+    `regression_at` (default 2/3 of the way through), the regressed half loses
+    `regression` logits of ability. Returns:
+      - convergence: iterations until the control EMA first comes within
+        `tolerance` of its steady-state (last-quarter) mean
+      - steady state: EMA sd and difficulty changes over the last quarter
+      - detection: an alarm fires when the EMA falls `detect_drop` below its
+        mean over the `window` iterations before the regression. Reported as
+        the hit rate, the false-alarm rate on controls, and the questions
+        spent until the alarm.
+    """
+    check_parity(floor, step)
+    rng = np.random.default_rng(seed)
+    k = len(CATEGORIES)
+    t = 2 * trajectories
+    reg_at = regression_at if regression_at is not None else (2 * iterations) // 3
+    if not window <= reg_at < iterations:
+        raise RuntimeError(f"regression_at must be in [{window}, {iterations}) (got {reg_at}).")
+
+    ability = rng.normal(ability_mean, ability_sd, (t, 1)) + rng.normal(0.0, category_sd, (t, k))
+    treated = np.arange(t) < trajectories
+    ema = np.full(t, START_EMA)
+    diff = np.full(t, START_DIFFICULTY)
+    cat_sum = np.zeros((t, k))
+    cat_n = np.zeros((t, k))
+    fresh = np.zeros((t, k), dtype=np.int64)          # unevaluated questions per category
+    emas = np.empty((t, iterations))
+    diffs = np.empty((t, iterations), dtype=np.int64)
+    rows = np.arange(t)[:, None]
+
+    for it in range(iterations):
+        if it == reg_at:
+            ability[treated] -= regression
+        means = np.where(cat_n > 0, cat_sum / np.maximum(cat_n, 1), 0.5)
+
+        # generate
+        fresh += rng.multinomial(n_gen, _weights(means, floor))
+
+        # run: sampled categories; the first fresh[c] picks of category c are fresh questions
+        cats = _sample_categories(means, n_run)
+        onehot = cats[:, :, None] == np.arange(k)
+        rank = (np.cumsum(onehot, axis=1)[onehot].reshape(t, n_run)) - 1
+        is_fresh = rank < fresh[rows, cats]
+        fresh -= np.minimum(onehot.sum(axis=1), fresh)
+
+        lo = np.where(rng.random((t, n_run)) < GEN_AT_TARGET, diff[:, None], 1)
+        fresh_d = lo + np.floor(rng.random((t, n_run)) * (6 - lo)).astype(np.int64)
+        stale_d = rng.integers(1, 6, (t, n_run))
+        d = np.where(is_fresh, fresh_d, stale_d)
+
+        p = 1.0 / (1.0 + np.exp(-(ability[rows, cats] - slope * (d - 3))))
+        scores = np.clip(p + rng.normal(0.0, judge_sd, (t, n_run)), 0.0, 1.0)
+
+        flat = (rows * k + cats).ravel()
+        cat_sum += np.bincount(flat, weights=scores.ravel(), minlength=t * k).reshape(t, k)
+        cat_n += np.bincount(flat, minlength=t * k).reshape(t, k)
+
+        new_ema = update_ema(ema, scores.mean(axis=1), alpha)
+        diff = _adapt(diff, ema, new_ema, step)
+        ema = new_ema
+        emas[:, it], diffs[:, it] = ema, diff
+
+    # convergence and steady state (controls)
+    ctrl = emas[~treated]
+    tail = max(1, iterations // 4)
+    tail_mean = ctrl[:, -tail:].mean(axis=1, keepdims=True)
+    inside = np.abs(ctrl - tail_mean) <= tolerance
+    settle = np.where(inside.any(axis=1), np.argmax(inside, axis=1) + 1, iterations)
+    diff_changes = (np.diff(diffs[~treated][:, -tail - 1:], axis=1) != 0).sum(axis=1) * 10.0 / tail
+
+    # regression detection
+    baseline = emas[:, reg_at - window:reg_at].mean(axis=1, keepdims=True)
+    alarm = emas[:, reg_at:] < baseline - detect_drop
+    fired = alarm.any(axis=1)
+    first = np.argmax(alarm, axis=1)
+    hit = fired[treated]
+    spent = (first[treated][hit] + 1) * n_run
+
+    return {
+        "alpha": alpha, "step": step, "floor": floor,
+        "converge_median": float(np.median(settle)),
+        "converge_p90": float(np.percentile(settle, 90)),
+        "tail_ema_sd": float(ctrl[:, -tail:].std(axis=1).mean()),
+        "diff_changes_per_10": float(diff_changes.mean()),
+        "detect_rate": float(hit.mean()),
+        "false_alarm_rate": float(fired[~treated].mean()),
+        "detect_questions_median": float(np.median(spent)) if len(spent) else None,
+        "detect_questions_p90": float(np.percentile(spent, 90)) if len(spent) else None,
+    }
+
+
+def sweep(alphas: Sequence[float], steps: Sequence[float], floors: Sequence[float], **kwargs) -> List[Dict]:
+    """simulate() over the grid; every configuration gets the same seed (common random numbers)."""
+    return [simulate(alpha=a, step=s, floor=f, **kwargs) for a, s, f in product(alphas, steps, floors)]
+
+
+def format_results(results: List[Dict], n_run: int) -> str:
+    def q(v):
+        return "-" if v is None else f"{v:.0f}"
+    lines = [
+        "alpha  step   floor | converge it (med/p90) | tail EMA sd | diff chg/10it | "
+        "detect  false-alarm | questions to detect (med/p90)"
+    ]
+    for r in results:
+        lines.append(
+            f"{r['alpha']:<6g} {r['step']:<6g} {r['floor']:<5g} | "
+            f"{r['converge_median']:>6.0f} / {r['converge_p90']:<6.0f}       | "
+            f"{r['tail_ema_sd']:>11.4f} | {r['diff_changes_per_10']:>13.2f} | "
+            f"{r['detect_rate']:>6.1%}  {r['false_alarm_rate']:>11.1%} | "
+            f"{q(r['detect_questions_median'])} / {q(r['detect_questions_p90'])}"
+        )
+    lines.append(f"(convergence in iterations of {n_run} questions; controls only)")
+    return "\n".join(lines)
@@ -1,5 +1,14 @@
+import json
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from . import bandit, failures, latency, metrics, taxonomy, tracing
+from .blobs import BLOBS_SQL, get_blob, put_blob
 
 SCHEMA_SQL = """
 PRAGMA foreign_keys = ON;
@@ -27,8 +36,8 @@ CREATE TABLE IF NOT EXISTS results (
   result_id TEXT PRIMARY KEY,
   run_id TEXT NOT NULL,
   question_id TEXT NOT NULL,
-  answer TEXT NOT NULL,
-  judge_json TEXT NOT NULL,
+  answer_hash TEXT,
+  judge_hash TEXT,
   score REAL NOT NULL,
   confidence REAL,
   latency_ms INTEGER,
@@ -43,23 +52,578 @@ CREATE TABLE IF NOT EXISTS state (
 );
 """
 
-def connect(db_path: str) -> sqlite3.Connection:
+BUSY_TIMEOUT_S = 30.0
+
+# Rollups: count/sum/sum-of-squares of score per cell, maintained by triggers in
+# the same transaction as each result insert. Readers of category/difficulty
+# aggregates use these instead of scanning results ⋈ questions.
+ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS rollup_run (
+  category TEXT NOT NULL,
+  difficulty INTEGER NOT NULL,
+  run_id TEXT NOT NULL,
+  solve_model TEXT NOT NULL,
+  n INTEGER NOT NULL,
+  sum REAL NOT NULL,
+  sumsq REAL NOT NULL,
+  dis_sum REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (category, difficulty, run_id)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_total (
+  category TEXT NOT NULL,
+  difficulty INTEGER NOT NULL,
+  solve_model TEXT NOT NULL,
+  n INTEGER NOT NULL,
+  sum REAL NOT NULL,
+  sumsq REAL NOT NULL,
+  dis_sum REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (category, difficulty, solve_model)
+);
+"""
+
+# Body of trg_results_rollup. init_db creates it IF NOT EXISTS; it is only ever
+# replaced inside the migration transaction that also rebuilds the rollups.
+ROLLUP_TRIGGER_SQL = """
+AFTER INSERT ON results
+BEGIN
+  INSERT INTO rollup_run(category, difficulty, run_id, solve_model, n, sum, sumsq, dis_sum)
+  SELECT q.category, q.difficulty, NEW.run_id, ru.solve_model,
+         1, NEW.score, NEW.score * NEW.score, COALESCE(NEW.disagreement, 0.0)
+  FROM questions q, runs ru
+  WHERE q.question_id = NEW.question_id AND ru.run_id = NEW.run_id
+  ON CONFLICT(category, difficulty, run_id) DO UPDATE SET
+    n = n + 1, sum = sum + excluded.sum, sumsq = sumsq + excluded.sumsq, dis_sum = dis_sum + excluded.dis_sum;
+
+  INSERT INTO rollup_total(category, difficulty, solve_model, n, sum, sumsq, dis_sum)
+  SELECT q.category, q.difficulty, ru.solve_model,
+         1, NEW.score, NEW.score * NEW.score, COALESCE(NEW.disagreement, 0.0)
+  FROM questions q, runs ru
+  WHERE q.question_id = NEW.question_id AND ru.run_id = NEW.run_id
+  ON CONFLICT(category, difficulty, solve_model) DO UPDATE SET
+    n = n + 1, sum = sum + excluded.sum, sumsq = sumsq + excluded.sumsq, dis_sum = dis_sum + excluded.dis_sum;
+END;
+"""
+
+
+# Frozen regression suites and their replays (see suites.py). Replays live
+# apart from runs/results so they never feed rollups, the EMA or the failure index.
+SUITES_SQL = """
+CREATE TABLE IF NOT EXISTS suites (
+  suite_id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  version INTEGER NOT NULL,
+  created_at TEXT NOT NULL,
+  source TEXT NOT NULL,
+  n_items INTEGER NOT NULL,
+  UNIQUE (name, version)
+);
+
+CREATE TABLE IF NOT EXISTS suite_items (
+  suite_id TEXT NOT NULL,
+  position INTEGER NOT NULL,
+  question_id TEXT NOT NULL,
+  baseline_score REAL,
+  PRIMARY KEY (suite_id, position),
+  FOREIGN KEY(suite_id) REFERENCES suites(suite_id) ON DELETE CASCADE,
+  FOREIGN KEY(question_id) REFERENCES questions(question_id)
+);
+
+CREATE TABLE IF NOT EXISTS replays (
+  replay_id TEXT PRIMARY KEY,
+  suite_id TEXT NOT NULL,
+  replay_at TEXT NOT NULL,
+  base_url TEXT NOT NULL,
+  solve_model TEXT NOT NULL,
+  judge_model TEXT NOT NULL,
+  n_items INTEGER NOT NULL,
+  n_scored INTEGER,
+  mean_score REAL,
+  pass_rate REAL,
+  wall_s REAL,
+  FOREIGN KEY(suite_id) REFERENCES suites(suite_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_replays_suite ON replays(suite_id, replay_at);
+
+CREATE TABLE IF NOT EXISTS replay_results (
+  replay_id TEXT NOT NULL,
+  question_id TEXT NOT NULL,
+  score REAL,
+  passed INTEGER,
+  grader TEXT,
+  reason TEXT,
+  latency_ms INTEGER,
+  answer_hash TEXT,
+  error TEXT,
+  PRIMARY KEY (replay_id, question_id),
+  FOREIGN KEY(replay_id) REFERENCES replays(replay_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+
+# One write transaction, so no result lands between the wipe and the backfill.
+REBUILD_ROLLUPS_SQL = """
+        DELETE FROM rollup_run;
+        DELETE FROM rollup_total;
+
+        INSERT INTO rollup_run(category, difficulty, run_id, solve_model, n, sum, sumsq, dis_sum)
+        SELECT q.category, q.difficulty, r.run_id, ru.solve_model,
+               COUNT(*), SUM(r.score), SUM(r.score * r.score), SUM(COALESCE(r.disagreement, 0.0))
+        FROM results r
+        JOIN questions q ON q.question_id = r.question_id
+        JOIN runs ru ON ru.run_id = r.run_id
+        GROUP BY q.category, q.difficulty, r.run_id;
+
+        INSERT INTO rollup_total(category, difficulty, solve_model, n, sum, sumsq, dis_sum)
+        SELECT category, difficulty, solve_model, SUM(n), SUM(sum), SUM(sumsq), SUM(dis_sum)
+        FROM rollup_run
+        GROUP BY category, difficulty, solve_model;
+"""
+
+def _script(con: sqlite3.Connection, script: str) -> None:
+    """executescript() without its implicit COMMIT, so it can run inside the migration transaction."""
+    stmt = ""
+    for part in script.split(";"):
+        stmt += part + ";"
+        if sqlite3.complete_statement(stmt):
+            if stmt.strip(" \t\n;"):
+                con.execute(stmt)
+            stmt = ""
+
+def rebuild_rollups(con: sqlite3.Connection) -> None:
+    """Recompute rollups from scratch (backfill for DBs that predate them; caller commits)."""
+    _script(con, REBUILD_ROLLUPS_SQL)
+
+def connect(db_path: str, isolation_level: Optional[str] = "") -> sqlite3.Connection:
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(db_path)
+    con = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_S, isolation_level=isolation_level,
+                          check_same_thread=False)
     con.row_factory = sqlite3.Row
+    # WAL: readers get snapshots and never block the (single) writer.
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA foreign_keys=ON")
     return con
 
-def _add_column_if_missing(con: sqlite3.Connection, table: str, column: str, coltype: str) -> None:
-    cols = {r["name"] for r in con.execute(f"PRAGMA table_info({table})").fetchall()}
-    if column not in cols:
+def _columns(con: sqlite3.Connection, table: str) -> set:
+    return {r["name"] for r in con.execute(f"PRAGMA table_info({table})").fetchall()}
+
+# Run state that predates per-(solve_model, domain) scoping was stored under the bare key.
+SCOPED_STATE_KEYS = ("ema_value", "ema_alpha", "ema_last_run_id", "last_batch_mean", "target_difficulty")
+
+def _migrate_global_state(con: sqlite3.Connection) -> None:
+    """
+    Move legacy global run state into the scope of the run that wrote it last
+    (ema_last_run_id), then delete it, so new scopes start fresh.
+    """
+    last = con.execute("SELECT value FROM state WHERE key='ema_last_run_id'").fetchone()
+    if last is None:
+        return
+    run = con.execute("SELECT solve_model, domain FROM runs WHERE run_id=?", (last["value"],)).fetchone()
+    model, domain = (run["solve_model"], run["domain"]) if run else (None, None)
+    for key in SCOPED_STATE_KEYS:
+        row = con.execute("SELECT value FROM state WHERE key=?", (key,)).fetchone()
+        if row is None:
+            continue
+        scoped = f"{key}@{model or '*'}/{domain or '*'}"   # state_key, also for an unknown run
+        con.execute("INSERT INTO state(key,value) VALUES(?,?) ON CONFLICT(key) DO NOTHING",
+                    (scoped, row["value"]))
+        con.execute("DELETE FROM state WHERE key=?", (key,))
+
+def _add_column_if_missing(con: sqlite3.Connection, table: str, column: str, coltype: str) -> bool:
+    if column not in _columns(con, table):
         con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {coltype}")
-        con.commit()
+        return True
+    return False
+
+# Judgment fields promoted out of results.judge_json so analytics never parse JSON.
+JUDGMENT_COLUMNS = [
+    ("correctness", "REAL"),
+    ("completeness", "REAL"),
+    ("clarity", "REAL"),
+    ("passed", "INTEGER"),
+    ("rejudged", "INTEGER"),
+    ("disagreement", "REAL"),
+    ("reason", "TEXT"),
+    ("grader", "TEXT"),
+]
+
+def _backfill_judgment_columns(con: sqlite3.Connection) -> None:
+    if "judge_json" not in _columns(con, "results"):
+        return  # fresh DB: nothing inline to backfill from
+    con.execute("""
+        UPDATE results SET
+          correctness  = json_extract(judge_json, '$.rubric_breakdown.correctness'),
+          completeness = json_extract(judge_json, '$.rubric_breakdown.completeness'),
+          clarity      = json_extract(judge_json, '$.rubric_breakdown.clarity'),
+          passed       = COALESCE(json_extract(judge_json, '$.pass'), score >= 0.7),
+          rejudged     = COALESCE(json_extract(judge_json, '$.rejudged'), 0),
+          disagreement = ABS(COALESCE(json_extract(judge_json, '$.disagreement'), 0.0)),
+          reason       = json_extract(judge_json, '$.reasons[0]'),
+          grader       = COALESCE(json_extract(judge_json, '$.grader'), 'llm')
+        WHERE json_valid(judge_json)
+    """)
+
+def judgment_columns(j: dict) -> dict:
+    rb = j.get("rubric_breakdown") or {}
+    reasons = j.get("reasons") or []
+    return {
+        "correctness": rb.get("correctness"),
+        "completeness": rb.get("completeness"),
+        "clarity": rb.get("clarity"),
+        "passed": int(bool(j.get("pass", False))),
+        "rejudged": int(bool(j.get("rejudged", False))),
+        "disagreement": abs(float(j.get("disagreement", 0.0))),
+        "reason": str(reasons[0]) if isinstance(reasons, list) and reasons else None,
+        "grader": j.get("grader", "llm"),
+    }
+
+def insert_result(
+    con: sqlite3.Connection,
+    *,
+    result_id: str,
+    run_id: str,
+    question_id: str,
+    answer: str,
+    judgment: dict,
+    score: float,
+    confidence: Optional[float],
+    latency_ms: Optional[int],
+    created_at: str,
+) -> None:
+    """
+    Insert one result row with its normalized judgment columns (caller commits).
+    The answer and raw judge JSON go to the compressed blob table; the results
+    row itself only carries scoring columns and the two blob hashes.
+    """
+    row = {
+        "result_id": result_id,
+        "run_id": run_id,
+        "question_id": question_id,
+        "answer_hash": put_blob(con, answer),
+        "judge_hash": put_blob(con, json.dumps(judgment)),
+        "score": float(score),
+        "confidence": None if confidence is None else float(confidence),
+        "latency_ms": latency_ms,
+        "created_at": created_at,
+        **judgment_columns(judgment),
+    }
+    if "answer" in _columns(con, "results"):
+        # not yet compacted: legacy inline columns are NOT NULL
+        row["answer"] = ""
+        row["judge_json"] = ""
+    cols = ", ".join(row)
+    marks = ", ".join(f":{k}" for k in row)
+    con.execute(f"INSERT INTO results({cols}) VALUES({marks})", row)
+    failures.record_failure(con, question_id=question_id, reasons=judgment.get("reasons") or [],
+                            score=row["score"], created_at=created_at)
+    bandit.record_result(con, run_id=run_id, question_id=question_id, score=row["score"], created_at=created_at)
+
+# Bump whenever _migrate gains a step: DBs at this version skip migration entirely.
+SCHEMA_VERSION = 1
+
+def _schema_version(con: sqlite3.Connection) -> int:
+    try:
+        row = con.execute("SELECT value FROM state WHERE key='schema_version'").fetchone()
+    except sqlite3.OperationalError:   # fresh DB: no state table yet
+        return 0
+    return int(row["value"]) if row else 0
 
 def init_db(con: sqlite3.Connection) -> None:
-    con.executescript(SCHEMA_SQL)
+    """
+    Create or upgrade the schema. The whole migration runs in one BEGIN IMMEDIATE
+    transaction and re-checks the version under the lock, so bench processes
+    that open the same DB at once wait for the first one instead of racing its
+    ALTERs and backfills.
+    """
+    if _schema_version(con) >= SCHEMA_VERSION:
+        return
     con.commit()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        if _schema_version(con) < SCHEMA_VERSION:
+            _migrate(con)
+            con.execute("INSERT INTO state(key,value) VALUES('schema_version',?) "
+                        "ON CONFLICT(key) DO UPDATE SET value=excluded.value", (str(SCHEMA_VERSION),))
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+
+def _migrate(con: sqlite3.Connection) -> None:
+    """Every step checks what is already there, so it is safe on any older DB (no commits: init_db does)."""
+    _script(con, SCHEMA_SQL)
 
     # Migration-style additions (safe on existing DBs)
     _add_column_if_missing(con, "runs", "batch_mean", "REAL")
     _add_column_if_missing(con, "runs", "ema_after", "REAL")
     _add_column_if_missing(con, "runs", "target_difficulty", "INTEGER")
+    _add_column_if_missing(con, "runs", "n_local_graded", "INTEGER")
+    _add_column_if_missing(con, "questions", "check_json", "TEXT")
+    _add_column_if_missing(con, "runs", "n_judge_calls", "INTEGER")
+    _add_column_if_missing(con, "runs", "n_local_repairs", "INTEGER")
+    _add_column_if_missing(con, "runs", "n_llm_repairs", "INTEGER")
+    _add_column_if_missing(con, "runs", "n_judge_failed", "INTEGER")
+    _add_column_if_missing(con, "runs", "domain", "TEXT")
+    _migrate_global_state(con)
+    _add_column_if_missing(con, "results", "answer_hash", "TEXT")
+    _add_column_if_missing(con, "results", "judge_hash", "TEXT")
+    _script(con, BLOBS_SQL)
+
+    added = [_add_column_if_missing(con, "runs", c, "REAL") for s in latency.STAGES for c in latency.COLUMNS[s]]
+    if any(added):
+        latency.backfill_solve_percentiles(con)
+
+    added = [_add_column_if_missing(con, "results", c, t) for c, t in JUDGMENT_COLUMNS]
+    if any(added):
+        _backfill_judgment_columns(con)
+
+    had_rollups = "rollup_total" in {
+        r["name"] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+    }
+    stale = False
+    if had_rollups:
+        stale = _add_column_if_missing(con, "rollup_run", "dis_sum", "REAL NOT NULL DEFAULT 0")
+        _add_column_if_missing(con, "rollup_total", "dis_sum", "REAL NOT NULL DEFAULT 0")
+    _script(con, ROLLUP_SQL)
+    if stale:
+        # the trigger predates dis_sum; this runs under the migration lock, so no
+        # writer sees the DB without a trigger
+        con.execute("DROP TRIGGER IF EXISTS trg_results_rollup")
+    _script(con, "CREATE TRIGGER IF NOT EXISTS trg_results_rollup " + ROLLUP_TRIGGER_SQL)
+    if stale or not had_rollups:
+        rebuild_rollups(con)
+
+    _script(con, """
+        CREATE INDEX IF NOT EXISTS idx_results_run ON results(run_id);
+        CREATE INDEX IF NOT EXISTS idx_results_question ON results(question_id);
+        CREATE INDEX IF NOT EXISTS idx_results_score ON results(score);
+        CREATE INDEX IF NOT EXISTS idx_questions_category ON questions(category, difficulty);
+        CREATE INDEX IF NOT EXISTS idx_results_rejudged ON results(run_id) WHERE rejudged = 1;
+    """)
+
+    had_failures = "failure_clusters" in {
+        r["name"] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+    }
+    _script(con, failures.FAILURES_SQL)
+    if not had_failures:
+        failures.rebuild(con)
+
+    _script(con, SUITES_SQL)
+
+    had_taxonomy = "taxonomy" in {
+        r["name"] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+    }
+    _script(con, taxonomy.TAXONOMY_SQL)
+    if not had_taxonomy:
+        taxonomy.rebuild(con)
+
+    for stage in metrics.CACHE_STAGES:
+        for c in metrics.CACHE_COLUMNS[stage]:
+            _add_column_if_missing(con, "runs", c, "INTEGER")
+
+    _add_column_if_missing(con, "runs", "allocator", "TEXT")
+    if con.execute("SELECT 1 FROM state WHERE key=?", (bandit.BUILT_KEY,)).fetchone() is None:
+        bandit.rebuild(con)
+
+    _add_column_if_missing(con, "runs", "rejudge_policy", "TEXT")
+    if _add_column_if_missing(con, "runs", "n_rejudged", "INTEGER"):
+        con.execute("""
+            UPDATE runs SET n_rejudged = (SELECT COUNT(*) FROM results r WHERE r.run_id = runs.run_id AND r.rejudged = 1)
+            WHERE n_judge_calls IS NOT NULL
+        """)
+
+
+def load_result_payload(con: sqlite3.Connection, result_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch the cold payload (answer + full judgment) for one result."""
+    cols = _columns(con, "results")
+    inline = ", answer, judge_json" if "answer" in cols else ""
+    row = con.execute(
+        f"SELECT answer_hash, judge_hash{inline} FROM results WHERE result_id=?", (result_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    answer = get_blob(con, row["answer_hash"])
+    judge = get_blob(con, row["judge_hash"])
+    if answer is None and inline:
+        answer, judge = row["answer"], row["judge_json"]
+    return {"answer": answer, "judgment": json.loads(judge) if judge else None}
+
+def _file_bytes(db_path: str) -> int:
+    return sum(Path(p).stat().st_size for p in (db_path, db_path + "-wal") if Path(p).exists())
+
+def compact(con: sqlite3.Connection, db_path: str, chunk: int = 5000) -> Dict[str, int]:
+    """
+    Move inline answer/judge_json into the blob table, drop the inline columns,
+    garbage-collect orphan blobs and VACUUM. Safe to re-run.
+    """
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        raise RuntimeError(f"compact needs SQLite >= 3.35 (DROP COLUMN); found {sqlite3.sqlite_version}.")
+
+    before = _file_bytes(db_path)
+    moved = 0
+
+    if "answer" in _columns(con, "results"):
+        while True:
+            rows = con.execute("""
+                SELECT rowid, answer, judge_json FROM results
+                WHERE answer_hash IS NULL
+                LIMIT ?
+            """, (chunk,)).fetchall()
+            if not rows:
+                break
+            for r in rows:
+                con.execute("UPDATE results SET answer_hash=?, judge_hash=? WHERE rowid=?",
+                            (put_blob(con, r["answer"]), put_blob(con, r["judge_json"]), r["rowid"]))
+            con.commit()
+            moved += len(rows)
+
+        con.execute("ALTER TABLE results DROP COLUMN answer")
+        con.execute("ALTER TABLE results DROP COLUMN judge_json")
+        con.commit()
+
+    orphans = con.execute("""
+        DELETE FROM blobs
+        WHERE hash NOT IN (SELECT answer_hash FROM results WHERE answer_hash IS NOT NULL)
+          AND hash NOT IN (SELECT judge_hash FROM results WHERE judge_hash IS NOT NULL)
+          AND hash NOT IN (SELECT answer_hash FROM replay_results WHERE answer_hash IS NOT NULL)
+    """).rowcount
+    con.commit()
+
+    con.execute("VACUUM")
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    after = _file_bytes(db_path)
+
+    n_blobs = con.execute("SELECT COUNT(*) AS n FROM blobs").fetchone()["n"]
+    return {"bytes_before": before, "bytes_after": after, "bytes_saved": before - after,
+            "results_migrated": moved, "blobs": n_blobs, "orphans_removed": orphans}
+
+
+# -----------------------------
+# Namespaced state
+# -----------------------------
+def state_key(key: str, solve_model: Optional[str] = None, domain: Optional[str] = None) -> str:
+    """
+    State such as ema_value/target_difficulty is scoped per (solve_model, domain)
+    so concurrent runs against one DB don't overwrite each other.
+    """
+    if solve_model is None and domain is None:
+        return key
+    return f"{key}@{solve_model or '*'}/{domain or '*'}"
+
+def get_scoped_state(con: sqlite3.Connection, key: str, default: str,
+                     solve_model: Optional[str] = None, domain: Optional[str] = None) -> str:
+    # Legacy global keys were moved into their run's scope by init_db (_migrate_global_state).
+    row = con.execute("SELECT value FROM state WHERE key=?", (state_key(key, solve_model, domain),)).fetchone()
+    return row["value"] if row else default
+
+def _set_state(con: sqlite3.Connection, key: str, value: str) -> None:
+    con.execute(
+        "INSERT INTO state(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+        (key, value)
+    )
+
+
+# -----------------------------
+# Single-writer service
+# -----------------------------
+class StoreWriter:
+    """
+    Owns the only write connection of this process. Callers enqueue writes from any
+    thread; the writer thread applies whatever is queued in one IMMEDIATE transaction,
+    so lock hold times stay short and other processes' writers wait on busy_timeout
+    instead of failing with "database is locked". Readers keep their own WAL connections.
+    """
+
+    def __init__(self, db_path: str, max_batch: int = 256):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self._q: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._errors: List[BaseException] = []
+        self._thread = threading.Thread(target=self._loop, name="store-writer", daemon=True)
+        self._thread.start()
+
+    # ---- public API ----
+    def submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        fut: Future = Future()
+        self._q.put((fn, fut))
+        return fut
+
+    def execute(self, sql: str, params=()) -> Future:
+        return self.submit(lambda con: con.execute(sql, params).rowcount)
+
+    def insert_result(self, **kwargs) -> Future:
+        return self.submit(lambda con: insert_result(con, **kwargs))
+
+    def set_state(self, key: str, value: str) -> Future:
+        return self.submit(lambda con: _set_state(con, key, value))
+
+    def flush(self) -> None:
+        """Block until everything queued so far is committed; re-raise the first failed write."""
+        with tracing.span("store.flush"):
+            self.submit(lambda con: None).result()
+        if self._errors:
+            err = self._errors[0]
+            self._errors.clear()
+            raise err
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def __enter__(self) -> "StoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    # ---- writer thread ----
+    def _loop(self) -> None:
+        con = connect(self.db_path, isolation_level=None)
+        try:
+            while True:
+                item = self._q.get()
+                if item is None:
+                    return
+                batch = [item]
+                stop = False
+                while len(batch) < self.max_batch:
+                    try:
+                        nxt = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is None:
+                        stop = True
+                        break
+                    batch.append(nxt)
+                t0 = time.perf_counter()
+                with tracing.span("store.commit", n=len(batch)):
+                    self._apply(con, batch)
+                metrics.DB_WRITE_SECONDS.observe(time.perf_counter() - t0)
+                if stop:
+                    return
+        finally:
+            con.close()
+
+    def _apply(self, con: sqlite3.Connection, batch: List[tuple]) -> None:
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            out = [fn(con) for fn, _ in batch]
+            con.execute("COMMIT")
+        except Exception as e:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            if len(batch) > 1:
+                # isolate the failing write so the rest of the batch still lands
+                for item in batch:
+                    self._apply(con, [item])
+                return
+            self._errors.append(e)
+            metrics.DB_WRITES.inc(outcome="error")
+            batch[0][1].set_exception(e)
+            return
+        metrics.DB_WRITES.inc(len(batch), outcome="ok")
+        for (_, fut), res in zip(batch, out):
+            fut.set_result(res)
@@ -0,0 +1,364 @@
+# src/suites.py
+"""
+Named, versioned regression suites and a parallel replay runner.
+
+`freeze_suite` snapshots a list of questions under a name. It takes the
+worst-k by historical minimum score, or the question_ids in a
+`export-regression` JSONL. Freezing the same name again adds version N+1;
+older versions are kept, so replays stay comparable.
+
+`replay_suite` solves and grades every item concurrently. It uses a local
+check where one exists, otherwise a single LLM judgment with no rejudge.
+Results go to replays / replay_results, never to runs / results / state.
+A replay therefore never moves the EMA, the target difficulty, the rollups
+or the failure index.
+
+`diff_replays` compares a replay with an earlier one of the same suite
+(the previous one by default). It classifies items that changed pass/fail,
+using each item's pass history over all earlier replays to separate
+regressions (always passed before) from flaky items.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import tracing
+from .blobs import put_blob
+from .graders import grade_locally
+from .judge import judge_answer
+from .latency import LatencySketch
+from .openai_safe import ModelCaps, chat_create_safe
+from .rejudge import PASS_THRESHOLD
+from .run import SOLVER_SYSTEM
+from .store import StoreWriter
+from .taxonomy import normalize, subtree_sql
+from .utils import new_id, now_iso
+
+DEFAULT_WORKERS = 32
+SCORE_DROP = 0.2   # per-item score drop reported even without a pass/fail flip
+
+
+def parse_suite_ref(ref: str) -> Tuple[str, Optional[int]]:
+    """"name" or "name@vN" -> (name, N or None for the latest version)."""
+    name, _, version = ref.partition("@")
+    if not version:
+        return name, None
+    try:
+        return name, int(version.lstrip("v"))
+    except ValueError:
+        raise RuntimeError(f"Bad suite reference {ref!r} (expected NAME or NAME@vN).")
+
+
+def get_suite(con, ref: str):
+    name, version = parse_suite_ref(ref)
+    row = con.execute("""
+        SELECT * FROM suites WHERE name = ? AND (? IS NULL OR version = ?)
+        ORDER BY version DESC LIMIT 1
+    """, (name, version, version)).fetchone()
+    if row is None:
+        raise RuntimeError(f"No suite {ref!r}. Create it with `freeze-suite --name {name}`.")
+    return row
+
+
+def _worst_k(con, k: int, domain: str = None, category: str = None) -> List[Tuple[str, float]]:
+    # a category path matches its whole subtree (see taxonomy.py)
+    match, params = subtree_sql("q.category", category) if category else ("1", ())
+    rows = con.execute(f"""
+        SELECT q.question_id, MIN(r.score) AS worst_score
+        FROM questions q
+        JOIN results r ON r.question_id = q.question_id
+        WHERE (? IS NULL OR q.domain = ?) AND {match}
+        GROUP BY q.question_id
+        ORDER BY worst_score ASC, q.question_id
+        LIMIT ?
+    """, (domain, domain, *params, k)).fetchall()
+    return [(r["question_id"], float(r["worst_score"])) for r in rows]
+
+
+def _from_jsonl(con, path: str) -> List[Tuple[str, Optional[float]]]:
+    items, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            qid = d.get("question_id")
+            if qid and qid not in seen:
+                seen.add(qid)
+                items.append((qid, d.get("worst_score")))
+    known = set()
+    for i in range(0, len(items), 500):
+        chunk = [qid for qid, _ in items[i:i + 500]]
+        known.update(r[0] for r in con.execute(
+            f"SELECT question_id FROM questions WHERE question_id IN ({','.join('?' * len(chunk))})", chunk))
+    missing = len(items) - len(known)
+    if missing:
+        raise RuntimeError(f"{missing} question_id(s) in {path} are not in this DB.")
+    return items
+
+
+def freeze_suite(con, name: str, *, k: int = 200, domain: str = None, category: str = None,
+                 from_jsonl: str = None) -> Dict:
+    """Store a new version of suite `name` and return {suite_id, name, version, n_items}."""
+    if "@" in name:
+        raise RuntimeError("Suite names cannot contain '@' (it separates the version).")
+    if from_jsonl:
+        items, source = _from_jsonl(con, from_jsonl), f"jsonl:{Path(from_jsonl).name}"
+    else:
+        category = normalize(category) or None
+        items = _worst_k(con, k, domain=domain, category=category)
+        source = f"worst-k:k={k},domain={domain or '*'},category={category or '*'}"
+    if not items:
+        raise RuntimeError("Nothing to freeze: no scored questions match.")
+
+    version = con.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM suites WHERE name = ?", (name,)).fetchone()[0]
+    suite_id = new_id()
+    con.execute("INSERT INTO suites(suite_id, name, version, created_at, source, n_items) VALUES(?,?,?,?,?,?)",
+                (suite_id, name, version, now_iso(), source, len(items)))
+    con.executemany("INSERT INTO suite_items(suite_id, position, question_id, baseline_score) VALUES(?,?,?,?)",
+                    [(suite_id, i, qid, score) for i, (qid, score) in enumerate(items)])
+    con.commit()
+    return {"suite_id": suite_id, "name": name, "version": version, "n_items": len(items)}
+
+
+def list_suites(con) -> List[Dict]:
+    rows = con.execute("""
+        SELECT s.name, s.version, s.n_items, s.created_at, s.source,
+               COUNT(rp.replay_id) AS n_replays,
+               (SELECT mean_score FROM replays WHERE suite_id = s.suite_id
+                ORDER BY replay_at DESC LIMIT 1) AS last_mean
+        FROM suites s
+        LEFT JOIN replays rp ON rp.suite_id = s.suite_id
+        GROUP BY s.suite_id
+        ORDER BY s.name, s.version
+    """).fetchall()
+    return [dict(r) for r in rows]
+
+
+def _replay_one(client, judge_client, caps: ModelCaps, item, *, solve_model: str, judge_model: str,
+                structured_judge: bool) -> Dict:
+    qid, prompt, check = item
+    out = {"question_id": qid, "score": None, "grader": None, "reason": None, "latency_ms": None,
+           "answer": None, "error": None}
+    t0 = time.perf_counter()
+    try:
+        resp = chat_create_safe(
+            client, caps,
+            model=solve_model,
+            messages=[{"role": "system", "content": SOLVER_SYSTEM},
+                      {"role": "user", "content": prompt}],
+            temperature=1.0,
+            stage="replay",
+        )
+        out["answer"] = (resp.choices[0].message.content or "").strip()
+    except Exception as e:
+        out["error"] = f"solve: {type(e).__name__}"
+        return out
+    out["latency_ms"] = int((time.perf_counter() - t0) * 1000)
+
+    j = grade_locally(check, out["answer"])
+    if j is not None:
+        out["grader"] = j.get("grader", "local")
+    else:
+        try:
+            j = judge_answer(judge_client, caps, model=judge_model, question=prompt, answer=out["answer"],
+                             structured=structured_judge)
+            out["grader"] = "llm"
+        except Exception as e:
+            out["error"] = f"judge: {type(e).__name__}"
+            return out
+    out["score"] = float(j.get("score", 0.0))
+    reasons = j.get("reasons")
+    out["reason"] = str(reasons[0]) if isinstance(reasons, list) and reasons else None
+    return out
+
+
+def _write_item(replay_id: str, out: Dict):
+    def fn(con):
+        score = out["score"]
+        con.execute("""
+            INSERT INTO replay_results(replay_id, question_id, score, passed, grader, reason, latency_ms,
+                                       answer_hash, error)
+            VALUES(?,?,?,?,?,?,?,?,?)
+        """, (replay_id, out["question_id"], score, None if score is None else int(score >= PASS_THRESHOLD),
+              out["grader"], out["reason"], out["latency_ms"],
+              put_blob(con, out["answer"]) if out["answer"] is not None else None, out["error"]))
+    return fn
+
+
+def replay_suite(client, caps: ModelCaps, con, *, suite: str, base_url: str, solve_model: str,
+                 judge_model: str, workers: int = DEFAULT_WORKERS, judge_client=None,
+                 structured_judge: bool = False, local_grading: bool = True,
+                 writer: StoreWriter = None, on_progress=None) -> Dict:
+    """
+    Replay every item of `suite` ("name" or "name@vN") with `workers` items in
+    flight. `con` is only read; writes go through a StoreWriter (one is
+    created if none is passed). Returns the replay summary.
+    """
+    s = get_suite(con, suite)
+    rows = con.execute("""
+        SELECT q.question_id, q.prompt, q.check_json
+        FROM suite_items si
+        JOIN questions q ON q.question_id = si.question_id
+        WHERE si.suite_id = ?
+        ORDER BY si.position
+    """, (s["suite_id"],)).fetchall()
+    items = [(r["question_id"], r["prompt"],
+              json.loads(r["check_json"]) if local_grading and r["check_json"] else None) for r in rows]
+
+    own_writer = writer is None
+    if own_writer:
+        writer = StoreWriter(con.execute("PRAGMA database_list").fetchone()["file"])
+    replay_id = new_id()
+    judge_client = judge_client or client
+    sketch = LatencySketch()
+    scores: List[float] = []
+    n_errors = 0
+    t_start = time.perf_counter()
+    try:
+        writer.execute(
+            "INSERT INTO replays(replay_id, suite_id, replay_at, base_url, solve_model, judge_model, n_items) "
+            "VALUES(?,?,?,?,?,?,?)",
+            (replay_id, s["suite_id"], now_iso(), base_url, solve_model, judge_model, len(items)))
+
+        def work(item):
+            return _replay_one(client, judge_client, caps, item, solve_model=solve_model, judge_model=judge_model,
+                               structured_judge=structured_judge)
+
+        with tracing.span("replay.suite", n=len(items), workers=workers):
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as pool:
+                for done, out in enumerate(pool.map(work, items), 1):
+                    writer.submit(_write_item(replay_id, out))
+                    if out["latency_ms"] is not None:
+                        sketch.record(out["latency_ms"])
+                    if out["score"] is None:
+                        n_errors += 1
+                    else:
+                        scores.append(out["score"])
+                    if on_progress:
+                        on_progress(done, len(items))
+
+        wall = time.perf_counter() - t_start
+        mean = sum(scores) / len(scores) if scores else None
+        pass_rate = sum(sc >= PASS_THRESHOLD for sc in scores) / len(scores) if scores else None
+        writer.execute("UPDATE replays SET n_scored=?, mean_score=?, pass_rate=?, wall_s=? WHERE replay_id=?",
+                       (len(scores), mean, pass_rate, wall, replay_id))
+        writer.flush()
+    finally:
+        if own_writer:
+            writer.close()
+
+    p50, p90, p99 = sketch.percentiles()
+    return {"replay_id": replay_id, "suite": f"{s['name']}@v{s['version']}", "n_items": len(items),
+            "n_scored": len(scores), "n_errors": n_errors, "mean_score": mean, "pass_rate": pass_rate,
+            "wall_s": wall, "items_per_s": len(items) / wall if wall > 0 else 0.0,
+            "latency_p50_ms": p50, "latency_p90_ms": p90, "latency_p99_ms": p99}
+
+
+def _previous_replay(con, replay) -> Optional[str]:
+    row = con.execute("""
+        SELECT replay_id FROM replays
+        WHERE suite_id = ? AND replay_at < ? AND n_scored IS NOT NULL
+        ORDER BY replay_at DESC LIMIT 1
+    """, (replay["suite_id"], replay["replay_at"])).fetchone()
+    return row["replay_id"] if row else None
+
+
+def diff_replays(con, replay_id: str, against: str = None) -> Dict:
+    """
+    Per-item comparison of `replay_id` with `against` (default: the previous
+    completed replay of the same suite). Returns None for `against` when the
+    suite has no earlier replay.
+    """
+    cur = con.execute("SELECT * FROM replays WHERE replay_id = ?", (replay_id,)).fetchone()
+    if cur is None:
+        raise RuntimeError(f"No replay {replay_id!r}.")
+    against = against or _previous_replay(con, cur)
+    if against is None:
+        return {"replay_id": replay_id, "against": None, "items": []}
+    prev = con.execute("SELECT * FROM replays WHERE replay_id = ?", (against,)).fetchone()
+    if prev is None or prev["suite_id"] != cur["suite_id"]:
+        raise RuntimeError(f"Replay {against!r} is not a replay of the same suite.")
+
+    # pass history per item over every replay of the suite up to and including `against`
+    history = {r["question_id"]: (r["n"], r["n_pass"] or 0) for r in con.execute("""
+        SELECT rr.question_id, COUNT(rr.passed) AS n, SUM(rr.passed) AS n_pass
+        FROM replay_results rr
+        JOIN replays rp ON rp.replay_id = rr.replay_id
+        WHERE rp.suite_id = ? AND rp.replay_at <= ?
+        GROUP BY rr.question_id
+    """, (cur["suite_id"], prev["replay_at"]))}
+
+    items = []
+    for r in con.execute("""
+        SELECT c.question_id, q.category, p.score AS prev_score, c.score AS score,
+               p.passed AS prev_passed, c.passed AS passed, c.reason, c.error
+        FROM replay_results c
+        JOIN replay_results p ON p.replay_id = ? AND p.question_id = c.question_id
+        JOIN questions q ON q.question_id = c.question_id
+        WHERE c.replay_id = ?
+    """, (against, replay_id)):
+        n, n_pass = history.get(r["question_id"], (0, 0))
+        if r["score"] is None or r["prev_score"] is None:
+            change = "unscored"
+        elif r["prev_passed"] and not r["passed"]:
+            change = "regression" if n_pass == n else "flaky_fail"
+        elif r["passed"] and not r["prev_passed"]:
+            change = "fixed"
+        elif r["score"] - r["prev_score"] <= -SCORE_DROP:
+            change = "score_drop"
+        else:
+            change = "same"
+        items.append({**dict(r), "change": change, "history_n": n, "history_pass": n_pass})
+
+    both = [it for it in items if it["score"] is not None and it["prev_score"] is not None]
+    delta = sum(it["score"] - it["prev_score"] for it in both) / len(both) if both else None
+    counts = {}
+    for it in items:
+        counts[it["change"]] = counts.get(it["change"], 0) + 1
+    return {"replay_id": replay_id, "against": against, "mean_delta": delta, "counts": counts, "items": items}
+
+
+def format_replay(out: Dict, diff: Dict, show: int = 20) -> str:
+    def f(v, spec=".3f"):
+        return "-" if v is None else format(v, spec)
+    lines = [
+        f"Replay {out['replay_id']} of {out['suite']}: mean={f(out['mean_score'])} pass={f(out['pass_rate'], '.1%')} "
+        f"| scored {out['n_scored']}/{out['n_items']} ({out['n_errors']} errors) "
+        f"| {out['wall_s']:.1f}s, {out['items_per_s']:.1f} items/s "
+        f"| solve p50/p90/p99={f(out['latency_p50_ms'], '.0f')}/{f(out['latency_p90_ms'], '.0f')}/"
+        f"{f(out['latency_p99_ms'], '.0f')} ms"
+    ]
+    if diff["against"] is None:
+        lines.append("No earlier replay of this suite to compare against.")
+        return "\n".join(lines)
+    c = diff["counts"]
+    lines.append(
+        f"vs {diff['against']}: mean delta={f(diff['mean_delta'], '+.3f')} | regressions={c.get('regression', 0)} "
+        f"flaky={c.get('flaky_fail', 0)} fixed={c.get('fixed', 0)} score drops={c.get('score_drop', 0)} "
+        f"unscored={c.get('unscored', 0)}"
+    )
+    order = {"regression": 0, "flaky_fail": 1, "score_drop": 2, "fixed": 3}
+    changed = sorted((it for it in diff["items"] if it["change"] in order),
+                     key=lambda it: (order[it["change"]], it["score"] - it["prev_score"]))
+    for it in changed[:show]:
+        lines.append(
+            f"  {it['change']:<10} {it['question_id'][:8]} ({it['category']}) {it['prev_score']:.2f} -> "
+            f"{it['score']:.2f} | passed {it['history_pass']}/{it['history_n']} before"
+            + (f" | {it['reason'][:80]}" if it["reason"] and it["change"] != "fixed" else "")
+        )
+    if len(changed) > show:
+        lines.append(f"  ... {len(changed) - show} more (see --out)")
+    return "\n".join(lines)
+
+
+def write_diff(diff: Dict, path: str) -> str:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with open(p, "w", encoding="utf-8") as f:
+        for it in diff["items"]:
+            f.write(json.dumps({"replay_id": diff["replay_id"], "against": diff["against"], **it},
+                               ensure_ascii=False) + "\n")
+    return str(p)
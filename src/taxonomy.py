@@ -0,0 +1,164 @@
+# src/taxonomy.py
+"""
+Hierarchical category paths.
+
+questions.category holds a "/"-separated path: "math", "math/algebra",
+"math/algebra/linear_systems". The top segment is usually one of
+evolve.CATEGORIES, but the generator may add subcategories (and new roots).
+The `taxonomy` table has one row per node with its parent, its depth and the
+number of questions in its subtree. register() upserts a path and its
+ancestors when a question is inserted, at O(depth) cost.
+
+Subtree queries never scan the bank. A node's descendants form the contiguous
+key range [path + "/", path + "0"), because "0" is the character after "/".
+subtree_sql() therefore turns into a range seek on idx_questions_category and
+on the rollup primary keys. Aggregates at any depth are folded from rollup
+rows, which number O(categories × difficulties × models), not O(results).
+
+A subtree's coverage units are its children, plus the node itself when
+questions are labelled with exactly that path. The root level's units are
+its top-level categories.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from .utils import now_iso
+
+SEP = "/"
+
+TAXONOMY_SQL = """
+CREATE TABLE IF NOT EXISTS taxonomy (
+  path TEXT PRIMARY KEY,
+  parent TEXT,                            -- NULL for top-level categories
+  depth INTEGER NOT NULL,                 -- 1 for top-level categories
+  n_questions INTEGER NOT NULL DEFAULT 0, -- questions in the subtree
+  created_at TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_taxonomy_parent ON taxonomy(parent, path);
+"""
+
+_SPLIT = re.compile(r"\s*(?:/|>|::|\.)\s*")
+_BAD = re.compile(r"[^a-z0-9_+-]+")
+
+
+def normalize(label: str) -> str:
+    """'Math > Linear Algebra' -> 'math/linear_algebra'; '' when nothing usable is left."""
+    parts = (_BAD.sub("_", p).strip("_") for p in _SPLIT.split(str(label or "").strip().lower()))
+    return SEP.join(p for p in parts if p)
+
+
+def ancestors(path: str) -> List[str]:
+    """The path's ancestors from the root, ending with the path itself."""
+    parts = path.split(SEP)
+    return [SEP.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def root(path: str) -> str:
+    return path.split(SEP, 1)[0]
+
+
+def within(path: str, node: Optional[str]) -> bool:
+    return node is None or path == node or path.startswith(node + SEP)
+
+
+def child_of(path: str, node: Optional[str] = None) -> Optional[str]:
+    """The unit of `node` that `path` falls in: a child of node, node itself, or None outside the subtree."""
+    if node is None:
+        return root(path)
+    if path == node:
+        return node
+    if not path.startswith(node + SEP):
+        return None
+    return node + SEP + path[len(node) + 1:].split(SEP, 1)[0]
+
+
+def subtree_sql(column: str, node: str) -> Tuple[str, Tuple[str, str, str]]:
+    """(WHERE fragment, params) matching `node` and its descendants as an index range."""
+    return f"({column} = ? OR ({column} >= ? AND {column} < ?))", (node, node + SEP, node + "0")
+
+
+def unit_sql(column: str, unit: str, node: Optional[str]) -> Tuple[str, tuple]:
+    """WHERE fragment for one coverage unit of `node` (see units)."""
+    if unit == node:
+        return f"{column} = ?", (unit,)
+    return subtree_sql(column, unit)
+
+
+def register(con, path: str, n: int = 1) -> None:
+    """Add n questions at `path`, creating missing ancestors (caller commits)."""
+    ts = now_iso()
+    parent = None
+    for depth, p in enumerate(ancestors(path), start=1):
+        con.execute("""
+            INSERT INTO taxonomy(path, parent, depth, n_questions, created_at) VALUES(?,?,?,?,?)
+            ON CONFLICT(path) DO UPDATE SET n_questions = n_questions + excluded.n_questions
+        """, (p, parent, depth, n, ts))
+        parent = p
+
+
+def rebuild(con) -> int:
+    """
+    Recompute the table from questions.category (covered by idx_questions_category).
+    Returns the node count; the caller commits.
+    """
+    con.execute("DELETE FROM taxonomy")
+    for category, n in con.execute("SELECT category, COUNT(*) FROM questions GROUP BY category").fetchall():
+        if category:
+            register(con, category, n)
+    return con.execute("SELECT COUNT(*) FROM taxonomy").fetchone()[0]
+
+
+def children(con, node: Optional[str] = None) -> List[str]:
+    return [r[0] for r in con.execute("SELECT path FROM taxonomy WHERE parent IS ? ORDER BY path", (node,))]
+
+
+def units(con, node: Optional[str] = None, first: List[str] = ()) -> List[str]:
+    """
+    Coverage units of `node`: its children, plus node itself when questions
+    sit directly on it (or has no children yet). At the root, `first` (e.g.
+    CATEGORIES) is listed ahead of discovered roots and is always included.
+    """
+    if node is None:
+        found = children(con)
+        return list(first) + [c for c in found if c not in first]
+    row = con.execute("SELECT n_questions FROM taxonomy WHERE path=?", (node,)).fetchone()
+    if row is None:
+        return [node]   # not generated yet: the generator can still target it
+    kids = con.execute("SELECT path, n_questions FROM taxonomy WHERE parent = ? ORDER BY path", (node,)).fetchall()
+    own = row[0] - sum(k[1] for k in kids)
+    return ([node] if own > 0 or not kids else []) + [k[0] for k in kids]
+
+
+def rollup_stats(con, node: Optional[str] = None) -> Dict[str, Tuple[float, int]]:
+    """(mean score, n) per unit of `node`, folded from rollup_total."""
+    where, params = subtree_sql("category", node) if node else ("1", ())
+    acc: Dict[str, List[float]] = {}
+    for category, n, total in con.execute(f"""
+        SELECT category, SUM(n), SUM(sum) FROM rollup_total WHERE {where} GROUP BY category
+    """, params).fetchall():
+        a = acc.setdefault(child_of(category, node), [0, 0.0])
+        a[0] += n
+        a[1] += total
+    return {u: (s / n, int(n)) for u, (n, s) in acc.items() if n}
+
+
+def tree(con, node: Optional[str] = None) -> List[Dict]:
+    """Every node of the subtree (depth-first) with its question count and rollup stats."""
+    stats: Dict[str, List[float]] = {}
+    where, params = subtree_sql("category", node) if node else ("1", ())
+    for category, n, total in con.execute(f"""
+        SELECT category, SUM(n), SUM(sum) FROM rollup_total WHERE {where} GROUP BY category
+    """, params).fetchall():
+        for p in ancestors(category):
+            a = stats.setdefault(p, [0, 0.0])
+            a[0] += n
+            a[1] += total
+    where, params = subtree_sql("path", node) if node else ("1", ())
+    out = []
+    rows = con.execute(f"SELECT path, depth, n_questions FROM taxonomy WHERE {where}", params).fetchall()
+    for path, depth, n_questions in sorted(rows, key=lambda r: r[0].split(SEP)):
+        n, s = stats.get(path, (0, 0.0))
+        out.append({"path": path, "depth": depth, "n_questions": n_questions,
+                    "n_results": int(n), "mean": s / n if n else None})
+    return out
@@ -0,0 +1,138 @@
+# src/tracing.py
+"""
+Lightweight span tracing for the generate / run pipeline.
+
+    with tracing.span("run.sample", n=n):
+        ...
+
+When no tracer is active, span() returns a shared no-op context manager, so
+instrumented code pays one global lookup per span. An active Tracer records
+complete ("ph": "X") events in the Chrome trace-event format. Perfetto,
+chrome://tracing and OpenTelemetry trace converters can load the files.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class Tracer:
+    def __init__(self):
+        self._t0 = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._events: List[dict] = []
+        self._threads: Dict[int, str] = {}
+
+    def _now_us(self) -> float:
+        return (time.perf_counter_ns() - self._t0) / 1000.0
+
+    def add(self, name: str, start_us: float, dur_us: float, args: dict) -> None:
+        t = threading.current_thread()
+        ev = {"name": name, "cat": name.split(".", 1)[0], "ph": "X", "ts": start_us, "dur": dur_us,
+              "pid": os.getpid(), "tid": t.ident}
+        if args:
+            ev["args"] = args
+        with self._lock:
+            self._events.append(ev)
+            self._threads.setdefault(t.ident, t.name)
+
+    @property
+    def events(self) -> List[dict]:
+        with self._lock:
+            return list(self._events)
+
+    def to_json(self) -> dict:
+        with self._lock:
+            meta = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                    for tid, name in self._threads.items()]
+            return {"traceEvents": meta + list(self._events), "displayTimeUnit": "ms"}
+
+    def write(self, path: str) -> str:
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(json.dumps(self.to_json()), encoding="utf-8")
+        return str(p)
+
+    def summary(self) -> List[dict]:
+        """Per span name: count and total/mean ms, sorted by total time (spans may nest)."""
+        agg: Dict[str, dict] = {}
+        for ev in self.events:
+            a = agg.setdefault(ev["name"], {"name": ev["name"], "count": 0, "total_ms": 0.0})
+            a["count"] += 1
+            a["total_ms"] += ev["dur"] / 1000.0
+        for a in agg.values():
+            a["mean_ms"] = a["total_ms"] / a["count"]
+        return sorted(agg.values(), key=lambda a: -a["total_ms"])
+
+    def summary_text(self) -> str:
+        wall_ms = self._now_us() / 1000.0
+        lines = [f"Trace summary (wall {wall_ms:.0f} ms; nested spans overlap):"]
+        for a in self.summary():
+            lines.append(
+                f"  {a['name']:<24} n={a['count']:<5} total={a['total_ms']:>9.1f} ms "
+                f"mean={a['mean_ms']:>8.1f} ms  ({a['total_ms'] / max(wall_ms, 1e-9):.0%})"
+            )
+        return "\n".join(lines)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer: Tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.start = self.tracer._now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add(self.name, self.start, self.tracer._now_us() - self.start, self.args)
+
+    def set(self, **args) -> None:
+        self.args.update(args)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def set(self, **args) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+_active: Optional[Tracer] = None
+
+
+def span(name: str, **args):
+    tracer = _active
+    if tracer is None:
+        return _NOOP
+    return _Span(tracer, name, args)
+
+
+def start() -> Tracer:
+    global _active
+    _active = Tracer()
+    return _active
+
+
+def stop() -> Optional[Tracer]:
+    global _active
+    tracer, _active = _active, None
+    return tracer
+
+
+def active() -> Optional[Tracer]:
+    return _active